@@ -0,0 +1,330 @@
+"""
+专辑模型：list.txt 中每一行（BV 号或视频链接）都是一个来源，各来源的分P并发解析（外呼仍经统一限流），
+按 list.txt 的顺序合并为一个剧集列表。剧集 ID 形如 BV1xx_p3，与来源在列表中的位置无关，始终稳定；
+解析结果按文件夹缓存为清单，list.txt 变化（或清单过期）时重新解析。
+各文件夹 list.txt 的解析结果常驻内存（ListFileIndex），键为 (路径, mtime_ns, 大小)，由文件系统监视器刷新，
+请求路径上不读文件。
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from cache import LRUCache
+from singleflight import SingleFlight
+
+LIST_FILE = "list.txt"
+# 完整清单的有效期（秒）：来源新增分P后最迟在此时间后可见
+ALBUM_MANIFEST_TTL = float(os.getenv("ALBUM_MANIFEST_TTL", "3600"))
+# 部分来源解析失败时清单的有效期（秒），到期后重试失败的来源
+ALBUM_PARTIAL_TTL = float(os.getenv("ALBUM_PARTIAL_TTL", "30"))
+
+EPISODE_ID_PATTERN = re.compile(r'(BV[a-zA-Z0-9]+)_p(\d+)')
+
+# 解析函数：bvid -> 分P列表（pagelist 格式，含 cid/page/part/duration），失败返回 None
+PartsResolver = Callable[[str], Awaitable[Optional[List[Dict]]]]
+
+
+def extract_bvid_from_url(url_or_bvid: str) -> str:
+    """Extract BV ID from Bilibili URL or return as-is if already a BV ID."""
+    if url_or_bvid.startswith('http'):
+        # Extract BV ID from URL like https://www.bilibili.com/video/BV1LnuzzyEQp
+        match = re.search(r'/video/(BV[a-zA-Z0-9]+)', url_or_bvid)
+        if match:
+            return match.group(1)
+        else:
+            raise ValueError(f"Could not extract BV ID from URL: {url_or_bvid}")
+    else:
+        # Assume it's already a BV ID
+        return url_or_bvid
+
+
+def sanitize_filename(name: str) -> str:
+    """去掉文件名中不允许的字符"""
+    return re.sub(r'[\\/*?:"<>|]', "", name)
+
+
+def episode_id(bvid: str, page: int) -> str:
+    return f"{bvid}_p{page}"
+
+
+def parse_episode_id(value: str) -> Optional[Tuple[str, int]]:
+    """BV1xx_p3 -> ("BV1xx", 3)；格式不符时返回 None"""
+    match = EPISODE_ID_PATTERN.fullmatch(value)
+    return (match.group(1), int(match.group(2))) if match else None
+
+
+def read_list_file(list_file: Path) -> Tuple[List[str], List[str]]:
+    """读取 list.txt，返回 (按顺序去重的 BV 号, 无法解析的行)"""
+    with open(list_file, 'r', encoding='utf-8') as f:
+        lines = [line for line in (raw.strip() for raw in f) if line and not line.startswith('#')]
+    bvids: List[str] = []
+    invalid: List[str] = []
+    for line in lines:
+        try:
+            bvid = extract_bvid_from_url(line)
+        except ValueError:
+            invalid.append(line)
+            continue
+        if bvid not in bvids:
+            bvids.append(bvid)
+    return bvids, invalid
+
+
+def normalize_folder_path(folder_path: str) -> str:
+    return folder_path.replace('\\', '/').strip('/')
+
+
+class ListManifest:
+    """一份 list.txt 的解析结果"""
+    __slots__ = ("folder_path", "key", "bvids", "invalid")
+
+    def __init__(self, folder_path: str, key: Tuple[str, int, int], bvids: List[str], invalid: List[str]):
+        self.folder_path = folder_path
+        self.key = key
+        self.bvids = bvids
+        self.invalid = invalid
+
+
+class ListFileIndex:
+    """所有文件夹 list.txt 的内存索引。启动时扫描一次，之后由文件系统监视器通知变化（apply_change）；
+    未启用监视时（watching 为 False）查询会 stat 文件并在 (mtime_ns, 大小) 变化时重新解析"""
+
+    def __init__(self, videos_dir: Path):
+        self.videos_dir = Path(videos_dir)
+        self.watching = False
+        self._lock = threading.Lock()
+        self._entries: Dict[str, ListManifest] = {}
+        self.parses = 0
+
+    def get(self, folder_path: str) -> Optional[ListManifest]:
+        """只查内存"""
+        return self._entries.get(normalize_folder_path(folder_path))
+
+    def refresh(self, folder_path: str) -> Optional[ListManifest]:
+        """stat list.txt，键变化时重新解析；文件不存在或无法读取时移除并返回 None"""
+        folder_path = normalize_folder_path(folder_path)
+        list_file = self.videos_dir / folder_path / LIST_FILE
+        while True:
+            try:
+                stat_result = os.stat(list_file)
+            except OSError:
+                self._drop(folder_path)
+                return None
+            key = (str(list_file), stat_result.st_mtime_ns, stat_result.st_size)
+            current = self._entries.get(folder_path)
+            if current is not None and current.key == key:
+                return current
+            try:
+                bvids, invalid = read_list_file(list_file)
+            except (OSError, ValueError) as e:
+                print(f"读取 list.txt 失败 ({folder_path}): {e}")
+                self._drop(folder_path)
+                return None
+            # 解析期间文件又被修改时重新读取，避免存下与键不符的内容
+            try:
+                stat_result = os.stat(list_file)
+            except OSError:
+                continue
+            if (stat_result.st_mtime_ns, stat_result.st_size) != key[1:]:
+                continue
+            for line in invalid:
+                print(f"忽略 list.txt 中无法识别的行 ({folder_path}): {line}")
+            manifest = ListManifest(folder_path, key, bvids, invalid)
+            with self._lock:
+                self._entries[folder_path] = manifest
+                self.parses += 1
+            return manifest
+
+    def _drop(self, folder_path: str) -> None:
+        with self._lock:
+            self._entries.pop(folder_path, None)
+
+    def scan(self, folder_path: str = "") -> int:
+        """重新扫描一棵子树（默认整个视频目录），返回其中 list.txt 的数量"""
+        folder_path = normalize_folder_path(folder_path)
+        top = self.videos_dir / folder_path
+        found = set()
+        for dirpath, _, filenames in os.walk(top):
+            if LIST_FILE in filenames:
+                rel = normalize_folder_path(os.path.relpath(dirpath, self.videos_dir))
+                rel = "" if rel == "." else rel
+                if self.refresh(rel) is not None:
+                    found.add(rel)
+        prefix = folder_path + "/" if folder_path else ""
+        with self._lock:
+            for stale in [p for p in self._entries
+                          if (p == folder_path or p.startswith(prefix)) and p not in found]:
+                del self._entries[stale]
+        return len(found)
+
+    def _relative(self, path: Path) -> Optional[str]:
+        """监视器报告的绝对路径 -> 视频目录下的相对路径；不在视频目录内时返回 None"""
+        try:
+            rel = normalize_folder_path(os.path.relpath(path, self.videos_dir))
+        except ValueError:
+            return None
+        if rel.startswith(".."):
+            return None
+        return "" if rel == "." else rel
+
+    def apply_change(self, path: Path) -> None:
+        """处理监视器报告的变化：list.txt 本身变化时重新解析，目录增删或改名时重新扫描该子树"""
+        rel = self._relative(path)
+        if rel is None:
+            return
+        if path.name == LIST_FILE:
+            self.refresh(rel.rpartition("/")[0])
+        elif rel == "" or path.is_dir() or self._has_subtree(rel):
+            self.scan(rel)
+
+    def bvids(self) -> Set[str]:
+        """所有 list.txt 中的 BV 号"""
+        with self._lock:
+            return {bvid for manifest in self._entries.values() for bvid in manifest.bvids}
+
+    def bvids_under(self, path: Path) -> Set[str]:
+        """某个目录（含子目录）的 list.txt 中的 BV 号"""
+        rel = self._relative(path)
+        if rel is None:
+            return set()
+        prefix = rel + "/" if rel else ""
+        with self._lock:
+            return {bvid for folder, manifest in self._entries.items()
+                    if folder == rel or folder.startswith(prefix) for bvid in manifest.bvids}
+
+    def _has_subtree(self, folder_path: str) -> bool:
+        prefix = folder_path + "/"
+        return any(p == folder_path or p.startswith(prefix) for p in list(self._entries))
+
+    def stats(self) -> Dict:
+        return {"name": "list_manifests", "entries": len(self._entries), "parses": self.parses,
+                "watching": self.watching}
+
+
+def merge_episodes(sources: List[Tuple[str, List[Dict]]]) -> List[Dict]:
+    """按来源顺序合并分P，编排专辑序号；同名分P的文件名都带上剧集 ID，文件名不随 list.txt 中的顺序变化"""
+    ordered = [(bvid, part) for bvid, parts in sources for part in sorted(parts, key=lambda p: p['page'])]
+    title_counts = Counter(sanitize_filename(part['part']) for _, part in ordered)
+    episodes = []
+    for bvid, part in ordered:
+        eid = episode_id(bvid, part['page'])
+        file_name = sanitize_filename(part['part'])
+        if title_counts[file_name] > 1:
+            file_name = f"{file_name}.{eid}"
+        episodes.append({
+            "id": eid,
+            "index": len(episodes) + 1,
+            "bvid": bvid,
+            "page": part['page'],
+            "cid": part['cid'],
+            "part": part['part'],
+            "duration": part.get('duration', 0),
+            "file_name": file_name,
+        })
+    return episodes
+
+
+class Album:
+    """一个文件夹的剧集清单"""
+
+    def __init__(self, folder_path: str, list_key: Tuple[str, int, int], bvids: List[str], episodes: List[Dict],
+                 failed: List[str], invalid: List[str]):
+        self.folder_path = folder_path
+        self.list_key = list_key
+        self.bvids = bvids
+        self.episodes = episodes
+        self.failed = failed
+        self.invalid = invalid
+        self.built_at = time.time()
+        self._by_id = {episode['id']: episode for episode in episodes}
+
+    @property
+    def complete(self) -> bool:
+        return not self.failed
+
+    def find(self, ref: str) -> Optional[Dict]:
+        """按剧集 ID 或专辑序号（从 1 开始，单个来源时即分P页码）查找剧集"""
+        episode = self._by_id.get(ref)
+        if episode is None and ref.isdigit() and 0 < int(ref) <= len(self.episodes):
+            episode = self.episodes[int(ref) - 1]
+        return episode
+
+
+class AlbumManifests:
+    """按文件夹缓存专辑清单；同一文件夹的并发解析只执行一次"""
+
+    def __init__(self, resolve_parts: PartsResolver, lists: ListFileIndex, ttl: float = ALBUM_MANIFEST_TTL,
+                 partial_ttl: float = ALBUM_PARTIAL_TTL, max_entries: int = 256,
+                 on_built: Optional[Callable[[Album], None]] = None):
+        self._resolve_parts = resolve_parts
+        self._lists = lists
+        self._on_built = on_built
+        self.ttl = ttl
+        self.partial_ttl = partial_ttl
+        self._cache = LRUCache("album_manifests", max_entries=max_entries)
+        self._singleflight = SingleFlight()
+
+    async def get(self, folder_path: str) -> Album:
+        """返回文件夹的专辑清单；list.txt 不存在时抛出 FileNotFoundError，没有有效条目时抛出 ValueError"""
+        if self._lists.watching:
+            manifest = self._lists.get(folder_path)
+        else:
+            manifest = await asyncio.to_thread(self._lists.refresh, folder_path)
+        if manifest is None:
+            raise FileNotFoundError(folder_path)
+        if not manifest.bvids:
+            raise ValueError("'list.txt' is empty or contains no valid BV IDs.")
+        album = self._cache.get(manifest.folder_path)
+        if album is not None and album.list_key == manifest.key:
+            return album
+        return await self._singleflight.do(manifest.key, lambda: self._build(manifest))
+
+    async def _build(self, manifest: ListManifest) -> Album:
+        bvids = manifest.bvids
+        results = await asyncio.gather(*(self._resolve_parts(bvid) for bvid in bvids), return_exceptions=True)
+        sources = []
+        failed = []
+        for bvid, parts in zip(bvids, results):
+            if isinstance(parts, BaseException) or not parts:
+                print(f"解析专辑来源失败 {bvid}: {parts if isinstance(parts, BaseException) else '无分P信息'}")
+                failed.append(bvid)
+            else:
+                sources.append((bvid, parts))
+
+        album = Album(manifest.folder_path, manifest.key, bvids, merge_episodes(sources), failed, manifest.invalid)
+        self._store(album)
+        return album
+
+    def build_cached(self, folder_path: str, lookup: Callable[[str], Optional[List[Dict]]]) -> Optional[Album]:
+        """只用已缓存的分P信息（lookup 不外呼）组装清单；有来源未缓存时返回 None"""
+        manifest = self._lists.get(folder_path)
+        if manifest is None or not manifest.bvids:
+            return None
+        sources = []
+        for bvid in manifest.bvids:
+            parts = lookup(bvid)
+            if not parts:
+                return None
+            sources.append((bvid, parts))
+        album = Album(manifest.folder_path, manifest.key, manifest.bvids, merge_episodes(sources), [],
+                      manifest.invalid)
+        self._store(album)
+        return album
+
+    def _store(self, album: Album) -> None:
+        if not album.episodes:
+            return
+        self._cache.set(album.folder_path, album, ttl=self.ttl if album.complete else self.partial_ttl)
+        if self._on_built:
+            self._on_built(album)
+
+    def invalidate(self, folder_path: str) -> None:
+        self._cache.delete(normalize_folder_path(folder_path))
+
+    def stats(self) -> Dict:
+        return self._cache.stats()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+基准：文件夹名排序
+
+生成 N 个名字（"第N集"、中文标题、英文与数字混合），比较：
+- 旧实现：locale.strxfrm 作为排序键（每次请求都重新计算，依赖进程全局的 locale 设置）
+- collation.sort_key 首次计算（冷缓存）
+- 文件夹索引中已缓存排序键时的排序（每次请求的实际开销）
+并检查自然数字顺序（"第2集" 在 "第10集" 之前）。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_collation.py [--names 10000] [--rounds 5]
+"""
+import argparse
+import locale
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import collation  # noqa: E402
+
+TITLES = ["小猪佩奇", "汪汪队立大功", "超级飞侠", "海底小纵队", "宝宝巴士", "熊出没", "喜羊羊与灰太狼",
+          "巧虎", "米小圈", "西游记", "长颈鹿", "阿狸", "中国神话故事", "恐龙世界"]
+LATIN = ["Peppa Pig", "Paw Patrol", "Bluey", "Cocomelon", "Super Wings", "abc Songs", "Numberblocks"]
+
+
+def make_names(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        kind = rng.random()
+        if kind < 0.4:
+            names.add(f"{rng.choice(TITLES)} 第{rng.randint(1, 300)}集")
+        elif kind < 0.6:
+            names.add(f"第{rng.randint(1, 2000)}集")
+        elif kind < 0.8:
+            names.add(f"{rng.choice(LATIN)} S{rng.randint(1, 9)}E{rng.randint(1, 52)}")
+        else:
+            names.add(f"{rng.choice(TITLES)}{rng.choice(LATIN)}{rng.randint(1, 99999)}")
+    return list(names)
+
+
+def set_chinese_locale() -> str:
+    for name in ('zh_CN.UTF-8', 'Chinese (Simplified)_China.936', 'zh_CN'):
+        try:
+            locale.setlocale(locale.LC_COLLATE, name)
+            return name
+        except locale.Error:
+            continue
+    return "C（未安装中文 locale）"
+
+
+def best_of(rounds: int, fn) -> float:
+    timings = []
+    for _ in range(rounds):
+        began = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - began)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--names", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    names = make_names(args.names)
+    folders = [{"name": name} for name in names]
+    print(f"{len(names)} 个名字，pypinyin: {'已安装' if collation.PYPINYIN_AVAILABLE else '未安装（GB18030 回退）'}")
+
+    used_locale = set_chinese_locale()
+    legacy = best_of(args.rounds, lambda: sorted(folders, key=lambda x: locale.strxfrm(x['name'])))
+    print(f"  旧实现 locale.strxfrm（{used_locale}）: {legacy * 1000:8.2f} ms")
+
+    def cold():
+        collation.sort_key.cache_clear()
+        return sorted(folders, key=lambda x: collation.sort_key(x['name']))
+    cold_time = best_of(args.rounds, cold)
+    print(f"  collation 首次计算排序键:            {cold_time * 1000:8.2f} ms")
+
+    keyed = [(collation.sort_key(name), {"name": name}) for name in names]
+    cached = best_of(args.rounds, lambda: sorted(keyed, key=lambda item: item[0]))
+    print(f"  索引中已缓存排序键:                  {cached * 1000:8.2f} ms")
+
+    ordered = collation.sort_names(["第10集", "第2集", "第1集"])
+    assert ordered == ["第1集", "第2集", "第10集"], ordered
+    print(f"  自然顺序: {' < '.join(ordered)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+基准：ffmpeg 合并吞吐与首帧时间
+
+用 ffmpeg 的 testsrc/sine 生成一段测试音视频（分别存为视频与音频文件，模拟 DASH 两路流），
+然后用 merge_pool 以不同并发数合并 N 份，统计吞吐（MiB/s）与总耗时；
+再对比 +faststart 与普通输出的“首帧时间”：客户端从头顺序读取文件，
+读到 moov 之前无法解码，统计需要读取的字节数，并按 --link-mbps 估算起播等待时间。
+
+用法（在 backend 目录下，需要 ffmpeg）：
+    python benchmarks/bench_merge.py [--seconds 120] [--copies 8] [--concurrency 1,2,4] [--link-mbps 20]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from merge_pool import MergePool  # noqa: E402
+
+
+def make_inputs(tmp: Path, seconds: int) -> tuple:
+    video = tmp / "input_video.mp4"
+    audio = tmp / "input_audio.m4a"
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi',
+                    '-i', f'testsrc2=size=1280x720:rate=30:duration={seconds}',
+                    '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', '2M', str(video)], check=True)
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi',
+                    '-i', f'sine=frequency=440:duration={seconds}',
+                    '-c:a', 'aac', '-b:a', '128k', str(audio)], check=True)
+    return video, audio
+
+
+def bytes_before_moov(path: Path) -> int:
+    """顺序读取时解析到 moov 结束需要的字节数（moov 之前的所有顶层 box 加上 moov 本身）"""
+    offset = 0
+    size = path.stat().st_size
+    with open(path, 'rb') as f:
+        while offset < size:
+            f.seek(offset)
+            header = f.read(16)
+            if len(header) < 8:
+                break
+            box_size, box_type = struct.unpack(">I4s", header[:8])
+            if box_size == 1:
+                box_size = struct.unpack(">Q", header[8:16])[0]
+            elif box_size == 0:
+                box_size = size - offset
+            offset += box_size
+            if box_type == b"moov":
+                return offset
+    return size
+
+
+async def run_concurrency(video: Path, audio: Path, out_dir: Path, copies: int,
+                          concurrency: int, duration: float) -> dict:
+    pool = MergePool(max_concurrency=concurrency)
+    outputs = [out_dir / f"out_{concurrency}_{i}.mp4" for i in range(copies)]
+    began = time.perf_counter()
+    await asyncio.gather(*(pool.merge(str(video), str(audio), out, duration=duration) for out in outputs))
+    elapsed = time.perf_counter() - began
+    total = sum(out.stat().st_size for out in outputs)
+    for out in outputs:
+        out.unlink()
+    return {"concurrency": concurrency, "seconds": elapsed, "mib_per_sec": total / elapsed / 1048576}
+
+
+async def run_first_frame(video: Path, audio: Path, out_dir: Path, duration: float, link_mbps: float) -> list:
+    pool = MergePool(max_concurrency=1)
+    results = []
+    for faststart in (True, False):
+        out = out_dir / f"first_frame_{'faststart' if faststart else 'plain'}.mp4"
+        await pool.merge(str(video), str(audio), out, duration=duration, faststart=faststart)
+        needed = bytes_before_moov(out)
+        results.append({
+            "mode": "faststart" if faststart else "plain",
+            "size": out.stat().st_size,
+            "bytes_before_first_frame": needed,
+            "est_first_frame_ms": needed * 8 / (link_mbps * 1e6) * 1000,
+        })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=120)
+    parser.add_argument("--copies", type=int, default=8)
+    parser.add_argument("--concurrency", default=f"1,2,{os.cpu_count() or 4}")
+    parser.add_argument("--link-mbps", type=float, default=20.0)
+    args = parser.parse_args()
+
+    if shutil.which("ffmpeg") is None:
+        sys.exit("需要 ffmpeg")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_path = Path(tmp)
+        print(f"生成 {args.seconds} 秒测试音视频...")
+        video, audio = make_inputs(tmp_path, args.seconds)
+
+        print(f"合并 {args.copies} 份：")
+        for concurrency in sorted({int(c) for c in args.concurrency.split(",") if c.strip().isdigit()}):
+            result = asyncio.run(run_concurrency(video, audio, tmp_path, args.copies, concurrency, args.seconds))
+            print(f"  并发 {result['concurrency']:>2}: {result['seconds']:.2f} s, {result['mib_per_sec']:.1f} MiB/s")
+
+        print(f"首帧时间（顺序读取，链路 {args.link_mbps:g} Mbit/s）：")
+        for result in asyncio.run(run_first_frame(video, audio, tmp_path, args.seconds, args.link_mbps)):
+            print(f"  {result['mode']:>9}: 起播前需读取 {result['bytes_before_first_frame'] / 1048576:.2f} MiB"
+                  f" / {result['size'] / 1048576:.2f} MiB，约 {result['est_first_frame_ms']:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+基准：从视频页面提取分P列表（window.__INITIAL_STATE__.videoData.pages）
+
+比较：
+- 旧实现：读完整个页面，解码为文本，非贪婪正则截取状态对象后整体 json.loads（全部在事件循环中）
+- state_extractor：逐块扫描到状态脚本结束即停止读取，只解码 videoData 子树
+  （其中只有扫描在事件循环中进行，解码在线程池中）
+并检查两者解析出的分P列表一致。
+
+页面默认按 B 站视频页的结构生成（__playinfo__、状态对象中的推荐视频与合集、其后的页面脚本）；
+也可用 --pages-dir 指定保存的真实页面（如 curl -o BV1xx.html https://www.bilibili.com/video/BV1xx）。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_state_extractor.py [--pages-dir DIR] [--parts 50] [--rounds 20]
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import state_extractor  # noqa: E402
+from state_extractor import STATE_CHUNK_SIZE, InitialStateScanner, extract_video_pages  # noqa: E402
+
+LEGACY_PATTERN = re.compile(r'<script>window\.__INITIAL_STATE__=(.*?);\(function\(\)')
+
+
+def fake_video(rng: random.Random, bvid: str, parts: int) -> dict:
+    return {
+        "bvid": bvid, "aid": rng.randint(10 ** 8, 10 ** 9), "videos": parts, "title": f"示例视频 {bvid}",
+        "desc": "简介" * rng.randint(50, 300),
+        "owner": {"mid": rng.randint(1, 10 ** 9), "name": "UP主", "face": "https://i0.hdslb.com/bfs/face/x.jpg"},
+        "stat": {key: rng.randint(0, 10 ** 6) for key in ("view", "danmaku", "reply", "favorite", "coin", "share", "like")},
+        "pages": [{"cid": rng.randint(10 ** 8, 10 ** 9), "page": i + 1, "part": f"第{i + 1}集 标题",
+                   "duration": rng.randint(60, 1800), "first_frame": f"https://i0.hdslb.com/bfs/storyff/{bvid}_{i}.jpg",
+                   "dimension": {"width": 1920, "height": 1080, "rotate": 0}} for i in range(parts)],
+    }
+
+
+def make_page(rng: random.Random, parts: int) -> bytes:
+    video = fake_video(rng, "BV1bench0001", parts)
+    # 推荐视频与合集中的视频也带 pages，检验只取 videoData 自己的分P
+    video["ugc_season"] = {"sections": [{"episodes": [{"bvid": f"BV1season{i:03d}",
+                                                       "pages": [{"cid": i, "page": 1, "part": "合集"}]}
+                                                      for i in range(60)]}]}
+    state = {
+        "aid": video["aid"], "bvid": video["bvid"],
+        "related": [fake_video(rng, f"BV1related{i:03d}", rng.randint(1, 3)) for i in range(40)],
+        "videoData": video,
+        "upData": {"mid": video["owner"]["mid"], "sign": "签名" * 100},
+        "tags": [{"tag_id": i, "tag_name": f"标签{i}"} for i in range(20)],
+    }
+    playinfo = {"code": 0, "session": "0123456789abcdef", "data": {"dash": {"video": [
+        {"id": 80, "baseUrl": "https://upos.example/" + "x" * 200, "segment_base": {"initialization": "0-1000"}}
+        for _ in range(40)]}}}
+    head = (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{video["title"]}</title>'
+            f'<script>window.__playinfo__={json.dumps(playinfo, separators=(",", ":"))}</script></head>'
+            '<body><div id="app"></div>')
+    script = (f'<script>window.__INITIAL_STATE__={json.dumps(state, ensure_ascii=False, separators=(",", ":"))};'
+              '(function(){var s;(s=document.currentScript||document.scripts[document.scripts.length-1]).parentNode'
+              '.removeChild(s);}());</script>')
+    tail = "".join(f'<script>/* bundle {i} */var m{i}="{"z" * 8000}";</script>' for i in range(40)) + "</body></html>"
+    return (head + script + tail).encode("utf-8")
+
+
+def load_pages(args) -> list:
+    if args.pages_dir:
+        return [(path.name, path.read_bytes()) for path in sorted(Path(args.pages_dir).glob("*.html"))]
+    rng = random.Random(1)
+    return [(f"生成页面 {i + 1}", make_page(rng, args.parts)) for i in range(3)]
+
+
+def legacy(page: bytes) -> list:
+    match = LEGACY_PATTERN.search(page.decode("utf-8"))
+    return json.loads(match.group(1)).get("videoData", {}).get("pages", [])
+
+
+def chunks_of(page: bytes):
+    for offset in range(0, len(page), STATE_CHUNK_SIZE):
+        yield page[offset:offset + STATE_CHUNK_SIZE]
+
+
+def scan(page: bytes) -> InitialStateScanner:
+    scanner = InitialStateScanner()
+    for chunk in chunks_of(page):
+        if scanner.feed(chunk):
+            break
+    return scanner
+
+
+def best_of(rounds: int, fn) -> float:
+    timings = []
+    for _ in range(rounds):
+        began = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - began)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages-dir", help="保存的视频页面（*.html）所在目录")
+    parser.add_argument("--parts", type=int, default=50, help="生成页面的分P数")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = load_pages(args)
+    if not pages:
+        sys.exit(f"{args.pages_dir} 中没有 .html 文件")
+    print(f"orjson: {'已安装' if state_extractor.ORJSON_AVAILABLE else '未安装（json.raw_decode 解码子树）'}")
+    for name, page in pages:
+        scanner = scan(page)
+        assert scanner.state is not None, f"{name}: 未找到 __INITIAL_STATE__"
+        expected = legacy(page)
+        assert extract_video_pages(scanner.state) == expected, f"{name}: 分P列表与旧实现不一致"
+
+        legacy_time = best_of(args.rounds, lambda: legacy(page))
+        scan_time = best_of(args.rounds, lambda: scan(page))
+        decode_time = best_of(args.rounds, lambda: extract_video_pages(scanner.state))
+        print(f"{name}: 页面 {len(page) / 1024:.0f} KiB，状态对象 {len(scanner.state) / 1024:.0f} KiB，{len(expected)} 个分P")
+        print(f"  旧实现（事件循环中）:  {legacy_time * 1000:7.2f} ms，读取 {len(page) / 1024:.0f} KiB")
+        print(f"  扫描（事件循环中）:    {scan_time * 1000:7.2f} ms，读取 {scanner.bytes_read / 1024:.0f} KiB 后停止")
+        print(f"  解码子树（线程池中）:  {decode_time * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+基准：字幕获取期间的事件循环延迟
+
+用本地模拟的外呼（固定网络延迟）并发拉取多个分P的字幕，同时以固定间隔
+打点测量事件循环的调度延迟。作为对照，"blocking" 模式运行旧实现的字幕路径
+（legacy_download_and_cache_subtitle，去掉日志后逐行照搬：同步 requests 取 WBI 密钥、
+请求 player 接口与字幕 JSON，同步写文件），两种模式的外呼经过同一个模拟网络
+（相同的延迟与响应，同步版本的延迟在调用线程中 time.sleep）。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_subtitle_loop_lag.py [--episodes 20] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main  # noqa: E402
+
+TICK_INTERVAL = 0.005
+
+
+class FakeResponse:
+    """模拟 aiohttp 响应，只实现字幕路径用到的接口"""
+
+    def __init__(self, payload):
+        self.status = 200
+        self._payload = payload
+
+    async def json(self, content_type=None):
+        return self._payload
+
+
+class FakeSyncResponse:
+    """模拟 requests 响应，只实现旧字幕路径用到的接口"""
+
+    def __init__(self, payload):
+        self.status_code = 200
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+def fake_payload(url: str):
+    if "web-interface/nav" in url:
+        return {"data": {"wbi_img": {"img_url": "https://i0.hdslb.com/bfs/wbi/" + "a" * 32 + ".png",
+                                     "sub_url": "https://i0.hdslb.com/bfs/wbi/" + "b" * 32 + ".png"}}}
+    if "wbi/v2" in url:
+        return {"code": 0, "data": {"subtitle": {"subtitles": [
+            {"ai_type": 0, "subtitle_url": "//example.invalid/subtitle.json"}]}}}
+    return {"body": [{"from": i * 2.0, "to": i * 2.0 + 1.5, "content": f"第{i}句"} for i in range(400)]}
+
+
+def make_sync_transport(latency: float):
+    def fake_sync_get(url, params=None, headers=None, **kwargs):
+        time.sleep(latency)
+        return FakeSyncResponse(fake_payload(url))
+    return fake_sync_get
+
+
+def legacy_wbi_keys(sync_get, cookie=None):
+    """旧实现的 get_wbi_keys（不经缓存，与异步模式中每次都外呼的 WBI 密钥一致）"""
+    headers = main.HEADERS.copy()
+    if cookie:
+        headers['Cookie'] = cookie
+    json_content = sync_get('https://api.bilibili.com/x/web-interface/nav', headers=headers).json()
+    img_url: str = json_content['data']['wbi_img']['img_url']
+    sub_url: str = json_content['data']['wbi_img']['sub_url']
+    img_key = img_url.rsplit('/', 1)[1].split('.')[0]
+    sub_key = sub_url.rsplit('/', 1)[1].split('.')[0]
+    return main.get_mixin_key(img_key + sub_key)
+
+
+async def legacy_download_and_cache_subtitle(sync_get, bvid: str, page: int, cid: int) -> str:
+    """旧实现的 download_and_cache_subtitle / _fetch_subtitle：声明为 async，内部全是同步调用"""
+    subtitle_path = main.SUBTITLES_DIR / f"legacy_{bvid}_p{page}.vtt"
+    if subtitle_path.exists():
+        return f"/subtitles/{subtitle_path.name}"
+
+    async def fetch() -> str:
+        wbi_key = legacy_wbi_keys(sync_get, main.BILIBILI_COOKIE)
+        signed_params = main.sign_wbi_params({'bvid': bvid, 'cid': cid}, wbi_key)
+        headers = main.HEADERS.copy()
+        headers['Cookie'] = main.BILIBILI_COOKIE
+        response = sync_get("https://api.bilibili.com/x/player/wbi/v2", params=signed_params, headers=headers)
+        if not response or response.status_code != 200:
+            return ""
+        subtitle_data = response.json()
+        if subtitle_data.get('code') != 0:
+            return ""
+        subtitles_list = subtitle_data.get('data', {}).get('subtitle', {}).get('subtitles', [])
+        user_subtitle = next((s for s in subtitles_list if s.get('ai_type') == 0 and s.get('subtitle_url')), None)
+        if not user_subtitle:
+            return ""
+        subtitle_url = user_subtitle.get('subtitle_url')
+        if subtitle_url.startswith('//'):
+            subtitle_url = 'https:' + subtitle_url
+        subtitle_content = sync_get(subtitle_url, headers=main.HEADERS).json()
+        temp_path = subtitle_path.with_name(subtitle_path.name + ".part")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write("WEBVTT\n\n")
+            for line in subtitle_content.get('body', []):
+                start_time = main.format_webvtt_time(line.get('from', 0))
+                end_time = main.format_webvtt_time(line.get('to', 0))
+                f.write(f"{start_time} --> {end_time}\n{line.get('content', '')}\n\n")
+        os.replace(temp_path, subtitle_path)
+        return f"/subtitles/{subtitle_path.name}"
+
+    return await main._singleflight.do(("legacy-subtitle", bvid, page), fetch)
+
+
+async def measure_lag(stop: asyncio.Event, samples: list) -> None:
+    """按固定间隔打点，记录实际唤醒时间比预期晚了多少"""
+    while not stop.is_set():
+        expected = time.perf_counter() + TICK_INTERVAL
+        await asyncio.sleep(TICK_INTERVAL)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+
+async def run(mode: str, episodes: int, latency: float) -> dict:
+    async def fake_limited_get(url, params=None, headers=None, retries=3):
+        await asyncio.sleep(latency)
+        return FakeResponse(fake_payload(url))
+
+    async def fake_wbi_keys(cookie=None):
+        await asyncio.sleep(latency)
+        return "0" * 32
+
+    sync_get = make_sync_transport(latency)
+
+    async def blocking_subtitle(bvid, page, cid):
+        return await legacy_download_and_cache_subtitle(sync_get, bvid, page, cid)
+
+    main.limited_get = fake_limited_get
+    main.get_wbi_keys_async = fake_wbi_keys
+    main.BILIBILI_COOKIE = "bench"
+
+    samples: list = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(stop, samples))
+    fetch = blocking_subtitle if mode == "blocking" else main.download_and_cache_subtitle
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(fetch("BVbench", page, 1000 + page) for page in range(1, episodes + 1)))
+    assert all(results), f"{mode}: 有分P未生成字幕"
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+
+    samples.sort()
+    return {
+        "mode": mode,
+        "elapsed_s": round(elapsed, 3),
+        "lag_p50_ms": round(statistics.median(samples) * 1000, 2) if samples else 0.0,
+        "lag_p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 2) if samples else 0.0,
+        "lag_max_ms": round(samples[-1] * 1000, 2) if samples else 0.0,
+    }
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--episodes", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟的单次外呼延迟（秒）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        main.SUBTITLES_DIR = Path(tmp)
+        for mode in ("blocking", "async"):
+            result = asyncio.run(run(mode, args.episodes, args.latency))
+            print(f"{result['mode']:>8}: 总耗时 {result['elapsed_s']}s, "
+                  f"事件循环延迟 p50={result['lag_p50_ms']}ms p99={result['lag_p99_ms']}ms "
+                  f"max={result['lag_max_ms']}ms")
+
+
+if __name__ == "__main__":
+    main_cli()
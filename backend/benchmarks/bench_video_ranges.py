@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+基准：视频 Range 请求的吞吐与首字节时间
+
+在本地临时目录生成一个大文件（默认 1 GiB），用 uvicorn 在随机端口上提供服务，
+多个并发客户端反复随机跳转（每次请求一个 Range 窗口并读完），统计总吞吐与
+首字节时间（TTFB）的 p50/p99。"range" 模式使用 video_serving 组件，
+"fileresponse" 模式使用 Starlette 的 FileResponse 作为对照。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_video_ranges.py [--size-mb 1024] [--clients 20] [--seeks 50] [--window-kb 2048]
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import aiohttp  # noqa: E402
+import uvicorn  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import FileResponse  # noqa: E402
+
+from video_serving import serve_file_with_ranges  # noqa: E402
+
+BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def make_file(path: Path, size: int) -> None:
+    """写入不可压缩的测试数据（重复使用一块随机数据，生成更快）"""
+    block = os.urandom(BLOCK_SIZE)
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:min(BLOCK_SIZE, remaining)])
+            remaining -= BLOCK_SIZE
+
+
+def build_app(video_path: Path) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/range/video.mp4")
+    async def range_video(request: Request):
+        return await serve_file_with_ranges(request, video_path, "no-cache")
+
+    @app.get("/fileresponse/video.mp4")
+    async def file_response_video():
+        return FileResponse(video_path)
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app: FastAPI, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def client(session: aiohttp.ClientSession, url: str, size: int, window: int, seeks: int,
+                 rng: random.Random, ttfbs: list) -> int:
+    received = 0
+    for _ in range(seeks):
+        start = rng.randrange(0, max(size - window, 1))
+        headers = {"Range": f"bytes={start}-{start + window - 1}"}
+        began = time.perf_counter()
+        async with session.get(url, headers=headers) as resp:
+            if resp.status != 206:
+                raise RuntimeError(f"期望 206，实际 {resp.status}")
+            first = await resp.content.readany()
+            ttfbs.append(time.perf_counter() - began)
+            received += len(first)
+            async for chunk in resp.content.iter_chunked(256 * 1024):
+                received += len(chunk)
+    return received
+
+
+async def run_mode(base: str, mode: str, size: int, args) -> dict:
+    url = f"{base}/{mode}/video.mp4"
+    ttfbs: list = []
+    connector = aiohttp.TCPConnector(limit=args.clients)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        began = time.perf_counter()
+        totals = await asyncio.gather(*(
+            client(session, url, size, args.window_kb * 1024, args.seeks, random.Random(seed), ttfbs)
+            for seed in range(args.clients)))
+        elapsed = time.perf_counter() - began
+    ttfbs.sort()
+    return {
+        "mode": mode,
+        "requests": len(ttfbs),
+        "mib_per_sec": sum(totals) / elapsed / 1048576,
+        "ttfb_p50_ms": statistics.median(ttfbs) * 1000,
+        "ttfb_p99_ms": ttfbs[min(len(ttfbs) - 1, int(len(ttfbs) * 0.99))] * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--seeks", type=int, default=50)
+    parser.add_argument("--window-kb", type=int, default=2048)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video_path = Path(tmp) / "video.mp4"
+        size = args.size_mb * 1024 * 1024
+        print(f"生成 {args.size_mb} MiB 测试文件...")
+        make_file(video_path, size)
+
+        port = free_port()
+        server = start_server(build_app(video_path), port)
+        try:
+            print(f"{args.clients} 个客户端 x {args.seeks} 次随机跳转，每次 {args.window_kb} KiB")
+            for mode in ("range", "fileresponse"):
+                result = asyncio.run(run_mode(f"http://127.0.0.1:{port}", mode, size, args))
+                print(f"{result['mode']:>13}: {result['requests']} 次请求, "
+                      f"{result['mib_per_sec']:.1f} MiB/s, "
+                      f"TTFB p50 {result['ttfb_p50_ms']:.1f} ms / p99 {result['ttfb_p99_ms']:.1f} ms")
+        finally:
+            server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+文件夹名排序：与进程 locale 无关的排序键，每个名字只计算一次（文件夹索引中缓存）。
+- 数字按数值比较（自然排序），"第2集" 排在 "第10集" 之前，全角数字视同半角
+- 汉字按拼音排序：安装了 pypinyin 时使用带声调的拼音（按词组判断多音字），
+  否则使用 GB18030 编码（GB2312 一级汉字按拼音排列，覆盖常用字）
+- 整体顺序：数字 < 字母与符号 < 汉字；英文不区分大小写
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Iterable, List
+
+try:
+    from pypinyin import Style, lazy_pinyin
+    PYPINYIN_AVAILABLE = True
+except ImportError:
+    Style = None
+    lazy_pinyin = None
+    PYPINYIN_AVAILABLE = False
+
+# 数字串、汉字串与其他字符
+_TOKEN_PATTERN = re.compile(r'(\d+)|([\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+)|(.)', re.S)
+
+# 每个片段以类别标记开头，保证 数字 < 字母与符号 < 汉字；
+# 排序键是单个字符串，排序时的比较在 C 层完成（嵌套元组逐元素比较要慢一个数量级）
+NUMBER = "\x01"
+TEXT = "\x02"
+HANZI = "\x03"
+# 排序键与原名之间的分隔符，小于所有类别标记
+_TIEBREAK = "\x00"
+
+
+def _hanzi_key(run: str) -> str:
+    if PYPINYIN_AVAILABLE:
+        # 带声调数字的拼音（如 zhu1），以数字结尾，前缀相同的音节自然排在前面
+        syllables = lazy_pinyin(run, style=Style.TONE3, neutral_tone_with_five=True)
+        if len(syllables) == len(run):
+            return "".join(HANZI + syllable for syllable in syllables)
+    return "".join(HANZI + _gb18030(char) for char in run)
+
+
+@lru_cache(maxsize=None)
+def _gb18030(char: str) -> str:
+    # 定长的十六进制编码
+    return char.encode("gb18030", errors="replace").hex().rjust(8, "0")
+
+
+def _number_key(digits: str) -> str:
+    # 先比位数再比数字，即按数值比较；前导零不影响数值
+    value = digits.lstrip("0") or "0"
+    return f"{NUMBER}{len(value):04d}{value}"
+
+
+@lru_cache(maxsize=65536)
+def sort_key(name: str) -> str:
+    """名字的排序键；最后以原名兜底，保证不同名字的顺序确定"""
+    text = unicodedata.normalize("NFKC", name)
+    parts: List[str] = []
+    for digits, hanzi, other in _TOKEN_PATTERN.findall(text):
+        if digits:
+            parts.append(_number_key(digits))
+        elif hanzi:
+            parts.append(_hanzi_key(hanzi))
+        else:
+            parts.append(TEXT + other.casefold())
+    return "".join(parts) + _TIEBREAK + name
+
+
+def sort_names(names: Iterable[str]) -> List[str]:
+    return sorted(names, key=sort_key)
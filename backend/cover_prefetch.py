@@ -0,0 +1,116 @@
+"""
+封面预取引擎：有界并发、任务全程跟踪（不会被垃圾回收）、
+与进行中的同一封面下载去重，并在关闭时统一取消。
+排队中的封面可被提前（如进入视口的分P），优先获得下载名额。
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+
+# 下载函数：(bvid, page, cover_url) -> 本地封面 URL（失败返回空字符串）
+CoverFetcher = Callable[[str, int, str], Awaitable[str]]
+
+
+class CoverPrefetcher:
+    """封面预取引擎"""
+
+    def __init__(self, fetch: CoverFetcher, max_concurrency: int = 4):
+        self._fetch = fetch
+        self._max_concurrency = max(1, max_concurrency)
+        self._tasks: Dict[Tuple[str, int], asyncio.Task] = {}
+        # 等待下载名额的封面，按出队顺序排列
+        self._queue: List[Tuple[str, int]] = []
+        self._waiters: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._running = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def prefetch(self, bvid: str, page: int, cover_url: str) -> asyncio.Task:
+        """登记一个封面下载任务；同一封面已在队列或下载中时返回已有任务"""
+        key = (bvid, page)
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.create_task(self._run(bvid, page, cover_url))
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return task
+
+    def promote(self, bvid: str, pages: Iterable[int]) -> int:
+        """把仍在排队的封面移到队首（保持给定顺序），返回被提前的数量"""
+        keys = [(bvid, page) for page in pages if (bvid, page) in self._waiters]
+        if keys:
+            moved = set(keys)
+            self._queue = keys + [key for key in self._queue if key not in moved]
+        return len(keys)
+
+    async def fetch(self, bvid: str, page: int, cover_url: str) -> str:
+        """下载单个封面并等待结果；调用方取消不会中断共享的下载"""
+        return await asyncio.shield(self.prefetch(bvid, page, cover_url))
+
+    async def fetch_many(self, bvid: str, page_to_cover: Dict[int, str], order: Iterable[int] = ()) -> Dict[int, str]:
+        """并行下载多个封面（按 order 优先登记），返回 页码 -> 本地封面 URL（仅成功项）"""
+        pages = list(dict.fromkeys([p for p in order if p in page_to_cover] + list(page_to_cover)))
+        tasks = [self.prefetch(bvid, page, page_to_cover[page]) for page in pages]
+        results = await asyncio.gather(*(asyncio.shield(t) for t in tasks), return_exceptions=True)
+        return {page: url for page, url in zip(pages, results) if isinstance(url, str) and url}
+
+    async def _acquire(self, key: Tuple[str, int]) -> None:
+        if self._running < self._max_concurrency and not self._queue:
+            self._running += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[key] = waiter
+        self._queue.append(key)
+        try:
+            # 名额由 _release 直接转交，_running 已计入
+            await waiter
+        except asyncio.CancelledError:
+            if key in self._queue:
+                self._queue.remove(key)
+            elif waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            self._waiters.pop(key, None)
+
+    def _release(self) -> None:
+        while self._queue:
+            waiter = self._waiters.get(self._queue.pop(0))
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+                return
+        self._running -= 1
+
+    async def _run(self, bvid: str, page: int, cover_url: str) -> str:
+        await self._acquire((bvid, page))
+        try:
+            return await self._fetch(bvid, page, cover_url)
+        finally:
+            self._release()
+
+    def _done(self, key: Tuple[str, int], task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if task.cancelled():
+            self.cancelled += 1
+        elif task.exception() is not None or not task.result():
+            self.failed += 1
+        else:
+            self.completed += 1
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self._max_concurrency,
+            "running": self._running,
+            "queued": len(self._queue),
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+        }
+
+    async def shutdown(self) -> None:
+        """取消所有未完成的预取任务"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,322 @@
+"""
+下载管线：将远端流按固定大小分块直接写入磁盘，
+单个下载的内存占用只与分块大小有关，与视频长度无关。
+支持按 HTTP Range 分段并行下载，并通过旁路状态文件断点续传。
+"""
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 每次从网络读取并写盘的分块大小（字节）
+DEFAULT_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(256 * 1024)))
+# 分段下载时每段的大小（字节）与并行段数
+DEFAULT_SEGMENT_SIZE = int(os.getenv("DOWNLOAD_SEGMENT_SIZE", str(8 * 1024 * 1024)))
+DEFAULT_PARALLEL_RANGES = int(os.getenv("DOWNLOAD_PARALLEL_RANGES", "4"))
+# 单段失败后的重试次数（从该段已写入的位置继续）
+SEGMENT_RETRIES = 3
+# 状态文件的最小落盘间隔（秒）
+STATE_FLUSH_INTERVAL = 2.0
+
+
+class DownloadMetrics:
+    """单个流的下载指标：字节数、速率与峰值缓冲"""
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.bytes_written = 0
+        # 断点续传时此前已完成的字节数（不计入本次速率）
+        self.resumed_bytes = 0
+        self.total_bytes: Optional[int] = None
+        # 同时在途（已读出未落盘）的字节峰值；只有分段并行下载会测量，顺序流式路径为 None
+        self.peak_buffered_bytes: Optional[int] = None
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return max(end - self.started_at, 1e-6)
+
+    @property
+    def bytes_per_sec(self) -> float:
+        return self.bytes_written / self.elapsed
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "bytes_written": self.bytes_written,
+            "resumed_bytes": self.resumed_bytes,
+            "total_bytes": self.total_bytes,
+            "elapsed": round(self.elapsed, 3),
+            "bytes_per_sec": round(self.bytes_per_sec, 1),
+            "peak_buffered_bytes": self.peak_buffered_bytes,
+        }
+
+    def summary(self) -> str:
+        text = (f"{self.name}: {self.bytes_written / 1048576:.1f} MiB, "
+                f"{self.bytes_per_sec / 1048576:.2f} MiB/s")
+        if self.peak_buffered_bytes is not None:
+            text += f", 峰值缓冲 {self.peak_buffered_bytes // 1024} KiB"
+        return text
+
+
+def stream_response_to_file(response, dest: Path, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                            on_progress: Optional[Callable[[DownloadMetrics], None]] = None,
+                            metrics: Optional[DownloadMetrics] = None) -> DownloadMetrics:
+    """把 requests 的流式响应（stream=True）按块写入文件，返回下载指标"""
+    metrics = metrics or DownloadMetrics(dest.name)
+    content_length = response.headers.get('Content-Length', '')
+    # 有内容编码时 iter_content 会解压，长度无法与 Content-Length 对比
+    if content_length.isdigit() and not response.headers.get('Content-Encoding'):
+        metrics.total_bytes = int(content_length)
+
+    try:
+        with open(dest, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if not chunk:
+                    continue
+                f.write(chunk)
+                metrics.bytes_written += len(chunk)
+                if on_progress:
+                    on_progress(metrics)
+    finally:
+        response.close()
+        metrics.finished_at = time.monotonic()
+
+    if metrics.total_bytes is not None and metrics.bytes_written != metrics.total_bytes:
+        raise Exception(f"Incomplete download for {dest.name}: "
+                        f"{metrics.bytes_written}/{metrics.total_bytes} bytes")
+    return metrics
+
+
+def write_all(fd: int, data: bytes) -> None:
+    """向管道写入全部数据（os.write 可能只写入一部分）"""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def stream_response_to_pipe(response, fd: int, name: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                            on_progress: Optional[Callable[[DownloadMetrics], None]] = None,
+                            spool: Optional["SegmentedDownload"] = None) -> DownloadMetrics:
+    """把流式响应按块写入管道（不关闭 fd），返回下载指标；长度不足时抛出异常。
+    给出 spool 时每块先顺序写入其文件并记录续传状态，管道一端失败后可由 spool.run 从中断处续传"""
+    metrics = DownloadMetrics(name)
+    content_length = response.headers.get('Content-Length', '')
+    if content_length.isdigit() and not response.headers.get('Content-Encoding'):
+        metrics.total_bytes = int(content_length)
+
+    spool_file = None
+    try:
+        if spool is not None:
+            spool.start_sequential()
+            spool_file = open(spool.dest, 'r+b')
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if not chunk:
+                continue
+            if spool_file is not None:
+                # 先数据后状态，状态只会落后于实际数据
+                spool_file.write(chunk)
+                spool_file.flush()
+                spool.record_sequential(metrics.bytes_written + len(chunk))
+            write_all(fd, chunk)
+            metrics.bytes_written += len(chunk)
+            if on_progress:
+                on_progress(metrics)
+    finally:
+        response.close()
+        if spool_file is not None:
+            spool_file.close()
+            spool.record_sequential(metrics.bytes_written, force=True)
+        metrics.finished_at = time.monotonic()
+
+    if metrics.total_bytes is not None and metrics.bytes_written != metrics.total_bytes:
+        raise Exception(f"Incomplete download for {name}: "
+                        f"{metrics.bytes_written}/{metrics.total_bytes} bytes")
+    return metrics
+
+
+def parse_content_range_total(content_range: Optional[str]) -> Optional[int]:
+    """从 Content-Range（如 "bytes 0-0/12345"）中解析资源总长度"""
+    if not content_range:
+        return None
+    match = re.match(r'bytes\s+\d+-\d+/(\d+)', content_range.strip())
+    return int(match.group(1)) if match else None
+
+
+def state_path_for(dest: Path) -> Path:
+    """分段下载旁路状态文件的路径"""
+    return dest.with_name(dest.name + ".state.json")
+
+
+def remove_download_state(dest: Path) -> None:
+    state_path_for(dest).unlink(missing_ok=True)
+
+
+class SegmentedDownload:
+    """按 Range 分段并行下载到单个文件，已完成的字节记录在旁路状态文件中用于续传
+
+    状态文件记录资源标识、总长度、段大小以及每段已写入的字节数；
+    资源标识或长度变化时从头开始。写入顺序为先数据后状态，状态只会落后于实际数据。
+    """
+
+    def __init__(self, dest: Path, total_bytes: int, resource_id: str,
+                 segment_size: int = DEFAULT_SEGMENT_SIZE, max_workers: int = DEFAULT_PARALLEL_RANGES,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.dest = dest
+        self.total_bytes = total_bytes
+        self.resource_id = resource_id
+        self.segment_size = max(segment_size, chunk_size)
+        self.max_workers = max(1, max_workers)
+        self.chunk_size = chunk_size
+        self.state_path = state_path_for(dest)
+        self._lock = threading.Lock()
+        self._written: Dict[int, int] = {}
+        self._buffered = 0
+        self._last_flush = 0.0
+
+    def segments(self) -> List[Tuple[int, int]]:
+        """所有段的 [start, end]（闭区间）"""
+        return [(start, min(start + self.segment_size, self.total_bytes) - 1)
+                for start in range(0, self.total_bytes, self.segment_size)]
+
+    def _load_state(self) -> None:
+        self._written = {}
+        if not self.dest.exists() or not self.state_path.exists():
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if (state.get("resource") == self.resource_id
+                and state.get("total_bytes") == self.total_bytes
+                and state.get("segment_size") == self.segment_size
+                and self.dest.stat().st_size == self.total_bytes):
+            self._written = {int(k): int(v) for k, v in state.get("written", {}).items()}
+
+    def _save_state(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_flush < STATE_FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+        state = {
+            "resource": self.resource_id,
+            "total_bytes": self.total_bytes,
+            "segment_size": self.segment_size,
+            "written": {str(k): v for k, v in self._written.items()},
+        }
+        temp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+    def start_sequential(self) -> None:
+        """从头开始顺序写入（管道合并时的旁路副本）：预分配文件并写出初始状态"""
+        self._written = {}
+        with open(self.dest, 'wb') as f:
+            f.truncate(self.total_bytes)
+        with self._lock:
+            self._save_state(force=True)
+
+    def record_sequential(self, offset: int, force: bool = False) -> None:
+        """记录顺序写入已到达 offset（不含）；每块不超过一段，只有当前段与刚写满的上一段会变化"""
+        with self._lock:
+            current = max(offset - 1, 0) // self.segment_size * self.segment_size
+            for start in (current - self.segment_size, current):
+                if 0 <= start < self.total_bytes:
+                    length = min(self.segment_size, self.total_bytes - start)
+                    self._written[start] = max(0, min(offset - start, length))
+            self._save_state(force)
+
+    def downloaded_bytes(self) -> int:
+        with self._lock:
+            return sum(self._written.values())
+
+    def run(self, fetch_range: Callable[[int, int], Any],
+            on_progress: Optional[Callable[[DownloadMetrics], None]] = None) -> DownloadMetrics:
+        """下载所有未完成的段。fetch_range(start, end) 返回 206 流式响应或 None。"""
+        self._load_state()
+        if not self._written:
+            # 新下载：预分配目标文件，各段按偏移写入
+            with open(self.dest, 'wb') as f:
+                f.truncate(self.total_bytes)
+            self._save_state(force=True)
+
+        metrics = DownloadMetrics(self.dest.name)
+        metrics.total_bytes = self.total_bytes
+        metrics.peak_buffered_bytes = 0
+        metrics.resumed_bytes = self.downloaded_bytes()
+        if metrics.resumed_bytes:
+            print(f"断点续传 {self.dest.name}: 已完成 {metrics.resumed_bytes}/{self.total_bytes} 字节")
+
+        pending = [(start, end) for start, end in self.segments()
+                   if self._written.get(start, 0) < end - start + 1]
+
+        def report() -> None:
+            if on_progress:
+                on_progress(metrics)
+
+        def fetch_segment(segment: Tuple[int, int]) -> None:
+            start, end = segment
+            last_error: Optional[Exception] = None
+            for _ in range(SEGMENT_RETRIES):
+                offset = start + self._written.get(start, 0)
+                if offset > end:
+                    return
+                response = fetch_range(offset, end)
+                if response is None or getattr(response, 'status_code', 206) != 206:
+                    if response is not None:
+                        response.close()
+                    last_error = Exception(f"Range request failed for bytes={offset}-{end}")
+                    continue
+                try:
+                    with open(self.dest, 'r+b') as f:
+                        f.seek(offset)
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            if not chunk:
+                                continue
+                            chunk = chunk[:end - offset + 1]
+                            with self._lock:
+                                self._buffered += len(chunk)
+                                metrics.peak_buffered_bytes = max(metrics.peak_buffered_bytes, self._buffered)
+                            f.write(chunk)
+                            f.flush()
+                            offset += len(chunk)
+                            with self._lock:
+                                self._buffered -= len(chunk)
+                                self._written[start] = offset - start
+                                metrics.bytes_written += len(chunk)
+                                self._save_state()
+                            report()
+                            if offset > end:
+                                break
+                except Exception as e:
+                    last_error = e
+                finally:
+                    response.close()
+                if offset > end:
+                    with self._lock:
+                        self._save_state(force=True)
+                    return
+            raise last_error or Exception(f"Segment bytes={start}-{end} incomplete")
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, max(1, len(pending)))) as pool:
+                # list() 使任一段的异常在此处抛出
+                list(pool.map(fetch_segment, pending))
+        finally:
+            with self._lock:
+                self._save_state(force=True)
+            metrics.finished_at = time.monotonic()
+
+        if self.downloaded_bytes() != self.total_bytes:
+            raise Exception(f"Incomplete download for {self.dest.name}: "
+                            f"{self.downloaded_bytes()}/{self.total_bytes} bytes")
+        return metrics
@@ -0,0 +1,231 @@
+"""
+文件夹树索引：启动时扫描一次 videos/，之后由文件系统监视器增量更新（只重新列出发生变化的目录）。
+每个文件夹记录子文件夹、是否有 list.txt、已下载完成的视频文件及其大小，以及名字的排序键（只计算一次）；
+剧集数来自专辑清单（set_album），/api/folders 直接由内存中的索引返回，请求路径上不访问磁盘。
+"""
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from album import LIST_FILE, normalize_folder_path
+from collation import sort_key
+from quality import strip_policy_suffix
+
+# 下载或合并中的临时文件，不计入已下载
+TEMP_SUFFIXES = (".part.mp4", ".merging.mp4", ".part", ".tmp")
+# 一次返回的子树最大层数
+MAX_DEPTH = 10
+
+
+def is_video_file(name: str) -> bool:
+    return name.endswith(".mp4") and not name.endswith(TEMP_SUFFIXES) and not name.startswith(".")
+
+
+def is_folder_name(name: str) -> bool:
+    return not name.startswith(".") and not name.endswith(".tmp")
+
+
+class FolderNode:
+    """一个文件夹的索引条目"""
+    __slots__ = ("path", "name", "sort_key", "children", "has_list_file", "videos", "episode_files")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = path.rpartition("/")[2]
+        self.sort_key = sort_key(self.name)
+        self.children: Set[str] = set()
+        self.has_list_file = False
+        # 已下载完成的视频：文件名 -> 字节数
+        self.videos: Dict[str, int] = {}
+        # 专辑中各剧集的文件名（不含扩展名与策略标识），专辑尚未解析时为 None
+        self.episode_files: Optional[List[str]] = None
+
+    @property
+    def bytes(self) -> int:
+        return sum(self.videos.values())
+
+    def downloaded_count(self) -> int:
+        """已下载的剧集数；同一剧集的多个清晰度档位只算一次"""
+        stems = {strip_policy_suffix(name[:-len(".mp4")]) for name in self.videos}
+        if self.episode_files is None:
+            return len(stems)
+        return sum(1 for file_name in self.episode_files if file_name in stems)
+
+
+class FolderIndex:
+    """videos/ 目录树的内存索引，线程安全（监视线程写、事件循环读）"""
+
+    def __init__(self, videos_dir: Path):
+        self.videos_dir = Path(videos_dir)
+        self._lock = threading.RLock()
+        self._nodes: Dict[str, FolderNode] = {}
+        self.watching = False
+        self.rescans = 0
+
+    # --- 扫描 ---
+    def _list_dir(self, path: str) -> Optional[FolderNode]:
+        """列出单个目录（不递归），目录不存在时返回 None"""
+        node = FolderNode(path)
+        try:
+            with os.scandir(self.videos_dir / path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            if is_folder_name(entry.name):
+                                node.children.add(f"{path}/{entry.name}" if path else entry.name)
+                        elif entry.name == LIST_FILE:
+                            node.has_list_file = True
+                        elif is_video_file(entry.name):
+                            node.videos[entry.name] = entry.stat().st_size
+                    except OSError:
+                        continue
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        except PermissionError:
+            pass
+        return node
+
+    def _scan_tree(self, path: str, levels: Optional[int] = None) -> Dict[str, FolderNode]:
+        """扫描子树，levels 为向下扫描的层数（None 表示全部）"""
+        found: Dict[str, FolderNode] = {}
+        stack = [(path, 0)]
+        while stack:
+            current, level = stack.pop()
+            node = self._list_dir(current)
+            if node is None:
+                continue
+            found[current] = node
+            if levels is None or level < levels:
+                stack.extend((child, level + 1) for child in node.children)
+        return found
+
+    def _replace_subtree(self, path: str, nodes: Dict[str, FolderNode], levels: Optional[int] = None) -> None:
+        """用新扫描的节点替换子树，保留已知的剧集信息"""
+        with self._lock:
+            prefix = path + "/" if path else ""
+            for stale in [p for p in self._nodes if p == path or p.startswith(prefix)]:
+                depth = stale[len(prefix):].count("/") + 1 if stale != path else 0
+                if stale not in nodes and (levels is None or depth <= levels):
+                    del self._nodes[stale]
+            for node_path, node in nodes.items():
+                previous = self._nodes.get(node_path)
+                if previous is not None:
+                    node.episode_files = previous.episode_files
+                self._nodes[node_path] = node
+            self.rescans += 1
+
+    def build(self) -> int:
+        """全量扫描，返回文件夹数（不含根目录）"""
+        nodes = self._scan_tree("")
+        with self._lock:
+            albums = {p: n.episode_files for p, n in self._nodes.items()}
+            self._nodes = nodes
+            for node_path, episode_files in albums.items():
+                if node_path in nodes:
+                    nodes[node_path].episode_files = episode_files
+        return max(len(nodes) - 1, 0)
+
+    def refresh(self, path: str = "", levels: Optional[int] = None) -> None:
+        """重新扫描一个文件夹及其下 levels 层"""
+        path = normalize_folder_path(path)
+        self._replace_subtree(path, self._scan_tree(path, levels), levels)
+
+    def apply_changes(self, paths: Iterable[Path]) -> None:
+        """处理监视器报告的变化：重新列出变化所在的目录，新出现的子目录整棵扫描，消失的子目录移除"""
+        folders = set()
+        for path in paths:
+            try:
+                rel = normalize_folder_path(os.path.relpath(path, self.videos_dir))
+            except ValueError:
+                continue
+            if rel.startswith(".."):
+                continue
+            if rel in ("", "."):
+                self.build()
+                return
+            folders.add(rel.rpartition("/")[0])
+        for folder in folders:
+            self._rescan_folder(folder)
+
+    def _rescan_folder(self, path: str) -> None:
+        node = self._list_dir(path)
+        if node is None:
+            # 目录已不存在（其父目录的事件会移除它）
+            with self._lock:
+                if path in self._nodes:
+                    self._replace_subtree(path, {})
+            return
+        with self._lock:
+            previous = self._nodes.get(path)
+            if previous is None and path:
+                # 父目录尚未索引（如事件先于父目录的创建事件到达）：交给父目录处理
+                parent = path.rpartition("/")[0]
+                if parent not in self._nodes:
+                    return
+            old_children = previous.children if previous else set()
+            if previous is not None:
+                node.episode_files = previous.episode_files
+            self._nodes[path] = node
+            self.rescans += 1
+            for removed in old_children - node.children:
+                self._replace_subtree(removed, {})
+        for added in node.children - old_children:
+            self._replace_subtree(added, self._scan_tree(added))
+
+    # --- 专辑信息 ---
+    def set_album(self, path: str, episode_files: List[str]) -> None:
+        with self._lock:
+            node = self._nodes.get(normalize_folder_path(path))
+            if node is not None:
+                node.episode_files = list(episode_files)
+
+    def list_folders_with_list_file(self) -> List[str]:
+        with self._lock:
+            return [p for p, node in self._nodes.items() if node.has_list_file]
+
+    # --- 查询 ---
+    def __contains__(self, path: str) -> bool:
+        return normalize_folder_path(path) in self._nodes
+
+    def _total_bytes(self, path: str) -> int:
+        node = self._nodes[path]
+        return node.bytes + sum(self._total_bytes(child) for child in node.children if child in self._nodes)
+
+    def _to_dict(self, node: FolderNode, depth: int) -> dict:
+        children = []
+        if depth > 0:
+            children = self._children(node, depth - 1)
+        parent_path = node.path.rpartition("/")[0]
+        return {
+            "name": node.name,
+            "path": node.path,
+            "parent_path": parent_path or None,
+            "children": children,
+            "has_list_file": node.has_list_file,
+            "video_count": len(node.episode_files) if node.episode_files is not None else 0,
+            "downloaded_count": node.downloaded_count(),
+            "bytes": node.bytes,
+            "total_bytes": self._total_bytes(node.path),
+            "depth": node.path.count("/"),
+            "is_folder": True
+        }
+
+    def _children(self, node: FolderNode, depth: int) -> List[dict]:
+        nodes = sorted((self._nodes[child] for child in node.children if child in self._nodes),
+                       key=lambda child: child.sort_key)
+        return [self._to_dict(child, depth) for child in nodes]
+
+    def children(self, path: str = "", depth: int = 0) -> Optional[List[dict]]:
+        """返回文件夹的直接子文件夹（depth > 0 时每个子文件夹再带 depth 层子树）；文件夹不存在时返回 None"""
+        depth = max(0, min(depth, MAX_DEPTH))
+        with self._lock:
+            node = self._nodes.get(normalize_folder_path(path))
+            if node is None:
+                return None
+            return self._children(node, depth)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"name": "folder_index", "entries": len(self._nodes), "rescans": self.rescans,
+                    "watching": self.watching}
@@ -0,0 +1,295 @@
+"""
+文件系统监视：Linux 上直接通过 ctypes 调用 inotify（无需第三方依赖），
+其他平台安装了 watchdog 时使用其原生后端，都不可用时定期轮询目录树比较 mtime 与大小。
+变化的路径经短暂合并后批量回调（在监视线程中调用，回调需线程安全）。
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+    WATCHDOG_AVAILABLE = False
+
+# 监视后端：auto / inotify / watchdog / poll / off
+FS_WATCH_BACKEND = os.getenv("FS_WATCH", "auto")
+# 轮询后端的扫描间隔（秒）
+FS_POLL_INTERVAL = float(os.getenv("FS_POLL_INTERVAL", "5"))
+# 合并连续变化的等待时间（秒）
+FS_WATCH_DEBOUNCE = 0.2
+
+ChangeCallback = Callable[[Set[Path]], None]
+
+# inotify 事件掩码（只关心写入完成、增删与改名，不订阅每次写入的 IN_MODIFY）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Debouncer:
+    """收集变化的路径，首个变化 delay 秒后一次性回调（持续写入时也按此间隔定期回调）"""
+
+    def __init__(self, callback: ChangeCallback, delay: float = FS_WATCH_DEBOUNCE):
+        self._callback = callback
+        self._delay = delay
+        self._lock = threading.Lock()
+        self._pending: Set[Path] = set()
+        self._timer: Optional[threading.Timer] = None
+
+    def add(self, paths: Iterable[Path]) -> None:
+        with self._lock:
+            self._pending.update(paths)
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self._delay, self._flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush(self) -> None:
+        with self._lock:
+            paths, self._pending = self._pending, set()
+            self._timer = None
+        if not paths:
+            return
+        try:
+            self._callback(paths)
+        except Exception as e:
+            print(f"处理文件变化失败: {e}")
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = None
+            self._pending.clear()
+
+
+class InotifyWatcher:
+    """递归监视目录树（inotify 本身不递归，新建的子目录在事件到达时补加监视）"""
+    name = "inotify"
+
+    def __init__(self, root: Path, on_change: ChangeCallback):
+        self.root = Path(root)
+        self._debouncer = _Debouncer(on_change)
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watches: Dict[int, Path] = {}
+        self._stop_r, self._stop_w = os.pipe()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def supported() -> bool:
+        return hasattr(os, "O_CLOEXEC") and os.uname().sysname == "Linux"
+
+    def _add_watch(self, path: Path) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self._watches[wd] = path
+        elif ctypes.get_errno() == errno.ENOSPC:
+            print(f"inotify 监视数已达上限（fs.inotify.max_user_watches），未监视: {path}")
+
+    def _add_tree(self, top: Path) -> None:
+        self._add_watch(top)
+        for dirpath, dirnames, _ in os.walk(top):
+            for name in dirnames:
+                self._add_watch(Path(dirpath) / name)
+
+    def _forget_tree(self, top: Path) -> None:
+        """目录被移出后其监视仍指向旧路径，先移除，移入的新位置会重新添加"""
+        for wd, path in list(self._watches.items()):
+            if path == top or top in path.parents:
+                self._libc.inotify_rm_watch(self._fd, wd)
+                self._watches.pop(wd, None)
+
+    def start(self) -> None:
+        self._add_tree(self.root)
+        self._thread = threading.Thread(target=self._run, name="fs-watch-inotify", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            readable, _, _ = select.select([self._fd, self._stop_r], [], [])
+            if self._stop_r in readable:
+                return
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            self._debouncer.add(self._parse(data))
+
+    def _parse(self, data: bytes) -> Set[Path]:
+        changed: Set[Path] = set()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            raw_name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += _EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出：通知整棵树需要重新扫描
+                changed.add(self.root)
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            parent = self._watches.get(wd)
+            if parent is None:
+                continue
+            path = parent / os.fsdecode(raw_name) if raw_name else parent
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path)
+                elif mask & IN_MOVED_FROM:
+                    self._forget_tree(path)
+            changed.add(path)
+        return changed
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            os.write(self._stop_w, b"x")
+            self._thread.join(timeout=2)
+            self._thread = None
+        self._debouncer.cancel()
+        for fd in (self._fd, self._stop_r, self._stop_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class _WatchdogHandler(FileSystemEventHandler):
+    def __init__(self, debouncer: _Debouncer):
+        super().__init__()
+        self._debouncer = debouncer
+
+    def on_any_event(self, event) -> None:
+        # 部分平台没有 closed 事件，文件改动只能依赖 modified，由 _Debouncer 合并
+        paths = [Path(os.fsdecode(event.src_path))]
+        if getattr(event, "dest_path", None):
+            paths.append(Path(os.fsdecode(event.dest_path)))
+        self._debouncer.add(paths)
+
+
+class WatchdogWatcher:
+    name = "watchdog"
+
+    def __init__(self, root: Path, on_change: ChangeCallback):
+        self.root = Path(root)
+        self._debouncer = _Debouncer(on_change)
+        self._observer = Observer()
+        self._observer.daemon = True
+        self._observer.schedule(_WatchdogHandler(self._debouncer), str(self.root), recursive=True)
+
+    def start(self) -> None:
+        self._observer.start()
+
+    def stop(self) -> None:
+        self._observer.stop()
+        self._observer.join(timeout=2)
+        self._debouncer.cancel()
+
+
+def snapshot_tree(root: Path) -> Dict[Path, Tuple[int, int]]:
+    """目录树中每个目录与文件的 (mtime_ns, 大小)"""
+    snapshot: Dict[Path, Tuple[int, int]] = {}
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        stat_result = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    path = Path(entry.path)
+                    snapshot[path] = (stat_result.st_mtime_ns, stat_result.st_size)
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(path)
+        except OSError:
+            continue
+    return snapshot
+
+
+class PollingWatcher:
+    """定期扫描目录树，与上次的快照比较"""
+    name = "poll"
+
+    def __init__(self, root: Path, on_change: ChangeCallback, interval: float = FS_POLL_INTERVAL):
+        self.root = Path(root)
+        self._on_change = on_change
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._snapshot: Dict[Path, Tuple[int, int]] = {}
+
+    def start(self) -> None:
+        self._snapshot = snapshot_tree(self.root)
+        self._thread = threading.Thread(target=self._run, name="fs-watch-poll", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            current = snapshot_tree(self.root)
+            previous, self._snapshot = self._snapshot, current
+            changed = {path for path in current.keys() | previous.keys()
+                       if current.get(path) != previous.get(path)}
+            if changed:
+                try:
+                    self._on_change(changed)
+                except Exception as e:
+                    print(f"处理文件变化失败: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+
+def create_watcher(root: Path, on_change: ChangeCallback, backend: str = FS_WATCH_BACKEND):
+    """按配置创建并启动监视器；backend 为 off 或都不可用时返回 None"""
+    candidates = {
+        "auto": ("inotify", "watchdog", "poll"),
+        "inotify": ("inotify",),
+        "watchdog": ("watchdog",),
+        "poll": ("poll",),
+    }.get(backend, ())
+    for name in candidates:
+        try:
+            if name == "inotify" and InotifyWatcher.supported():
+                watcher = InotifyWatcher(root, on_change)
+            elif name == "watchdog" and WATCHDOG_AVAILABLE:
+                watcher = WatchdogWatcher(root, on_change)
+            elif name == "poll":
+                watcher = PollingWatcher(root, on_change)
+            else:
+                continue
+            watcher.start()
+            return watcher
+        except OSError as e:
+            print(f"文件监视后端 {name} 不可用: {e}")
+    return None
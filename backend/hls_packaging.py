@@ -0,0 +1,130 @@
+"""
+HLS 打包：下载合并完成后，用本地 ffmpeg（-c copy，不转码）把视频切成 fMP4 分片与播放列表，
+B 站提供更低清晰度的流时可额外打包为其他档位，由主播放列表（master.m3u8）汇总，
+播放器据网络状况自适应切换。
+"""
+import os
+import re
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from cache import LRUCache
+
+# 是否在下载完成后打包 HLS（可选功能，默认关闭）
+HLS_ENABLED = os.getenv("HLS_PACKAGING", "0") == "1"
+# 额外打包的低清晰度档位（最大高度，逗号分隔），如 "480,360"；留空则只打包下载的档位
+HLS_EXTRA_HEIGHTS = [int(h) for h in os.getenv("HLS_EXTRA_HEIGHTS", "480").split(",") if h.strip().isdigit()]
+# 每个分片的目标时长（秒）
+HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "4"))
+# 内存分片缓存上限（字节）
+HLS_SEGMENT_CACHE_BYTES = int(os.getenv("HLS_SEGMENT_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+MASTER_PLAYLIST = "master.m3u8"
+MEDIA_PLAYLIST = "index.m3u8"
+
+HLS_MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+}
+
+
+def hls_available() -> bool:
+    return HLS_ENABLED and shutil.which("ffmpeg") is not None
+
+
+def rendition_name(video: Dict) -> str:
+    """档位目录名，如 720p"""
+    return f"{video.get('height') or video.get('id')}p"
+
+
+def select_extra_renditions(videos: List[Dict], source: Dict, heights: Iterable[int]) -> List[Dict]:
+    """为每个目标高度挑选不超过该高度、码率最高的流（优先与下载档位相同的编码）；跳过与已选重复的档位"""
+    chosen: List[Dict] = []
+    taken = {rendition_name(source)}
+    for max_height in sorted(set(heights), reverse=True):
+        candidates = [v for v in videos if v.get('height') and v['height'] <= max_height
+                      and v['height'] < (source.get('height') or 0)]
+        same_codec = [v for v in candidates if v.get('codecid') == source.get('codecid')]
+        pool = same_codec or candidates
+        if not pool:
+            continue
+        best = max(pool, key=lambda v: (v['height'], v.get('bandwidth', 0)))
+        if rendition_name(best) not in taken:
+            taken.add(rendition_name(best))
+            chosen.append(best)
+    return chosen
+
+
+def package_rendition(video_input: Path, audio_input: Path, out_dir: Path,
+                      segment_seconds: int = HLS_SEGMENT_SECONDS) -> None:
+    """把一路视频与音频（-c copy）切成 fMP4 分片；先写入临时目录，完成后再改名，读者不会看到半成品"""
+    temp_dir = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    temp_dir.mkdir(parents=True)
+    command = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-i', str(video_input), '-i', str(audio_input),
+        '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy',
+        '-f', 'hls', '-hls_time', str(segment_seconds), '-hls_playlist_type', 'vod',
+        '-hls_segment_type', 'fmp4', '-hls_fmp4_init_filename', 'init.mp4',
+        '-hls_segment_filename', str(temp_dir / 'seg_%05d.m4s'),
+        str(temp_dir / MEDIA_PLAYLIST),
+    ]
+    try:
+        subprocess.run(command, shell=False, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise Exception(f"HLS packaging failed: {e.stderr}")
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(temp_dir, out_dir)
+
+
+def playlist_stats(rendition_dir: Path) -> Dict[str, int]:
+    """由媒体播放列表与分片大小估算档位的平均与峰值码率（bit/s）"""
+    text = (rendition_dir / MEDIA_PLAYLIST).read_text(encoding='utf-8')
+    durations = [float(d) for d in re.findall(r'#EXTINF:([\d.]+)', text)]
+    segments = re.findall(r'^(seg_\d+\.m4s)$', text, re.M)
+    sizes = [(rendition_dir / name).stat().st_size for name in segments]
+    total_seconds = sum(durations) or 1.0
+    average = int(sum(sizes) * 8 / total_seconds)
+    peak = max((int(size * 8 / max(d, 0.001)) for size, d in zip(sizes, durations)), default=average)
+    return {"average": average, "peak": max(peak, average)}
+
+
+def write_master_playlist(package_dir: Path, renditions: List[Dict], audio: Optional[Dict] = None) -> None:
+    """写入主播放列表，按码率从高到低列出各档位"""
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for video in sorted(renditions, key=lambda v: v['stats']['peak'], reverse=True):
+        attributes = [f"BANDWIDTH={video['stats']['peak']}", f"AVERAGE-BANDWIDTH={video['stats']['average']}"]
+        if video.get('width') and video.get('height'):
+            attributes.append(f"RESOLUTION={video['width']}x{video['height']}")
+        codecs = [c for c in (video.get('codecs'), (audio or {}).get('codecs')) if c]
+        if codecs:
+            attributes.append(f'CODECS="{",".join(codecs)}"')
+        lines.append("#EXT-X-STREAM-INF:" + ",".join(attributes))
+        lines.append(f"{video['name']}/{MEDIA_PLAYLIST}")
+    temp_path = package_dir / (MASTER_PLAYLIST + ".tmp")
+    temp_path.write_text("\n".join(lines) + "\n", encoding='utf-8')
+    os.replace(temp_path, package_dir / MASTER_PLAYLIST)
+
+
+class SegmentCache:
+    """HLS 分片与播放列表的内存缓存，按 (路径, mtime_ns, 大小) 失效，总字节数受限"""
+
+    def __init__(self, max_bytes: int = HLS_SEGMENT_CACHE_BYTES):
+        self._cache = LRUCache("hls_segments", max_entries=4096, max_bytes=max_bytes,
+                               sizeof=lambda value: len(value))
+
+    def read(self, path: Path, stat_result: os.stat_result) -> bytes:
+        key = (str(path), stat_result.st_mtime_ns, stat_result.st_size)
+        data = self._cache.get(key)
+        if data is None:
+            data = path.read_bytes()
+            self._cache.set(key, data)
+        return data
+
+    def stats(self) -> Dict:
+        return self._cache.stats()
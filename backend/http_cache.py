@@ -0,0 +1,132 @@
+"""
+HTTP 缓存：为本地文件生成强校验器（ETag / Last-Modified），按规则设置 Cache-Control，
+对条件请求直接返回 304（不打开文件）；并为前端静态资源生成内容哈希指纹 URL。
+"""
+import asyncio
+import hashlib
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+from cache import LRUCache
+
+# 不超过此大小的文件用内容哈希作 ETag，更大的文件（视频）用 大小+修改时间
+CONTENT_HASH_MAX_BYTES = 4 * 1024 * 1024
+
+# 缓存策略
+IMMUTABLE = "public, max-age=31536000, immutable"
+# 按 BV 号与分P命名、原子写入的文件：内容不会原地改变，长期缓存
+LONG_LIVED = "public, max-age=2592000"
+# 合并完成的视频：缓存一天，之后凭校验器重新验证
+REVALIDATE_DAILY = "public, max-age=86400"
+# 入口文件：每次都重新验证
+NO_CACHE = "no-cache"
+
+# (路径, mtime_ns, 大小) -> 内容哈希
+_digest_cache = LRUCache("etag_digests", max_entries=4096)
+
+NOT_MODIFIED_HEADERS = ("cache-control", "etag", "last-modified", "vary", "expires")
+
+
+def _content_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(256 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+async def file_etag(path: Path, stat_result: os.stat_result) -> str:
+    """强 ETag：小文件取内容哈希（按修改时间与大小缓存），大文件取大小与纳秒修改时间"""
+    if stat_result.st_size > CONTENT_HASH_MAX_BYTES:
+        return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+    key = (str(path), stat_result.st_mtime_ns, stat_result.st_size)
+    digest = _digest_cache.get(key)
+    if digest is None:
+        digest = await asyncio.to_thread(_content_digest, path)
+        _digest_cache.set(key, digest)
+    return f'"{digest}"'
+
+
+def is_not_modified(request_headers: Mapping[str, str], etag: str, last_modified: str) -> bool:
+    """按 RFC 9110：有 If-None-Match 时只比较 ETag，否则比较 If-Modified-Since"""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag in tags
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def cached_file_response(request: Request, path: Path, cache_control: str,
+                               media_type: Optional[str] = None,
+                               headers: Optional[Dict[str, str]] = None) -> Response:
+    """带校验器与缓存策略的文件响应；条件请求命中时返回 304"""
+    stat_result = await asyncio.to_thread(os.stat, path)
+    response_headers = dict(headers or {})
+    response_headers["ETag"] = await file_etag(path, stat_result)
+    response_headers["Last-Modified"] = formatdate(stat_result.st_mtime, usegmt=True)
+    response_headers["Cache-Control"] = cache_control
+    if request.method in ("GET", "HEAD") and is_not_modified(
+            request.headers, response_headers["ETag"], response_headers["Last-Modified"]):
+        return Response(status_code=304, headers={
+            k: v for k, v in response_headers.items() if k.lower() in NOT_MODIFIED_HEADERS})
+    return FileResponse(path, media_type=media_type, headers=response_headers, stat_result=stat_result)
+
+
+class AssetFingerprints:
+    """前端资源的内容哈希指纹：app.js -> app.<hash>.js；文件变化后自动重新计算"""
+
+    def __init__(self, root: Path, names: Iterable[str]):
+        self.root = root
+        self.names = list(names)
+        # 名称 -> (mtime_ns, 大小, 哈希)
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+
+    def digest(self, name: str) -> Optional[str]:
+        path = self.root / name
+        try:
+            stat_result = path.stat()
+        except OSError:
+            return None
+        cached = self._hashes.get(name)
+        if cached and cached[0] == stat_result.st_mtime_ns and cached[1] == stat_result.st_size:
+            return cached[2]
+        digest = _content_digest(path)[:12]
+        self._hashes[name] = (stat_result.st_mtime_ns, stat_result.st_size, digest)
+        return digest
+
+    def url_for(self, name: str) -> str:
+        digest = self.digest(name)
+        if not digest:
+            return name
+        stem, dot, ext = name.rpartition('.')
+        return f"{stem}.{digest}.{ext}" if dot else f"{name}.{digest}"
+
+    def resolve(self, requested: str) -> Tuple[str, bool]:
+        """把请求的文件名还原为真实文件名；返回 (文件名, 指纹是否与当前内容一致)"""
+        for name in self.names:
+            stem, _, ext = name.rpartition('.')
+            match = re.fullmatch(re.escape(stem) + r'\.([0-9a-f]{12})\.' + re.escape(ext), requested)
+            if match:
+                return name, match.group(1) == self.digest(name)
+        return requested, False
+
+    def rewrite_html(self, html: str) -> str:
+        """把 HTML 中对这些资源的引用（可带 ?v= 查询串）替换为指纹 URL"""
+        for name in self.names:
+            pattern = r'(\s(?:src|href)=")' + re.escape(name) + r'(?:\?[^"]*)?"'
+            html = re.sub(pattern, lambda m, n=name: f'{m.group(1)}{self.url_for(n)}"', html)
+        return html
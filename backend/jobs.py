@@ -0,0 +1,176 @@
+"""
+进程内下载任务调度：有界工作协程池、任务ID与按字节的进度上报
+"""
+import asyncio
+import time
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+from models import DownloadStatus
+
+# 任务终态
+TERMINAL_STATES = ("completed", "failed")
+
+# 任务执行函数：接收任务、调用方附带的参数与进度上报函数
+JobRunner = Callable[[DownloadStatus, Dict[str, Any], Callable[..., None]], Awaitable[Optional[str]]]
+
+
+class SchedulerNotRunning(RuntimeError):
+    """调度器未启动（或已停止），或在其事件循环之外提交任务"""
+
+
+class DownloadScheduler:
+    """下载调度器：任务排队后由固定数量的工作协程依次执行"""
+
+    def __init__(self, runner: JobRunner, max_workers: int = 2, max_finished_jobs: int = 200):
+        self._runner = runner
+        self._max_workers = max(1, max_workers)
+        self._max_finished_jobs = max_finished_jobs
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._jobs: Dict[str, DownloadStatus] = {}
+        self._payloads: Dict[str, Dict[str, Any]] = {}
+        # 去重键 -> 未结束的任务ID，同一内容的重复提交复用同一任务
+        self._active_by_key: Dict[str, str] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # --- 生命周期 ---
+    async def start(self) -> None:
+        if self._workers:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        for i in range(self._max_workers):
+            self._workers.append(asyncio.create_task(self._worker(i)))
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # 停止后不再接受任务，否则任务会停在 pending
+        self._queue = None
+
+    @property
+    def running(self) -> bool:
+        return self._queue is not None
+
+    # --- 任务管理 ---
+    def submit(self, bv_id: str, payload: Dict[str, Any], folder_path: str = "",
+               page: Optional[int] = None, video_url: str = "", key: Optional[str] = None) -> DownloadStatus:
+        """创建任务并排队，立即返回 pending 状态；key 相同且未结束的任务直接复用"""
+        if self._queue is None:
+            raise SchedulerNotRunning("DownloadScheduler is not running; start() it from the app lifespan first")
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not self._loop:
+            # asyncio.Queue 与工作协程属于 start() 时的事件循环，在其他线程或循环中提交的任务不会被执行
+            raise SchedulerNotRunning("DownloadScheduler.submit must be called on the event loop it was started on")
+        if key is not None:
+            active = self._jobs.get(self._active_by_key.get(key, ""))
+            if active and active.status not in TERMINAL_STATES:
+                return active
+        job = DownloadStatus(
+            task_id=uuid.uuid4().hex,
+            bv_id=bv_id,
+            status="pending",
+            folder_path=folder_path,
+            page=page,
+            video_url=video_url,
+        )
+        self._jobs[job.task_id] = job
+        self._payloads[job.task_id] = payload
+        if key is not None:
+            self._active_by_key[key] = job.task_id
+        self._queue.put_nowait(job.task_id)
+        self._prune()
+        return job
+
+    def get(self, task_id: str) -> Optional[DownloadStatus]:
+        return self._jobs.get(task_id)
+
+    def list(self) -> List[DownloadStatus]:
+        return sorted(self._jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+    def update(self, task_id: str, **fields: Any) -> None:
+        """更新任务状态并通知订阅者（仅在事件循环线程调用）"""
+        job = self._jobs.get(task_id)
+        if not job or job.status in TERMINAL_STATES:
+            return
+        for name, value in fields.items():
+            setattr(job, name, value)
+        if job.total_bytes and "progress" not in fields:
+            job.progress = min(100, int(job.bytes_downloaded * 100 / job.total_bytes))
+        job.updated_at = datetime.now()
+        if job.status in TERMINAL_STATES:
+            for key in [k for k, v in self._active_by_key.items() if v == task_id]:
+                del self._active_by_key[key]
+        for queue in self._subscribers.get(task_id, ()):
+            queue.put_nowait(job.model_copy())
+
+    def thread_reporter(self, task_id: str, min_interval: float = 0.25) -> Callable[..., None]:
+        """返回可在工作线程中调用的进度上报函数；字节进度按最小间隔节流"""
+        loop = self._loop
+        last_sent = [0.0]
+
+        def report(**fields: Any) -> None:
+            now = time.monotonic()
+            if set(fields) <= {"bytes_downloaded", "total_bytes"} and now - last_sent[0] < min_interval:
+                return
+            last_sent[0] = now
+            loop.call_soon_threadsafe(lambda: self.update(task_id, **fields))
+
+        return report
+
+    async def subscribe(self, task_id: str) -> AsyncIterator[DownloadStatus]:
+        """依次产出任务状态快照，直到任务结束"""
+        job = self._jobs.get(task_id)
+        if not job:
+            return
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        try:
+            yield job.model_copy()
+            while job.status not in TERMINAL_STATES:
+                snapshot = await queue.get()
+                yield snapshot
+                if snapshot.status in TERMINAL_STATES:
+                    break
+        finally:
+            subscribers = self._subscribers.get(task_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    self._subscribers.pop(task_id, None)
+
+    def _prune(self) -> None:
+        """只保留最近的若干个已结束任务"""
+        finished = [j for j in self._jobs.values() if j.status in TERMINAL_STATES]
+        if len(finished) <= self._max_finished_jobs:
+            return
+        finished.sort(key=lambda j: j.updated_at)
+        for job in finished[:len(finished) - self._max_finished_jobs]:
+            self._jobs.pop(job.task_id, None)
+            self._payloads.pop(job.task_id, None)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            task_id = await self._queue.get()
+            job = self._jobs.get(task_id)
+            payload = self._payloads.pop(task_id, {})
+            if not job:
+                continue
+            try:
+                self.update(task_id, status="downloading")
+                await self._runner(job, payload, self.thread_reporter(task_id))
+                self.update(task_id, status="completed", progress=100, message="")
+            except asyncio.CancelledError:
+                self.update(task_id, status="failed", message="cancelled")
+                raise
+            except Exception as e:
+                print(f"下载任务失败 {task_id}: {e}")
+                self.update(task_id, status="failed", message=str(e))
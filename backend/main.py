@@ -1,22 +1,52 @@
 import os
 import re
-import subprocess
 import requests
 import json
 import time
-import locale
 from functools import reduce
 from hashlib import md5
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 import asyncio
 import aiohttp
-from typing import Optional, Dict, List, Any
+import aiofiles
+from typing import Optional, Dict, List, Any, Callable
 import random
 import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import formatdate
+from urllib.parse import urlparse
+
+from album import LIST_FILE, AlbumManifests, ListFileIndex, episode_id, parse_episode_id, sanitize_filename
+from download_pipeline import (SegmentedDownload, parse_content_range_total, remove_download_state, stream_response_to_pipe,
+                               stream_response_to_file)
+from cache import LRUCache
+from cover_prefetch import CoverPrefetcher
+from folder_index import FolderIndex
+from fs_watch import create_watcher
+from http_cache import (IMMUTABLE, LONG_LIVED, NO_CACHE, REVALIDATE_DAILY, AssetFingerprints,
+                        cached_file_response, is_not_modified)
+from hls_packaging import (HLS_EXTRA_HEIGHTS, HLS_MEDIA_TYPES, MASTER_PLAYLIST, SegmentCache, hls_available,
+                           package_rendition, playlist_stats, rendition_name, select_extra_renditions,
+                           write_master_playlist)
+from jobs import DownloadScheduler, SchedulerNotRunning
+from merge_pool import MergeError, MergePool, pipe_merge_available
+from metadata_store import MetadataEntry, MetadataStore
+from progressive import (GrowingFileResponse, ProgressiveRegistry, fragmented_output_args, notify_when_playable,
+                         progressive_available, remux_progressively)
+from rate_limiter import PLAY, PREFETCH, RateLimiter, outbound_priority
+from quality import (DEFAULT_POLICY, POLICY_KEY_PATTERN, QualityPolicy, StreamSelection, dash_qn, find_variant,
+                     parse_representations, resolve_policy, select_streams, strip_policy_suffix, variant_height)
+from singleflight import SingleFlight
+from state_extractor import STATE_CHUNK_SIZE, extract_video_pages, read_initial_state_async, read_play_session
+from subtitle_index import SubtitleTrackIndex
+from thumbnails import MEDIA_TYPES, ThumbnailPipeline, choose_variant
+from video_serving import serve_file_with_ranges
+from models import DownloadRequest, DownloadStatus
 
 # 导入配置
 try:
@@ -31,25 +61,30 @@ VIDEOS_DIR = BASE_DIR / "videos"
 FRONTEND_DIR = BASE_DIR / "frontend"
 COVERS_DIR = BASE_DIR / "covers"  # 封面缓存目录
 SUBTITLES_DIR = BASE_DIR / "subtitles"  # 字幕缓存目录
+HLS_DIR = BASE_DIR / "hls"  # HLS 打包输出目录（按 BV 号与分P）
+# 下载临时文件目录（回退到临时文件合并、续传、边下边播时使用），不放在用户可见的专辑目录
+SCRATCH_DIR = Path(os.getenv("DOWNLOAD_SCRATCH_DIR", str(BASE_DIR / "scratch")))
+METADATA_DB = BASE_DIR / "metadata.db"  # 分P等元数据的持久化缓存
 # Ensure the main directories exist
 VIDEOS_DIR.mkdir(exist_ok=True)
 COVERS_DIR.mkdir(exist_ok=True)
 SUBTITLES_DIR.mkdir(exist_ok=True)
+HLS_DIR.mkdir(exist_ok=True)
+SCRATCH_DIR.mkdir(parents=True, exist_ok=True)
 
-app = FastAPI(title="Video Player Backend")
-
-# 设置locale以支持中文排序
-try:
-    locale.setlocale(locale.LC_COLLATE, 'zh_CN.UTF-8')
-except locale.Error:
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动与关闭的具体步骤见文件末尾的 startup / shutdown"""
+    await startup()
     try:
-        locale.setlocale(locale.LC_COLLATE, 'Chinese (Simplified)_China.936')
-    except locale.Error:
-        try:
-            locale.setlocale(locale.LC_COLLATE, 'zh_CN')
-        except locale.Error:
-            # 如果都失败了，使用默认排序
-            pass
+        yield
+    finally:
+        await shutdown()
+
+app = FastAPI(title="Video Player Backend", lifespan=lifespan)
+
+# 前端资源的内容哈希指纹（index.html 中的引用会被替换为 app.<hash>.js 等）
+asset_fingerprints = AssetFingerprints(FRONTEND_DIR, ["app.js", "styles.css"])
 
 # 挂载前端静态文件服务
 app.mount("/frontend", StaticFiles(directory=str(FRONTEND_DIR)), name="frontend")
@@ -64,32 +99,6 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-# 中文友好的排序函数
-def chinese_sort_key(text: str) -> str:
-    """生成中文友好的排序键"""
-    import unicodedata
-    # 将中文字符转换为拼音或者使用Unicode序号
-    normalized = unicodedata.normalize('NFKD', text)
-    # 简单的排序策略：数字优先，然后是字母，最后是中文
-    result = []
-    for char in normalized:
-        if char.isdigit():
-            result.append(('0', char))  # 数字排在最前
-        elif char.isascii() and char.isalpha():
-            result.append(('1', char.lower()))  # 字母排在中间
-        else:
-            result.append(('2', char))  # 中文等其他字符排在最后
-    return result
-
-def sort_folders_chinese(folders: List[dict]) -> List[dict]:
-    """按中文友好的方式排序文件夹"""
-    try:
-        # 尝试使用locale排序
-        return sorted(folders, key=lambda x: locale.strxfrm(x['name']))
-    except (AttributeError, TypeError):
-        # 如果locale排序失败，使用自定义排序
-        return sorted(folders, key=lambda x: chinese_sort_key(x['name']))
-
 # --- Bilibili Downloader Logic (Adapted from 1.py) ---
 
 HEADERS = {
@@ -100,27 +109,55 @@ HEADERS = {
 # 全局异步HTTP客户端
 _http_session: Optional[aiohttp.ClientSession] = None
 
-# 内存缓存
-_video_parts_cache: Dict[str, Any] = {}
-_wbi_key_cache: Optional[str] = None
-_wbi_key_cache_time: float = 0
+_metadata_store = MetadataStore(METADATA_DB)
+# 元数据有效期（秒）；过期后先返回旧值，再在后台刷新
+_METADATA_TTL = float(os.getenv("METADATA_TTL", str(12 * 3600)))
+# 超过该时长（秒）的条目不再返回，启动预热时也忽略
+_METADATA_MAX_AGE = float(os.getenv("METADATA_MAX_AGE", str(30 * 24 * 3600)))
+# 内存缓存（值为 MetadataEntry，带抓取时间与软 TTL），有界 LRU，由 SQLite 持久化层兜底
+_video_parts_cache = LRUCache(
+    "video_parts",
+    max_entries=int(os.getenv("PARTS_CACHE_MAX_ENTRIES", "512")),
+    max_bytes=int(os.getenv("PARTS_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    ttl=_METADATA_MAX_AGE,
+)
+# 后台刷新任务的强引用，避免任务被垃圾回收
+_background_tasks: set = set()
+# 字幕轨道索引（持久化于 subtitles/ 下）：每个 cid 在有效期内最多外呼一次；
+# 有用户字幕与无字幕的结果分别设置有效期
+_subtitle_index = SubtitleTrackIndex(
+    SUBTITLES_DIR / "tracks_index.json",
+    positive_ttl=float(os.getenv("SUBTITLE_POSITIVE_TTL", str(7 * 24 * 3600))),
+    negative_ttl=float(os.getenv("SUBTITLE_NEGATIVE_TTL", str(24 * 3600))),
+)
+# 详情接口并发检查字幕的上限（所有外呼仍受全局限流约束）
+_DETAILS_CONCURRENCY = int(os.getenv("DETAILS_CONCURRENCY", "4"))
+
+# 按 key 合并并发的下载/封面/字幕请求
+_singleflight = SingleFlight()
+
+# 最近完成的下载指标（速率、峰值缓冲），供 /api/downloads/metrics 查看
+_recent_download_metrics: deque = deque(maxlen=50)
+# 边下边播中的 .part 文件
+progressive_registry = ProgressiveRegistry()
+# 同时进行的下载任务数
+_DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "2"))
+# ffmpeg 合并池（文件合并并发数 MERGE_CONCURRENCY，超时 MERGE_TIMEOUT）；
+# 管道合并贯穿整个下载，名额与下载任务数一致，CPU 上限不限制下载并发
+merge_pool = MergePool(pipe_concurrency=_DOWNLOAD_WORKERS)
+# 管道合并时是否同时把两路流顺序写入 scratch 并记录续传状态（合并失败后从中断处续传）；
+# 默认关闭：最终文件是唯一的写盘，失败时从头下载
+_PIPE_MERGE_SPOOL = os.getenv("PIPE_MERGE_SPOOL", "0") == "1"
+# WBI 签名密钥缓存（5分钟有效期），按 Cookie 区分
+_wbi_key_cache = LRUCache("wbi_keys", max_entries=8, ttl=300)
 
 # --- Outbound request limiting & backoff ---
-# 最大并发外呼数（根据实际情况微调）
-_MAX_CONCURRENT_OUTBOUND = int(os.getenv("OUTBOUND_MAX_CONCURRENCY", "3"))
-# 目标每秒请求数（全局），通过请求间隔实现（带抖动）
-_MAX_QPS = float(os.getenv("OUTBOUND_MAX_QPS", "2"))  # e.g. 2 req/s -> 500ms 基准间隔
 # 429/403 冷却秒数上限（指数退避中的最大冷却）
 _MAX_COOLDOWN_SECONDS = int(os.getenv("OUTBOUND_MAX_COOLDOWN", "300"))
 
-# 异步并发控制与时序控制
-_outbound_sem = asyncio.Semaphore(_MAX_CONCURRENT_OUTBOUND)
-_outbound_lock = asyncio.Lock()  # 保护时间间隔调度
-_next_earliest_ts = 0.0  # 单位：monotonic 秒
-
-# 同步代码路径（requests）用的锁与时序控制
-_sync_lock = threading.Lock()
-_sync_next_earliest_ts = 0.0
+# 同步与异步外呼共用的令牌桶限流器（按主机分桶，速率 OUTBOUND_MAX_QPS、突发 OUTBOUND_BURST，
+# 并发上限 OUTBOUND_MAX_CONCURRENCY，按主机覆盖 OUTBOUND_HOST_LIMITS）
+outbound_limiter = RateLimiter()
 
 # 针对特定端点的冷却窗口，key 可用为 URL 前缀
 _cooldowns: Dict[str, float] = {}
@@ -128,7 +165,6 @@ _cooldowns: Dict[str, float] = {}
 def _endpoint_key(url: str) -> str:
     # 简化：取主机+路径的前两段作为 key，避免过细颗粒度
     try:
-        from urllib.parse import urlparse
         p = urlparse(url)
         parts = p.path.strip('/').split('/')
         head = '/'.join(parts[:2]) if parts else ''
@@ -156,27 +192,17 @@ def _jitter(seconds: float) -> float:
     delta = seconds * 0.2
     return max(0.0, seconds + random.uniform(-delta, delta))
 
-async def _await_global_qps_window():
-    global _next_earliest_ts
-    async with _outbound_lock:
-        now = time.monotonic()
-        min_gap = 1.0 / max(_MAX_QPS, 0.0001)
-        wait = max(0.0, _next_earliest_ts - now)
-        if wait > 0:
-            await asyncio.sleep(wait)
-        # 设定下一次最早时间点（带抖动）
-        _next_earliest_ts = time.monotonic() + _jitter(min_gap)
-
-async def limited_get(url: str, params: Optional[Dict]=None, headers: Optional[Dict]=None, retries: int=3) -> Optional[aiohttp.ClientResponse]:
-    """带并发限制、QPS 间隔、退避与冷却的 GET（aiohttp）。返回已打开的响应对象或 None。"""
+async def limited_get(url: str, params: Optional[Dict]=None, headers: Optional[Dict]=None, retries: int=3,
+                      priority: Optional[int] = None) -> Optional[aiohttp.ClientResponse]:
+    """经共享令牌桶限流、带退避与冷却的 GET（aiohttp）。返回已打开的响应对象或 None。
+    priority 缺省时取当前上下文的外呼优先级（见 rate_limiter.outbound_priority）。"""
     if _in_cooldown(url):
         return None
     session = await get_http_session()
     last_exc: Optional[Exception] = None
     backoff = 0.5  # 初始退避基准（秒）
     for attempt in range(retries):
-        async with _outbound_sem:
-            await _await_global_qps_window()
+        async with outbound_limiter.limit(url, priority):
             try:
                 resp = await session.get(url, params=params, headers=headers)
                 if resp.status == 200:
@@ -200,27 +226,22 @@ async def limited_get(url: str, params: Optional[Dict]=None, headers: Optional[D
         backoff = min(backoff * 2, 8.0)
     return None
 
-def limited_get_sync(url: str, params: Optional[Dict]=None, headers: Optional[Dict]=None, timeout: int=15, retries: int=3):
-    """同步路径的受限 GET（requests），带并发间隔与退避。由于 GIL，我们仅实现 QPS 间隔与冷却，不做并发信号量。"""
+def limited_get_sync(url: str, params: Optional[Dict]=None, headers: Optional[Dict]=None, timeout: int=15, retries: int=3,
+                     stream: bool=False, priority: Optional[int] = None):
+    """同步路径的受限 GET（requests），与异步路径共用令牌桶预算，带退避与冷却。
+    stream=True 时响应体不会预先读入内存，由调用方分块读取并负责关闭；Range 请求的 206 视为成功。"""
     if _in_cooldown(url):
         return None
     last_exc: Optional[Exception] = None
     backoff = 0.5
     for attempt in range(retries):
-        # 全局 QPS 控制（同步）
-        with _sync_lock:
-            global _sync_next_earliest_ts
-            now = time.monotonic()
-            min_gap = 1.0 / max(_MAX_QPS, 0.0001)
-            wait = max(0.0, _sync_next_earliest_ts - now)
-            if wait > 0:
-                time.sleep(wait)
-            _sync_next_earliest_ts = time.monotonic() + _jitter(min_gap)
         try:
-            resp = requests.get(url, params=params, headers=headers or HEADERS, timeout=timeout)
+            with outbound_limiter.limit_sync(url, priority):
+                resp = requests.get(url, params=params, headers=headers or HEADERS, timeout=timeout, stream=stream)
             status = resp.status_code
-            if status == 200:
+            if status in (200, 206):
                 return resp
+            resp.close()
             if status in (429, 403):
                 _set_cooldown(url, 60.0 * (2 ** attempt))
                 return None
@@ -269,20 +290,20 @@ def get_mixin_key(orig: str):
 
 async def get_wbi_keys_async(cookie: Optional[str] = None) -> Optional[str]:
     """异步获取WBI密钥，带缓存"""
-    global _wbi_key_cache, _wbi_key_cache_time
-
-    # 检查缓存（5分钟有效期）
-    current_time = time.time()
-    if _wbi_key_cache and (current_time - _wbi_key_cache_time) < 300:
-        return _wbi_key_cache
+    cached = _wbi_key_cache.get(cookie or "")
+    if cached:
+        return cached
 
     try:
-        session = await get_http_session()
         headers = {}
         if cookie:
             headers['Cookie'] = cookie
 
-        async with session.get('https://api.bilibili.com/x/web-interface/nav', headers=headers) as response:
+        # 与其它外呼共用限流预算
+        response = await limited_get('https://api.bilibili.com/x/web-interface/nav', headers=headers)
+        if not response:
+            return None
+        async with response:
             if response.status == 200:
                 json_content = await response.json()
                 img_url: str = json_content['data']['wbi_img']['img_url']
@@ -293,31 +314,13 @@ async def get_wbi_keys_async(cookie: Optional[str] = None) -> Optional[str]:
                 wbi_key = get_mixin_key(img_key + sub_key)
 
                 # 更新缓存
-                _wbi_key_cache = wbi_key
-                _wbi_key_cache_time = current_time
+                _wbi_key_cache.set(cookie or "", wbi_key)
 
                 return wbi_key
     except Exception as e:
         print(f"异步获取WBI密钥失败: {e}")
     return None
 
-def get_wbi_keys(cookie=None):
-    try:
-        headers = HEADERS.copy()
-        if cookie:
-            headers['Cookie'] = cookie
-        resp = requests.get('https://api.bilibili.com/x/web-interface/nav', headers=headers)
-        resp.raise_for_status()
-        json_content = resp.json()
-        img_url: str = json_content['data']['wbi_img']['img_url']
-        sub_url: str = json_content['data']['wbi_img']['sub_url']
-        img_key = img_url.rsplit('/', 1)[1].split('.')[0]
-        sub_key = sub_url.rsplit('/', 1)[1].split('.')[0]
-        return get_mixin_key(img_key + sub_key)
-    except Exception as e:
-        print(f"获取WBI密钥失败: {e}")
-        return None
-
 def sign_wbi_params(params: dict, wbi_key: str):
     params['wts'] = str(int(time.time()))
     sorted_params = dict(sorted(params.items()))
@@ -336,9 +339,6 @@ def convert_seconds_to_lrc_time(seconds):
     sec = int(seconds % 60)
     return f"[{minutes:02d}:{sec:02d}.{millisec:02d}]"
 
-def sanitize_filename(name):
-    return re.sub(r'[\\/*?:"<>|]', "", name)
-
 async def get_bilibili_response_async(url: str, params: Optional[Dict] = None, retries: int = 3) -> Optional[aiohttp.ClientResponse]:
     """异步发送请求到B站API端点，支持重试、并发限制与退避。"""
     resp = await limited_get(url, params=params, headers=None, retries=retries)
@@ -346,51 +346,74 @@ async def get_bilibili_response_async(url: str, params: Optional[Dict] = None, r
         print(f"异步请求失败或被限流: {url}")
     return resp
 
-def get_bilibili_response(url, params=None, retries: int = 3):
+def get_bilibili_response(url, params=None, retries: int = 3, stream: bool = False):
     """发送请求到B站API端点（同步路径），带退避/QPS 间隔/冷却。"""
-    resp = limited_get_sync(url, params=params, headers=HEADERS, timeout=15, retries=retries)
+    resp = limited_get_sync(url, params=params, headers=HEADERS, timeout=15, retries=retries, stream=stream)
     if not resp:
         print(f"请求失败或被限流: {url}")
     return resp
 
-def extract_bvid_from_url(url_or_bvid: str) -> str:
-    """Extract BV ID from Bilibili URL or return as-is if already a BV ID."""
-    if url_or_bvid.startswith('http'):
-        # Extract BV ID from URL like https://www.bilibili.com/video/BV1LnuzzyEQp
-        match = re.search(r'/video/(BV[a-zA-Z0-9]+)', url_or_bvid)
-        if match:
-            return match.group(1)
-        else:
-            raise ValueError(f"Could not extract BV ID from URL: {url_or_bvid}")
-    else:
-        # Assume it's already a BV ID
-        return url_or_bvid
+async def get_cached_metadata(key: str, fetch: Callable[[], Any]) -> Optional[Any]:
+    """读穿透的元数据缓存：内存 -> SQLite -> 外呼。
+    过期条目立即返回旧值，并在后台重新验证（stale-while-revalidate）。"""
+    entry = _video_parts_cache.get(key)
+    if entry is None:
+        entry = await asyncio.to_thread(_metadata_store.get, key)
+        if entry is not None and entry.age >= _METADATA_MAX_AGE:
+            entry = None
+        if entry is not None:
+            _video_parts_cache.set(key, entry, ttl=_METADATA_MAX_AGE - entry.age)
+    if entry is not None:
+        if not entry.is_fresh():
+            _schedule_metadata_refresh(key, fetch)
+        return entry.value
+    return await _refresh_metadata(key, fetch)
+
+async def _refresh_metadata(key: str, fetch: Callable[[], Any]) -> Optional[Any]:
+    """外呼获取元数据并写入内存与 SQLite；同一 key 的并发刷新只执行一次"""
+    async def run():
+        value = await fetch()
+        if value:
+            entry = await asyncio.to_thread(_metadata_store.put, key, value, _METADATA_TTL)
+            _video_parts_cache.set(key, entry)
+        return value
+    return await _singleflight.do(("metadata", key), run)
+
+def _schedule_metadata_refresh(key: str, fetch: Callable[[], Any]) -> None:
+    if _singleflight.in_flight(("metadata", key)):
+        return
+    task = asyncio.create_task(_refresh_metadata(key, fetch))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+def warm_metadata_cache() -> int:
+    """启动时把持久化的元数据载入内存，返回条目数"""
+    entries = _metadata_store.load_all(max_age=_METADATA_MAX_AGE)
+    for entry in sorted(entries, key=lambda e: e.fetched_at):
+        _video_parts_cache.set(entry.key, entry, ttl=max(_METADATA_MAX_AGE - entry.age, 0))
+    return len(entries)
 
 async def get_video_parts_with_covers_async(bvid: str) -> Optional[List[Dict]]:
-    """异步获取视频分P信息和封面，带缓存与外呼限流"""
-    # 检查缓存
-    cache_key = f"parts_covers_{bvid}"
-    if cache_key in _video_parts_cache:
-        return _video_parts_cache[cache_key]
+    """异步获取视频分P信息和封面，带持久化缓存与外呼限流"""
+    return await get_cached_metadata(f"parts_covers_{bvid}", lambda: _fetch_video_parts_with_covers(bvid))
 
+async def _fetch_video_parts_with_covers(bvid: str) -> Optional[List[Dict]]:
+    """从视频页面的 __INITIAL_STATE__ 中解析分P信息和封面"""
     try:
         url = f"https://www.bilibili.com/video/{bvid}"
         response = await limited_get(url)
         if not response:
             return None
-        html_content = await response.text()
-
-        # 提取JSON数据
-        match = re.search(r'<script>window\.__INITIAL_STATE__=(.*?);\(function\(\)', html_content)
-        if not match:
+        async with response:
+            # 读到状态脚本结束即停止，页面其余部分不再下载（未读完的连接直接关闭）
+            state = await read_initial_state_async(response.content.iter_chunked(STATE_CHUNK_SIZE))
+            response.close()
+        if state is None:
             print(f"未找到视频数据: {bvid}")
             return None
 
-        json_data_string = match.group(1)
-        data = json.loads(json_data_string)
-
-        # 获取视频分P列表
-        video_parts = data.get('videoData', {}).get('pages', [])
+        # 只解码 videoData 子树，在线程池中进行，不阻塞事件循环
+        video_parts = await asyncio.to_thread(extract_video_pages, state)
         if not video_parts:
             print(f"未找到分P视频: {bvid}")
             return None
@@ -408,66 +431,18 @@ async def get_video_parts_with_covers_async(bvid: str) -> Optional[List[Dict]]:
             }
             enhanced_parts.append(enhanced_part)
 
-        # 缓存结果
-        _video_parts_cache[cache_key] = enhanced_parts
         return enhanced_parts
 
     except (json.JSONDecodeError, Exception) as e:
         print(f"异步获取视频信息失败: {e}")
         return None
 
-def get_video_parts_with_covers(bvid: str):
-    """Fetches video parts and their cover images from Bilibili page."""
-    try:
-        # 获取视频页面
-        url = f"https://www.bilibili.com/video/{bvid}"
-        response = get_bilibili_response(url)
-        if not response:
-            return None
-
-        html_content = response.text
-
-        # 提取JSON数据
-        match = re.search(r'<script>window\.__INITIAL_STATE__=(.*?);\(function\(\)', html_content)
-        if not match:
-            print(f"未找到视频数据: {bvid}")
-            return None
-
-        json_data_string = match.group(1)
-        data = json.loads(json_data_string)
-
-        # 获取视频分P列表
-        video_parts = data.get('videoData', {}).get('pages', [])
-        if not video_parts:
-            print(f"未找到分P视频: {bvid}")
-            return None
-
-        # 为每个分P添加封面信息
-        enhanced_parts = []
-        for part in video_parts:
-            enhanced_part = {
-                'cid': part.get('cid'),
-                'page': part.get('page'),
-                'part': part.get('part'),
-                'duration': part.get('duration'),
-                'cover_url': part.get('first_frame', ''),
-                'dimension': part.get('dimension', {})
-            }
-            enhanced_parts.append(enhanced_part)
-
-        return enhanced_parts
-
-    except (json.JSONDecodeError, Exception) as e:
-        print(f"获取视频信息失败: {e}")
-        return None
-
 async def get_video_parts_async(bvid: str) -> Optional[List[Dict]]:
-    """异步获取视频分P基本信息，带缓存与外呼限流"""
-    # 检查缓存
-    cache_key = f"parts_{bvid}"
-    if cache_key in _video_parts_cache:
-        return _video_parts_cache[cache_key]
+    """异步获取视频分P基本信息，带持久化缓存与外呼限流"""
+    return await get_cached_metadata(f"parts_{bvid}", lambda: _fetch_video_parts(bvid))
 
+async def _fetch_video_parts(bvid: str) -> Optional[List[Dict]]:
+    """请求 pagelist 接口获取分P列表"""
     try:
         url = 'https://api.bilibili.com/x/player/pagelist'
         params = {'bvid': bvid, 'jsonp': 'jsonp'}
@@ -476,27 +451,83 @@ async def get_video_parts_async(bvid: str) -> Optional[List[Dict]]:
         if response and response.status == 200:
             data = await response.json()
             if data['code'] == 0:
-                result = data['data']
-                # 缓存结果
-                _video_parts_cache[cache_key] = result
-                return result
+                return data['data']
     except Exception as e:
         print(f"异步获取视频分P失败: {e}")
     return None
 
-def get_video_parts(bvid: str):
-    """Fetches the list of video parts (pages) for a given Bilibili BV ID."""
-    url = 'https://api.bilibili.com/x/player/pagelist'
-    params = {'bvid': bvid, 'jsonp': 'jsonp'}
-    response = get_bilibili_response(url, params)
-    if response:
-        try:
-            data = response.json()
-            if data['code'] == 0:
-                return data['data']
-        except (ValueError, KeyError):
-            return None
-    return None
+# 各文件夹 list.txt 的解析结果（常驻内存，由文件系统监视器刷新）
+list_index = ListFileIndex(VIDEOS_DIR)
+# 文件夹树索引：子文件夹、list.txt、已下载的视频与字节数、名字的排序键（常驻内存，由文件系统监视器增量更新）
+folder_index = FolderIndex(VIDEOS_DIR)
+# 专辑清单：list.txt 中所有来源的分P合并为一个剧集列表，按文件夹缓存，list.txt 修改后失效；
+# 解析完成后把各剧集的文件名交给文件夹索引统计剧集数与已下载数
+album_manifests = AlbumManifests(
+    get_video_parts_async, list_index,
+    on_built=lambda album: folder_index.set_album(album.folder_path, [e['file_name'] for e in album.episodes]),
+)
+# 视频目录的文件系统监视器（启动时创建）
+fs_watcher = None
+
+def _on_videos_changed(paths) -> None:
+    """监视线程回调：把变化交给各索引；文件夹被删除时清理其中不再被其他 list.txt 列出的视频的字幕记录"""
+    deleted = set()
+    for path in paths:
+        if path.name != LIST_FILE and not path.exists():
+            deleted |= list_index.bvids_under(path)
+    for path in paths:
+        list_index.apply_change(path)
+    folder_index.apply_changes(paths)
+    if deleted:
+        # 同一批变化中改名后的新目录已重新扫描，仍被列出的视频保留
+        removed = _subtitle_index.discard(deleted - list_index.bvids())
+        if removed:
+            print(f"🧹 已从字幕索引中删除 {removed} 个不再列出的分P")
+
+def _cached_video_parts(bvid: str) -> Optional[List[Dict]]:
+    """只读内存中的分P缓存，不外呼"""
+    entry = _video_parts_cache.get(f"parts_{bvid}")
+    return entry.value if entry is not None else None
+
+def index_videos_dir() -> None:
+    """启动时扫描视频目录：文件夹树、各 list.txt，以及能由已缓存元数据组装的专辑清单"""
+    folders = folder_index.build()
+    lists = [path for path in folder_index.list_folders_with_list_file() if list_index.refresh(path)]
+    albums = sum(1 for path in lists if album_manifests.build_cached(path, _cached_video_parts))
+    print(f"📋 已索引 {folders} 个文件夹、{len(lists)} 个 list.txt（{albums} 个专辑的剧集数来自本地缓存）")
+
+async def load_album(folder_path: str):
+    """读取文件夹的专辑清单，找不到或无法解析时抛出对应的 HTTPException"""
+    try:
+        album = await album_manifests.get(folder_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"'list.txt' not found in folder '{folder_path}'")
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not album.episodes:
+        raise HTTPException(status_code=500, detail=f"Could not fetch video parts for: {', '.join(album.failed)}")
+    return album
+
+async def load_episode(folder_path: str, ref: str):
+    """按剧集 ID（BV1xx_p3）或专辑序号查找剧集"""
+    album = await load_album(folder_path)
+    episode = album.find(ref)
+    if not episode:
+        raise HTTPException(status_code=404, detail=f"Episode {ref} not found in folder '{folder_path}'.")
+    return episode
+
+async def album_cover_sources(album) -> Dict[str, str]:
+    """并发获取专辑各来源的分P封面，返回 剧集 ID -> 封面源地址"""
+    results = await asyncio.gather(*(get_video_parts_with_covers_async(bvid) for bvid in album.bvids),
+                                   return_exceptions=True)
+    sources = {}
+    for bvid, parts in zip(album.bvids, results):
+        if isinstance(parts, BaseException) or not parts:
+            continue
+        for part in parts:
+            if part.get('cover_url'):
+                sources[episode_id(bvid, part['page'])] = part['cover_url']
+    return sources
 
 async def download_and_cache_cover_async(bvid: str, page: int, cover_url: str) -> str:
     """异步下载并缓存封面图片，返回本地路径（受限流管控）"""
@@ -515,116 +546,109 @@ async def download_and_cache_cover_async(bvid: str, page: int, cover_url: str) -
     if cover_path.exists():
         return f"/covers/{cover_filename}"
 
+    # 同一封面的并发请求只下载一次
+    return await _singleflight.do(("cover", bvid, page), lambda: _fetch_cover(cover_url, cover_path))
+
+async def _fetch_cover(cover_url: str, cover_path: Path) -> str:
+    """下载封面到临时文件后原子替换，读者不会看到写了一半的文件"""
+    if cover_path.exists():
+        return f"/covers/{cover_path.name}"
     try:
-        response = await limited_get(cover_url)
+        response = await limited_get(cover_url, priority=PREFETCH)
         if response and response.status == 200:
             content = await response.read()
-            with open(cover_path, 'wb') as f:
+            temp_path = cover_path.with_name(cover_path.name + ".part")
+            with open(temp_path, 'wb') as f:
                 f.write(content)
-            return f"/covers/{cover_filename}"
+            os.replace(temp_path, cover_path)
+            # 在进程池中生成各宽度/格式的缩略图，不阻塞本次返回
+            thumbnail_pipeline.schedule(cover_path)
+            return f"/covers/{cover_path.name}"
     except Exception as e:
         print(f"异步下载封面失败: {e}")
 
     return ""
 
 
-async def check_subtitle_availability_async(bvid: str, page: int, cid: int) -> bool:
-    """异步检查视频是否有字幕可用"""
-    try:
-        # 如果没有配置Cookie，直接返回False
-        if not BILIBILI_COOKIE:
-            return False
-
-        # 获取WBI签名密钥
-        wbi_key = await get_wbi_keys_async(BILIBILI_COOKIE)
-        if not wbi_key:
-            return False
-
-        # 构建请求参数
-        params = {'bvid': bvid, 'cid': cid}
-        signed_params = sign_wbi_params(params, wbi_key)
-
-        # 异步请求字幕API
-        session = await get_http_session()
-        player_api_url = "https://api.bilibili.com/x/player/wbi/v2"
-        headers = {'Cookie': BILIBILI_COOKIE}
-
-        async with session.get(player_api_url, params=signed_params, headers=headers) as response:
-            if response.status != 200:
-                return False
-
-            subtitle_data = await response.json()
-            if subtitle_data.get('code') != 0:
-                return False
-
-            subtitles_list = subtitle_data.get('data', {}).get('subtitle', {}).get('subtitles', [])
-            # 检查是否有用户上传的字幕
-            user_subtitle = next((s for s in subtitles_list if s.get('ai_type') == 0 and s.get('subtitle_url')), None)
-            return user_subtitle is not None
-
-    except Exception as e:
-        print(f"异步检查字幕可用性失败: {e}")
-        return False
-
-async def check_subtitle_availability(bvid: str, page: int, cid: int) -> bool:
-    """检查视频是否有字幕可用"""
-    try:
-        print(f"检查字幕可用性: bvid={bvid}, page={page}, cid={cid}")
-
-        # 如果没有配置Cookie，直接返回False
-        if not BILIBILI_COOKIE:
-            print("未配置B站Cookie，字幕功能不可用")
-            return False
-
-        # 获取WBI签名密钥
-        wbi_key = get_wbi_keys(BILIBILI_COOKIE)
-        if not wbi_key:
-            print("获取WBI密钥失败")
-            return False
+# 封面缩略图（需要 Pillow；未安装时只提供原图）
+thumbnail_pipeline = ThumbnailPipeline()
+if not thumbnail_pipeline.enabled:
+    print("提示: 未安装 Pillow，封面将以原图提供")
 
-        # 构建请求参数
-        params = {'bvid': bvid, 'cid': cid}
-        signed_params = sign_wbi_params(params, wbi_key)
-
-        print(f"请求参数: {signed_params}")
+# 封面预取引擎：有界并发、任务跟踪与去重，关闭时取消
+cover_prefetcher = CoverPrefetcher(
+    download_and_cache_cover_async,
+    max_concurrency=int(os.getenv("COVER_PREFETCH_CONCURRENCY", "4")),
+)
 
-        # 请求字幕API，带上Cookie
-        player_api_url = "https://api.bilibili.com/x/player/wbi/v2"
-        headers = HEADERS.copy()
-        headers['Cookie'] = BILIBILI_COOKIE
+async def fetch_player_subtitles(bvid: str, cid: int) -> Optional[List[Dict]]:
+    """请求播放器接口（WBI签名）获取字幕轨道列表；未配置Cookie或请求失败时返回 None"""
+    if not BILIBILI_COOKIE:
+        return None
 
-        response = limited_get_sync(player_api_url, params=signed_params, headers=headers)
+    wbi_key = await get_wbi_keys_async(BILIBILI_COOKIE)
+    if not wbi_key:
+        print("获取WBI密钥失败")
+        return None
 
-        if not response:
-            print("字幕API请求失败")
-            return False
+    signed_params = sign_wbi_params({'bvid': bvid, 'cid': cid}, wbi_key)
+    player_api_url = "https://api.bilibili.com/x/player/wbi/v2"
+    response = await limited_get(player_api_url, params=signed_params, headers={'Cookie': BILIBILI_COOKIE})
+    if not response:
+        print("字幕API请求失败")
+        return None
 
-        subtitle_data = response.json()
-        print(f"字幕API响应: code={subtitle_data.get('code')}, message={subtitle_data.get('message')}")
+    subtitle_data = await response.json(content_type=None)
+    if subtitle_data.get('code') != 0:
+        print(f"字幕API返回错误: {subtitle_data.get('code')} - {subtitle_data.get('message')}")
+        return None
 
-        if subtitle_data.get('code') != 0:
-            print(f"字幕API返回错误: {subtitle_data.get('message')}")
-            return False
+    return subtitle_data.get('data', {}).get('subtitle', {}).get('subtitles', [])
 
-        subtitles_list = subtitle_data.get('data', {}).get('subtitle', {}).get('subtitles', [])
-        print(f"找到字幕列表: {len(subtitles_list)} 个")
+async def get_subtitle_tracks(bvid: str, cid: int) -> Optional[List[Dict]]:
+    """先查字幕轨道索引，未命中再外呼（同一 cid 的并发请求只外呼一次）并写回索引"""
+    tracks = _subtitle_index.get(bvid, cid)
+    if tracks is not None:
+        return tracks
 
-        # 检查是否有用户上传的字幕
-        user_subtitle = next((s for s in subtitles_list if s.get('ai_type') == 0 and s.get('subtitle_url')), None)
+    async def fetch():
+        fetched = await fetch_player_subtitles(bvid, cid)
+        # 请求失败（None）不写入索引，下次重试
+        if fetched is not None:
+            _subtitle_index.put(bvid, cid, fetched)
+        return fetched
 
-        has_subtitle = user_subtitle is not None
-        print(f"用户字幕可用: {has_subtitle}")
+    return await _singleflight.do(("subtitle_tracks", bvid, cid), fetch)
 
-        return has_subtitle
+def find_user_subtitle(subtitles_list: List[Dict]) -> Optional[Dict]:
+    """查找用户上传的字幕（排除AI字幕）"""
+    return next((s for s in subtitles_list if s.get('ai_type') == 0 and s.get('subtitle_url')), None)
 
+async def check_subtitle_availability_async(bvid: str, page: int, cid: int) -> bool:
+    """异步检查视频是否有字幕可用（经字幕轨道索引）"""
+    try:
+        subtitles_list = await get_subtitle_tracks(bvid, cid)
+        return find_user_subtitle(subtitles_list or []) is not None
     except Exception as e:
-        print(f"检查字幕可用性失败: {e}")
+        print(f"异步检查字幕可用性失败: {e}")
         return False
 
-
+async def check_subtitle_availability(bvid: str, page: int, cid: int) -> bool:
+    """检查视频是否有字幕可用"""
+    print(f"检查字幕可用性: bvid={bvid}, page={page}, cid={cid}")
+    has_subtitle = await check_subtitle_availability_async(bvid, page, cid)
+    print(f"用户字幕可用: {has_subtitle}")
+    return has_subtitle
 
 async def download_and_cache_subtitle(bvid: str, page: int, cid: int) -> str:
-    """下载并缓存字幕文件，返回本地路径"""
+    """下载并缓存字幕文件，返回本地路径；同一分P的并发请求只下载一次"""
+    subtitle_path = SUBTITLES_DIR / f"{bvid}_p{page}.vtt"
+    if subtitle_path.exists():
+        return f"/subtitles/{subtitle_path.name}"
+    return await _singleflight.do(("subtitle", bvid, page), lambda: _fetch_subtitle(bvid, page, cid))
+
+async def _fetch_subtitle(bvid: str, page: int, cid: int) -> str:
+    """请求字幕接口并写入 WebVTT 缓存文件"""
     try:
         print(f"开始下载字幕: bvid={bvid}, page={page}, cid={cid}")
 
@@ -637,40 +661,8 @@ async def download_and_cache_subtitle(bvid: str, page: int, cid: int) -> str:
             print(f"字幕已缓存: {subtitle_filename}")
             return f"/subtitles/{subtitle_filename}"
 
-        # 如果没有配置Cookie，直接返回空
-        if not BILIBILI_COOKIE:
-            print("未配置B站Cookie，无法下载字幕")
-            return ""
-
-        # 获取WBI签名密钥
-        wbi_key = get_wbi_keys(BILIBILI_COOKIE)
-        if not wbi_key:
-            return ""
-
-        # 构建请求参数
-        params = {'bvid': bvid, 'cid': cid}
-        signed_params = sign_wbi_params(params, wbi_key)
-
-        # 请求字幕API，带上Cookie
-        player_api_url = "https://api.bilibili.com/x/player/wbi/v2"
-        headers = HEADERS.copy()
-        headers['Cookie'] = BILIBILI_COOKIE
-
-        response = requests.get(player_api_url, params=signed_params, headers=headers)
-
-        if not response or response.status_code != 200:
-            print("字幕API请求失败")
-            return ""
-
-        subtitle_data = response.json()
-        if subtitle_data.get('code') != 0:
-            print(f"字幕API返回错误: {subtitle_data.get('code')} - {subtitle_data.get('message')}")
-            return ""
-
-        subtitles_list = subtitle_data.get('data', {}).get('subtitle', {}).get('subtitles', [])
-        # 查找用户上传的字幕
-        user_subtitle = next((s for s in subtitles_list if s.get('ai_type') == 0 and s.get('subtitle_url')), None)
-
+        subtitles_list = await get_subtitle_tracks(bvid, cid)
+        user_subtitle = find_user_subtitle(subtitles_list or [])
         if not user_subtitle:
             return ""
 
@@ -679,20 +671,12 @@ async def download_and_cache_subtitle(bvid: str, page: int, cid: int) -> str:
         if subtitle_url.startswith('//'):
             subtitle_url = 'https:' + subtitle_url
 
-        subtitle_response = limited_get_sync(subtitle_url, headers=HEADERS)
+        subtitle_response = await limited_get(subtitle_url)
         if not subtitle_response:
             return ""
 
-        subtitle_content = subtitle_response.json()
-
-        # 转换为WebVTT格式并保存
-        with open(subtitle_path, 'w', encoding='utf-8') as f:
-            f.write("WEBVTT\n\n")
-            for line in subtitle_content.get('body', []):
-                start_time = format_webvtt_time(line.get('from', 0))
-                end_time = format_webvtt_time(line.get('to', 0))
-                content = line.get('content', '')
-                f.write(f"{start_time} --> {end_time}\n{content}\n\n")
+        subtitle_content = await subtitle_response.json(content_type=None)
+        await write_webvtt(subtitle_path, subtitle_content.get('body', []))
 
         return f"/subtitles/{subtitle_filename}"
 
@@ -700,6 +684,23 @@ async def download_and_cache_subtitle(bvid: str, page: int, cid: int) -> str:
         print(f"下载字幕失败: {e}")
         return ""
 
+def build_webvtt(body: List[Dict]) -> str:
+    """将B站字幕 JSON 的 body 转换为 WebVTT 文本"""
+    lines = ["WEBVTT\n\n"]
+    for line in body:
+        start_time = format_webvtt_time(line.get('from', 0))
+        end_time = format_webvtt_time(line.get('to', 0))
+        content = line.get('content', '')
+        lines.append(f"{start_time} --> {end_time}\n{content}\n\n")
+    return "".join(lines)
+
+async def write_webvtt(subtitle_path: Path, body: List[Dict]) -> None:
+    """异步写入 WebVTT 文件：先写临时文件再原子替换"""
+    temp_path = subtitle_path.with_name(subtitle_path.name + ".part")
+    async with aiofiles.open(temp_path, 'w', encoding='utf-8') as f:
+        await f.write(build_webvtt(body))
+    os.replace(temp_path, subtitle_path)
+
 def format_webvtt_time(seconds):
     """将秒数转换为WebVTT时间格式"""
     hours = int(seconds // 3600)
@@ -707,260 +708,564 @@ def format_webvtt_time(seconds):
     secs = seconds % 60
     return f"{hours:02d}:{minutes:02d}:{secs:06.3f}"
 
-def download_and_merge(bvid: str, p_info: dict, target_dir: Path):
-    """Downloads and merges a single video part."""
-    page = p_info['page']
-    cid = p_info['cid']
-    # Sanitize the title to create a valid filename
-    clean_name = re.sub(r'[\\/*?:"<>|]', "", p_info['part'])
-    final_video_path = target_dir / f"{clean_name}.mp4"
-    
-    # If the final merged video already exists, do nothing.
-    if final_video_path.exists():
-        print(f"Video '{clean_name}.mp4' already exists. Skipping download.")
-        return str(final_video_path)
-
+def fetch_dash_info(bvid: str, page: int, cid: int, qn: int = DEFAULT_POLICY.qn()) -> Dict[str, Any]:
+    """获取分P的 DASH 信息（不超过 qn 的各清晰度视频流与音频流），失败时抛出异常"""
     # 1. Get Session
     session_url = f'https://www.bilibili.com/video/{bvid}?p={page}'
-    session_response = get_bilibili_response(session_url)
+    session_response = get_bilibili_response(session_url, stream=True)
     if not session_response:
         raise Exception("Failed to get session.")
-    
-    session_match = re.search(r'"session":"(.*?)"', session_response.text)
-    if not session_match:
+
+    # 读到 session 即停止，页面其余部分不再下载
+    with session_response:
+        session = read_play_session(session_response.iter_content(STATE_CHUNK_SIZE))
+    if session is None:
         raise Exception("Could not find session in page.")
-    session = session_match.group(1)
 
     # 2. Get Video/Audio URLs
     playurl = 'https://api.bilibili.com/x/player/playurl'
     params = {
-        'cid': cid, 'bvid': bvid, 'qn': '80', # qn=80 for 1080p
+        'cid': cid, 'bvid': bvid, 'qn': str(qn),
         'fnver': '0', 'fnval': '976', 'session': session
     }
     play_response = get_bilibili_response(playurl, params)
     if not play_response:
         raise Exception("Failed to get play URLs.")
-        
+
     play_data = play_response.json()
     if play_data['code'] != 0:
         raise Exception(f"API error getting play URLs: {play_data.get('message', 'Unknown error')}")
-
     try:
-        audio_url = play_data['data']['dash']['audio'][0]['baseUrl']
-        video_url = play_data['data']['dash']['video'][0]['baseUrl']
-    except (KeyError, IndexError):
+        return play_data['data']['dash']
+    except (KeyError, TypeError):
         raise Exception("Could not parse audio/video URLs from API response.")
 
-    # 3. Download Audio and Video
-    temp_audio_path = target_dir / f"{clean_name}_audio.mp3"
-    temp_video_path = target_dir / f"{clean_name}_video.mp4"
+async def download_and_merge(bvid: str, p_info: dict, target_dir: Path, progress_callback: Optional[Callable[..., None]] = None,
+                             progressive_key: Optional[str] = None, policy: QualityPolicy = DEFAULT_POLICY,
+                             selection: Optional[StreamSelection] = None):
+    """Downloads and merges a single video part.
+
+    下载在线程中进行，合并交给 merge_pool（异步子进程，有并发上限）。
+    默认两路流边下载边经管道交给 ffmpeg，同一进程同时写出最终文件与（边下边播时）.part.mp4；
+    失败或需要续传时回退到 scratch 目录中的临时文件（管道合并时已顺带写入的部分直接续传），下载完成后再合并。
+    progress_callback 以关键字参数接收进度（status、bytes_downloaded、total_bytes、stream_url、merge_progress），可在工作线程中调用。
+    给出 progressive_key 且环境支持时边下边播：下载的同时封装出可立即播放的 .part.mp4。
+    policy 决定下载的清晰度与编码（selection 为调用方已按策略选好的流），
+    文件名带选中档位的标识，与默认策略选中同一档位时不带。
+    """
+    report = progress_callback or (lambda **fields: None)
+    page = p_info['page']
+    cid = p_info['cid']
 
-    audio_res = get_bilibili_response(audio_url)
-    video_res = get_bilibili_response(video_url)
+    # 1-2. Get Session and Video/Audio URLs，按策略挑选视频与音频流
+    if selection is None:
+        selection = await resolve_selection(bvid, p_info, policy)
+    video, audio = selection.video, selection.audio
+    # Sanitize the title to create a valid filename
+    clean_name = selection.file_stem(p_info.get('file_name') or sanitize_filename(p_info['part']))
+    final_video_path = target_dir / f"{clean_name}.mp4"
 
-    if not audio_res or not video_res:
-        raise Exception("Failed to download audio or video content.")
+    # If the final merged video already exists, do nothing.
+    if final_video_path.exists():
+        print(f"Video '{clean_name}.mp4' already exists. Skipping download.")
+        return str(final_video_path)
+
+    audio_url = audio['url']
+    video_url = video['url']
+    print(f"下载档位 {clean_name}: {video['height']}p {video['codec']} {video['bandwidth'] // 1000}kbps, "
+          f"音频 {audio['bandwidth'] // 1000}kbps")
+
+    # 3. Download Audio and Video
+    scratch_stem = f"{bvid}_p{page}_{selection.variant}"
+    temp_audio_path = SCRATCH_DIR / f"{scratch_stem}_audio.mp3"
+    temp_video_path = SCRATCH_DIR / f"{scratch_stem}_video.mp4"
+    resuming = temp_audio_path.exists() or temp_video_path.exists()
+    merge_options = dict(
+        duration=p_info.get('duration'),
+        # HEVC 使用 hvc1 标记，Safari 才能播放
+        extra_args=['-tag:v', 'hvc1'] if video['codec'] == 'hevc' else [],
+        on_progress=lambda fraction: report(merge_progress=int(fraction * 100)),
+    )
+
+    # 全新下载且环境支持时边下边播；已有临时文件（续传）时走分段下载
+    progressive = None
+    if progressive_key and progressive_available() and not resuming:
+        progressive = progressive_registry.register(progressive_key, SCRATCH_DIR / f"{scratch_stem}.part.mp4")
+
+    if not resuming and pipe_merge_available():
+        try:
+            await _merge_from_pipes(video_url, audio_url, temp_video_path, temp_audio_path, final_video_path,
+                                    report, merge_options, progressive)
+        except asyncio.CancelledError:
+            if progressive is not None:
+                progressive_registry.finish(progressive, failed=True)
+            raise
+        except Exception as e:
+            print(f"管道合并失败，改用临时文件下载后合并: {e}")
+            report(status="downloading", bytes_downloaded=0, merge_progress=0)
+            # 已写入 scratch 的部分由分段下载续传；边下边播随管道合并一起结束
+            if progressive is not None:
+                progressive_registry.finish(progressive, failed=True)
+                progressive = None
+        else:
+            for temp_path in (temp_audio_path, temp_video_path):
+                temp_path.unlink(missing_ok=True)
+                remove_download_state(temp_path)
+            # .part 文件由 registry 在保留期后删除，正在播放的客户端可继续按 Range 取数据
+            if progressive is not None:
+                progressive_registry.finish(progressive)
+            return str(final_video_path)
+
+    if progressive is not None:
+        try:
+            done_bytes = await asyncio.to_thread(_download_progressively, video_url, audio_url,
+                                                 temp_video_path, temp_audio_path, progressive, report)
+        except Exception:
+            progressive_registry.finish(progressive, failed=True)
+            raise
+        # 封装结束，正在推送的播放请求发送完剩余数据后结束；.part 文件由 registry 删除
+        progressive_registry.finish(progressive, failed=progressive.failed)
+    else:
+        done_bytes = await asyncio.to_thread(_download_segmented, video_url, audio_url,
+                                             temp_video_path, temp_audio_path, report)
 
-    with open(temp_audio_path, 'wb') as f:
-        f.write(audio_res.content)
-    with open(temp_video_path, 'wb') as f:
-        f.write(video_res.content)
-
-    # 4. Merge with ffmpeg
-    command = [
-        'ffmpeg',
-        '-i', str(temp_video_path),
-        '-i', str(temp_audio_path),
-        '-c', 'copy',
-        str(final_video_path)
-    ]
+    # 4. Merge with ffmpeg（先写到 .merging 临时输出，完成后再原子替换，避免播放到未合并完的文件）
+    report(status="merging", bytes_downloaded=done_bytes, merge_progress=0)
     try:
-        subprocess.run(command, shell=False, check=True, capture_output=True, text=True)
-    except subprocess.CalledProcessError as e:
-        # If merge fails, clean up temp files and raise error
-        temp_audio_path.unlink(missing_ok=True)
-        temp_video_path.unlink(missing_ok=True)
-        raise Exception(f"ffmpeg merge failed: {e.stderr}")
+        await merge_pool.merge(str(temp_video_path), str(temp_audio_path), final_video_path, **merge_options)
+    except (MergeError, asyncio.CancelledError) as e:
+        # 合并失败时保留已下载的临时文件与续传状态，重试时无需重新下载
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        raise Exception(f"ffmpeg merge failed: {e}")
 
     # 5. Clean up temporary files
-    temp_audio_path.unlink(missing_ok=True)
-    temp_video_path.unlink(missing_ok=True)
-    
+    for temp_path in (temp_audio_path, temp_video_path):
+        temp_path.unlink(missing_ok=True)
+        remove_download_state(temp_path)
+
     return str(final_video_path)
 
+async def resolve_selection(bvid: str, p_info: dict, policy: QualityPolicy) -> StreamSelection:
+    """获取 DASH 信息并按策略选出视频流与音频流，同时记下该策略选中的档位供播放时查找文件"""
+    dash = await asyncio.to_thread(fetch_dash_info, bvid, p_info['page'], p_info['cid'], dash_qn(policy))
+    selection = StreamSelection(dash, policy)
+    entry = await asyncio.to_thread(_metadata_store.put, _variant_choice_key(bvid, p_info['cid'], policy),
+                                    {"variant": selection.variant, "suffix": selection.suffix}, _METADATA_MAX_AGE)
+    _video_parts_cache.set(entry.key, entry, ttl=_METADATA_MAX_AGE)
+    return selection
+
+def _variant_choice_key(bvid: str, cid: int, policy: QualityPolicy) -> str:
+    return f"variant_{bvid}_{cid}_{policy.key()}"
+
+async def known_variant_suffix(bvid: str, cid: int, policy: QualityPolicy) -> Optional[str]:
+    """该策略上次选中档位的文件名后缀（默认档位为空串）；尚未选过时返回 None"""
+    if policy.key() == DEFAULT_POLICY.key():
+        return ""
+    key = _variant_choice_key(bvid, cid, policy)
+    entry = _video_parts_cache.get(key)
+    if entry is None:
+        entry = await asyncio.to_thread(_metadata_store.get, key)
+    return entry.value.get("suffix") if entry is not None else None
+
+def variant_suffix(video_path: Path) -> str:
+    """已下载文件名中的档位后缀（如 .720p_hevc），默认档位的文件为空串"""
+    return video_path.stem[len(strip_policy_suffix(video_path.stem)):]
+
+async def _merge_from_pipes(video_url: str, audio_url: str, spool_video_path: Path, spool_audio_path: Path,
+                            final_video_path: Path, report: Callable[..., None], merge_options: Dict[str, Any],
+                            progressive=None) -> int:
+    """两路流边下载边经管道交给 ffmpeg 合并，返回总字节数。
+    给出 progressive 时同一个 ffmpeg 进程同时输出边下边播的 fMP4，两个输出共用一份下载。
+    _PIPE_MERGE_SPOOL 开启且长度已知时，下载数据同时顺序写入 spool 路径并记录续传状态，失败后分段下载可从中断处续传。
+    任一路下载失败时先终止 ffmpeg 再关闭管道，不会把截断的输入合并成文件；
+    合并超时从两路输入都写完后开始计算，只限制封装本身。"""
+    loop = asyncio.get_running_loop()
+    pipes = [os.pipe() for _ in range(2)]
+    write_fds = [w for _, w in pipes]
+    closed = [False, False]
+    received = [0, 0]
+    totals: List[Optional[int]] = [None, None]
+    errors: List[Exception] = []
+    errors_lock = threading.Lock()
+    feeders: List[asyncio.Future] = []
+    inputs_done = asyncio.Event()
+
+    def feed(index: int, url: str, name: str, spool_path: Path) -> None:
+        try:
+            resp = limited_get_sync(url, headers=HEADERS, stream=True)
+            if not resp:
+                raise Exception("Failed to download audio or video content.")
+            length = resp.headers.get('Content-Length', '')
+            totals[index] = int(length) if length.isdigit() and not resp.headers.get('Content-Encoding') else None
+            spool = None
+            if _PIPE_MERGE_SPOOL and totals[index]:
+                spool = SegmentedDownload(spool_path, totals[index], resource_id=urlparse(url).path)
+
+            def on_progress(m) -> None:
+                received[index] = m.bytes_written
+                total_bytes = sum(totals) if all(totals) else None
+                report(bytes_downloaded=sum(received), total_bytes=total_bytes)
+
+            metrics = stream_response_to_pipe(resp, write_fds[index], name, on_progress=on_progress, spool=spool)
+            _recent_download_metrics.append(metrics.to_dict())
+            print(f"下载完成 {metrics.summary()}")
+            # 完整写入后才关闭写端，ffmpeg 读到 EOF
+            closed[index] = True
+            os.close(write_fds[index])
+            if all(closed):
+                loop.call_soon_threadsafe(inputs_done.set)
+        except Exception as e:
+            with errors_lock:
+                errors.append(e)
+                first = len(errors) == 1
+            # 另一路随后会因管道断开而失败，只需取消一次
+            if first:
+                loop.call_soon_threadsafe(merge_task.cancel)
+
+    def start_feeders() -> None:
+        for index, (url, name, spool_path) in enumerate(((video_url, "video", spool_video_path),
+                                                          (audio_url, "audio", spool_audio_path))):
+            feeders.append(asyncio.ensure_future(asyncio.to_thread(feed, index, url, name, spool_path)))
+
+    extra_outputs: List[str] = []
+    ready_task = None
+    if progressive is not None:
+        extra_outputs = fragmented_output_args(progressive.path, merge_options.get('extra_args', []))
+        ready_task = asyncio.ensure_future(notify_when_playable(
+            progressive, lambda: report(stream_url=f"/progressive/{progressive.token}")))
+
+    report(status="downloading", bytes_downloaded=0, total_bytes=None)
+    merge_task = asyncio.ensure_future(merge_pool.merge(
+        f"pipe:{pipes[0][0]}", f"pipe:{pipes[1][0]}", final_video_path,
+        pass_fds=[r for r, _ in pipes], on_started=start_feeders, inputs_done=inputs_done,
+        extra_outputs=extra_outputs, **merge_options))
+    try:
+        await merge_task
+    except asyncio.CancelledError:
+        # 下载失败触发的取消转换为下载错误，调用方据此回退
+        if errors:
+            raise errors[0]
+        raise
+    finally:
+        if ready_task is not None:
+            ready_task.cancel()
+        # ffmpeg 已退出，阻塞在管道上的写入会失败返回；等待下载线程结束后再关闭剩余的写端
+        if feeders:
+            await asyncio.shield(asyncio.gather(*feeders, return_exceptions=True))
+        for index, fd in enumerate(write_fds):
+            if not closed[index]:
+                os.close(fd)
+    return sum(received)
+
+def _download_segmented(video_url: str, audio_url: str, temp_video_path: Path, temp_audio_path: Path,
+                        report: Callable[..., None]) -> int:
+    """先探测两路流的总长度，再按 Range 分段并行下载（支持断点续传）；
+    服务器不支持 Range 时退回单连接流式写盘。两种方式的内存占用都与视频长度无关。返回总字节数。"""
+    probes = []
+    try:
+        for stream_url in (audio_url, video_url):
+            probes.append(_probe_stream(stream_url))
+
+        totals = [stream_total for stream_total, _ in probes]
+        total_bytes = sum(totals) if all(totals) else None
+        report(status="downloading", bytes_downloaded=0, total_bytes=total_bytes)
+
+        done_bytes = 0
+        for stream_url, (stream_total, full_res), temp_path in zip((audio_url, video_url), probes, (temp_audio_path, temp_video_path)):
+            base = done_bytes
+            on_progress = lambda m: report(bytes_downloaded=base + m.resumed_bytes + m.bytes_written, total_bytes=total_bytes)
+            if full_res is None:
+                download = SegmentedDownload(temp_path, stream_total, resource_id=urlparse(stream_url).path)
+                metrics = download.run(lambda start, end, url=stream_url: _fetch_stream_range(url, start, end), on_progress)
+            else:
+                metrics = stream_response_to_file(full_res, temp_path, on_progress=on_progress)
+            done_bytes += metrics.resumed_bytes + metrics.bytes_written
+            _recent_download_metrics.append(metrics.to_dict())
+            print(f"下载完成 {metrics.summary()}")
+    finally:
+        for _, full_res in probes:
+            if full_res is not None:
+                full_res.close()
+    return done_bytes
+
+def _download_progressively(video_url: str, audio_url: str, temp_video_path: Path, temp_audio_path: Path,
+                            entry, report: Callable[..., None]) -> int:
+    """单连接顺序下载两路流，同时封装为可边下边播的 fMP4；返回总字节数"""
+    responses = []
+    try:
+        for stream_url in (video_url, audio_url):
+            resp = limited_get_sync(stream_url, headers=HEADERS, stream=True)
+            if not resp:
+                raise Exception("Failed to download audio or video content.")
+            responses.append(resp)
+    except Exception:
+        for resp in responses:
+            resp.close()
+        raise
+
+    lengths = [resp.headers.get('Content-Length', '') for resp in responses]
+    expected = [int(l) if l.isdigit() and not resp.headers.get('Content-Encoding') else None
+                for l, resp in zip(lengths, responses)]
+    total_bytes = sum(expected) if all(expected) else None
+    report(status="downloading", bytes_downloaded=0, total_bytes=total_bytes)
+
+    metrics = remux_progressively(
+        responses, [temp_video_path, temp_audio_path], entry,
+        on_progress=lambda n: report(bytes_downloaded=n, total_bytes=total_bytes),
+        on_ready=lambda: report(stream_url=f"/progressive/{entry.token}"),
+    )
+    for m, size in zip(metrics, expected):
+        m.total_bytes = size
+        _recent_download_metrics.append(m.to_dict())
+        print(f"下载完成 {m.summary()}")
+        if size is not None and m.bytes_written != size:
+            raise Exception(f"Incomplete download for {m.name}: {m.bytes_written}/{size} bytes")
+    return sum(m.bytes_written for m in metrics)
+
+def _probe_stream(url: str):
+    """探测流的总长度与 Range 支持，返回 (总长度, 完整响应)。
+    支持 Range 时完整响应为 None；否则返回可直接流式读取的 200 响应。"""
+    resp = limited_get_sync(url, headers={**HEADERS, 'Range': 'bytes=0-0'}, stream=True)
+    if not resp:
+        raise Exception("Failed to download audio or video content.")
+    if resp.status_code == 206:
+        total = parse_content_range_total(resp.headers.get('Content-Range'))
+        resp.close()
+        if total:
+            return total, None
+        resp = limited_get_sync(url, headers=HEADERS, stream=True)
+        if not resp:
+            raise Exception("Failed to download audio or video content.")
+    content_length = resp.headers.get('Content-Length', '')
+    return (int(content_length) if content_length.isdigit() else None), resp
+
+def _fetch_stream_range(url: str, start: int, end: int):
+    """请求流的一个字节区间（闭区间），经过同步外呼限流"""
+    return limited_get_sync(url, headers={**HEADERS, 'Range': f'bytes={start}-{end}'}, stream=True)
+
+
+def hls_package_dir(bvid: str, page: int, suffix: str = "") -> Path:
+    """分P的 HLS 目录；suffix 为源文件的档位后缀，不同档位的文件各自打包"""
+    return HLS_DIR / f"{bvid}_p{page}{suffix}"
+
+def package_episode_hls(bvid: str, p_info: dict, video_path: Path) -> Path:
+    """把已合并的分P打包为 HLS：源文件的档位直接切片，更低档位另行下载视频流后切片（均不转码）"""
+    page = p_info['page']
+    suffix = variant_suffix(video_path)
+    package_dir = hls_package_dir(bvid, page, suffix)
+    if (package_dir / MASTER_PLAYLIST).exists():
+        return package_dir
+
+    # 源档位取文件实际对应的流：不带后缀的文件为默认策略选中的档位
+    variant = suffix.lstrip(".")
+    policy = QualityPolicy(max_height=variant_height(variant)) if variant else DEFAULT_POLICY
+    dash = fetch_dash_info(bvid, page, p_info['cid'], dash_qn(policy))
+    source, audio = select_streams(dash, DEFAULT_POLICY)
+    if variant:
+        source = find_variant(dash.get('video'), variant)
+        if source is None:
+            raise Exception(f"DASH 中没有档位 {variant}")
+    package_dir.mkdir(parents=True, exist_ok=True)
+
+    # 已合并的 mp4 同时提供视频与音频
+    source_name = rendition_name(source)
+    package_rendition(video_path, video_path, package_dir / source_name)
+    renditions = [{**source, "name": source_name, "stats": playlist_stats(package_dir / source_name)}]
+
+    for extra in select_extra_renditions(parse_representations(dash['video']), source, HLS_EXTRA_HEIGHTS):
+        name = rendition_name(extra)
+        temp_path = package_dir / f"{name}.download.m4s"
+        try:
+            resp = limited_get_sync(extra['url'], headers=HEADERS, stream=True, priority=PREFETCH)
+            if not resp:
+                raise Exception("Failed to download rendition stream.")
+            stream_response_to_file(resp, temp_path)
+            package_rendition(temp_path, video_path, package_dir / name)
+            renditions.append({**extra, "name": name, "stats": playlist_stats(package_dir / name)})
+        except Exception as e:
+            # 低档位失败不影响已打包的档位
+            print(f"HLS 档位 {name} 打包失败: {e}")
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+    write_master_playlist(package_dir, renditions, audio)
+    print(f"HLS 打包完成 {package_dir.name}: {', '.join(r['name'] for r in renditions)}")
+    return package_dir
+
+def _schedule_hls_packaging(bvid: str, p_info: dict, video_path: Path) -> None:
+    """在后台打包 HLS（同一分P的同一档位只打包一次），不影响播放与下载任务的完成"""
+    key = ("hls", bvid, p_info['page'], variant_suffix(video_path))
+    if not hls_available() or _singleflight.in_flight(key):
+        return
+
+    async def run():
+        try:
+            await _singleflight.do(key, lambda: asyncio.to_thread(package_episode_hls, bvid, p_info, video_path))
+        except Exception as e:
+            print(f"HLS 打包失败 {bvid} P{p_info['page']}: {e}")
+
+    task = asyncio.create_task(run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
-# --- API Endpoints ---
 
-def scan_folders_recursive(base_path: Path, current_path: Path = None, depth: int = 0, max_depth: int = 10) -> List[dict]:
-    """递归扫描文件夹结构"""
-    if current_path is None:
-        current_path = base_path
-    
-    if depth > max_depth:
-        return []
-    
-    folders = []
-    
-    try:
-        for item in current_path.iterdir():
-            if item.is_dir():
-                # 计算相对路径
-                relative_path = str(item.relative_to(base_path))
-                parent_path = str(current_path.relative_to(base_path)) if current_path != base_path else ""
-                
-                # 检查是否有list.txt文件
-                list_file = item / "list.txt"
-                has_list_file = list_file.exists()
-                
-                # 递归扫描子文件夹
-                children = scan_folders_recursive(base_path, item, depth + 1, max_depth)
-                
-                folder_info = {
-                    "name": item.name,
-                    "path": relative_path,
-                    "parent_path": parent_path if parent_path else None,
-                    "children": children,
-                    "has_list_file": has_list_file,
-                    "video_count": 0,
-                    "downloaded_count": 0,
-                    "depth": depth,
-                    "is_folder": True
-                }
-                
-                folders.append(folder_info)
-    except PermissionError:
-        pass
-    
-    # 对文件夹进行中文友好排序
-    return sort_folders_chinese(folders)
+def video_folder(folder_path: str) -> Path:
+    """视频目录下的子目录；解析后不在视频目录内（如含 ..、绝对路径）时返回 404"""
+    root = VIDEOS_DIR.resolve()
+    target = (root / folder_path).resolve()
+    if target != root and root not in target.parents:
+        raise HTTPException(status_code=404, detail=f"Folder not found: {folder_path}")
+    return target
 
-@app.get("/api/folders")
-async def list_folders(path: str = ""):
-    """获取文件夹列表，支持嵌套路径"""
-    if not VIDEOS_DIR.is_dir():
-        return JSONResponse(content=[], headers={"Content-Type": "application/json; charset=utf-8"})
-    
-    # 确定要扫描的目录
-    if path and path.strip():
-        target_path = VIDEOS_DIR / path
-        if not target_path.exists() or not target_path.is_dir():
-            raise HTTPException(status_code=404, detail=f"Folder not found: {path}")
-    else:
-        target_path = VIDEOS_DIR
-    
-    # 直接扫描指定目录下的直接子文件夹
-    folders = []
-    try:
-        for item in target_path.iterdir():
-            if item.is_dir():
-                relative_path = str(item.relative_to(VIDEOS_DIR)).replace('\\', '/')  # 确保使用正斜杠
-                list_file = item / "list.txt"
-                has_list_file = list_file.exists()
-                
-                folder_info = {
-                    "name": item.name,
-                    "path": relative_path,
-                    "parent_path": path if path and path.strip() else None,
-                    "children": [],
-                    "has_list_file": has_list_file,
-                    "video_count": 0,
-                    "downloaded_count": 0,
-                    "depth": len(path.split('/')) if path and path.strip() else 0,
-                    "is_folder": True
-                }
-                folders.append(folder_info)
-    except PermissionError:
-        pass
-    
-    # 对文件夹进行中文友好排序
-    sorted_folders = sort_folders_chinese(folders)
-    return JSONResponse(content=sorted_folders, headers={"Content-Type": "application/json; charset=utf-8"})
 
-@app.get("/api/folders/{folder_path:path}")
-async def list_videos_in_folder(folder_path: str):
+# --- API Endpoints ---
+
+@app.get("/api/folders")
+async def list_folders(path: str = "", depth: int = 0):
     """
-    快速返回视频列表基本信息，实现分阶段加载
-    第一阶段：立即返回基本信息（标题、分P数量）
+    获取文件夹列表，支持嵌套路径；由内存中的文件夹索引返回
+    depth > 0 时每个子文件夹的 children 再带 depth 层子树（最多 10 层）
     """
-    target_folder = VIDEOS_DIR / folder_path
-    list_file = target_folder / "list.txt"
+    if ".." in path.replace('\\', '/').split('/'):
+        raise HTTPException(status_code=404, detail=f"Folder not found: {path}")
+    if not folder_index.watching:
+        # 没有文件监视时按请求重新列出目录（与所需的层数）
+        await asyncio.to_thread(folder_index.refresh, path, depth + 1)
+    folders = folder_index.children(path, depth)
+    if folders is None:
+        if not path.strip():
+            return JSONResponse(content=[], headers={"Content-Type": "application/json; charset=utf-8"})
+        raise HTTPException(status_code=404, detail=f"Folder not found: {path}")
+    return JSONResponse(content=folders, headers={"Content-Type": "application/json; charset=utf-8"})
+
+async def iter_episode_details(episodes: List[Dict], cover_sources: Dict[str, str]):
+    """以有界并发检查各剧集的字幕可用性，按完成顺序逐个产出详情"""
+    sem = asyncio.Semaphore(_DETAILS_CONCURRENCY)
+
+    async def build(episode: Dict) -> Dict:
+        async with sem:
+            has_subtitle = await check_subtitle_availability_async(episode['bvid'], episode['page'], episode['cid'])
+        return {
+            "id": episode['id'],
+            "index": episode['index'],
+            "bvid": episode['bvid'],
+            "page": episode['page'],
+            "cover_source": cover_sources.get(episode['id'], ''),
+            "duration": episode.get('duration', 0),
+            "has_subtitle": has_subtitle
+        }
 
-    if not list_file.exists():
-        raise HTTPException(status_code=404, detail=f"'list.txt' not found in folder '{folder_path}'")
+    tasks = [asyncio.create_task(build(episode)) for episode in episodes]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # 客户端提前断开时取消剩余检查
+        for task in tasks:
+            task.cancel()
+
+# 注意：/details 与 /covers 需在 /api/folders/{folder_path:path} 之前注册，否则会被其路径参数吞掉
+@app.get("/api/folders/{folder_path:path}/details")
+async def get_videos_details(folder_path: str, stream: bool = False):
+    """
+    第二阶段：获取视频详细信息（封面、字幕状态等），覆盖 list.txt 中的所有来源
+    stream=true 时以 NDJSON 逐行返回，每完成一个剧集输出一行
+    """
+    album = await load_album(folder_path)
+    cover_sources = await album_cover_sources(album)
 
-    with open(list_file, 'r', encoding='utf-8') as f:
-        bvid_lines = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    if stream:
+        async def ndjson_lines():
+            async for detail in iter_episode_details(album.episodes, cover_sources):
+                yield json.dumps(detail, ensure_ascii=False) + "\n"
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson; charset=utf-8")
 
-    if not bvid_lines:
-        raise HTTPException(status_code=404, detail=f"'list.txt' is empty or contains no valid BV IDs.")
+    detailed_parts = [detail async for detail in iter_episode_details(album.episodes, cover_sources)]
+    detailed_parts.sort(key=lambda d: d['index'])
+    return JSONResponse(content=detailed_parts, headers={"Content-Type": "application/json; charset=utf-8"})
 
-    try:
-        bvid = extract_bvid_from_url(bvid_lines[0])
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+@app.get("/api/folders/{folder_path:path}/covers")
+async def get_folder_covers(folder_path: str, stream: bool = False, priority: str = ""):
+    """
+    文件夹封面清单：一次返回所有已缓存的封面（按剧集 ID），缺失的交给预取引擎下载
+    stream=true 时以 NDJSON 返回：首行为清单，之后每下载完成一个封面输出一行，最后输出 done
+    priority: 逗号分隔的剧集 ID（如可视区域内的剧集），优先下载
+    """
+    album = await load_album(folder_path)
+    cover_sources = await album_cover_sources(album)
+
+    covers = {}
+    missing = {}
+    for episode in album.episodes:
+        cover_filename = f"{episode['id']}.jpg"
+        if (COVERS_DIR / cover_filename).exists():
+            covers[episode['id']] = f"/covers/{cover_filename}"
+        elif cover_sources.get(episode['id']):
+            missing[episode['id']] = episode
+
+    priority_ids = [eid for eid in (p.strip() for p in priority.split(',')) if eid in missing]
+    pending = list(dict.fromkeys(priority_ids + list(missing)))
+    tasks = {}
+    for eid in pending:
+        episode = missing[eid]
+        tasks[eid] = cover_prefetcher.prefetch(episode['bvid'], episode['page'], cover_sources[eid])
+    for bvid in album.bvids:
+        cover_prefetcher.promote(bvid, [missing[eid]['page'] for eid in priority_ids if missing[eid]['bvid'] == bvid])
+
+    manifest = {"bvids": album.bvids, "covers": covers, "pending": pending}
+    if not stream:
+        # 非流式：只返回已缓存部分，缺失的在后台继续下载
+        return JSONResponse(content=manifest, headers={"Content-Type": "application/json; charset=utf-8"})
+
+    async def wait_cover(eid: str, task: asyncio.Task):
+        try:
+            # shield：客户端断开只取消等待，共享的下载由预取引擎继续持有
+            return eid, await asyncio.shield(task)
+        except Exception:
+            return eid, ""
+
+    async def ndjson_lines():
+        yield json.dumps({"type": "manifest", **manifest}, ensure_ascii=False) + "\n"
+        waiters = [asyncio.create_task(wait_cover(eid, task)) for eid, task in tasks.items()]
+        try:
+            for next_done in asyncio.as_completed(waiters):
+                eid, cover_url = await next_done
+                if cover_url:
+                    yield json.dumps({"type": "cover", "id": eid, "page": missing[eid]['page'],
+                                      "cover_url": cover_url}, ensure_ascii=False) + "\n"
+            yield json.dumps({"type": "done"}) + "\n"
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson; charset=utf-8")
 
-    # 使用异步函数获取基本信息，优先尝试详细信息
-    video_parts = await get_video_parts_async(bvid)
-    if not video_parts:
-        raise HTTPException(status_code=500, detail=f"Could not fetch video parts for BV ID: {bvid}")
+@app.get("/api/folders/{folder_path:path}")
+async def list_videos_in_folder(folder_path: str):
+    """
+    快速返回视频列表基本信息，实现分阶段加载
+    第一阶段：立即返回基本信息（标题、分P数量）；list.txt 中的所有来源按顺序合并为一个剧集列表
+    """
+    album = await load_album(folder_path)
 
     # 快速返回基本信息，不包含封面和详细信息
     enhanced_parts = []
-    for part in video_parts:
+    for episode in album.episodes:
         enhanced_parts.append({
-            "title": part['part'],
-            "page": part['page'],
+            "id": episode['id'],
+            "index": episode['index'],
+            "title": episode['part'],
+            "page": episode['page'],
             "cover_url": "",  # 稍后异步加载
-            "duration": part.get('duration', 0),
-            "cid": part['cid'],
-            "bvid": bvid,
+            "duration": episode.get('duration', 0),
+            "cid": episode['cid'],
+            "bvid": episode['bvid'],
             "has_subtitle": None  # 稍后异步检查
         })
 
     return JSONResponse(content=enhanced_parts, headers={"Content-Type": "application/json; charset=utf-8"})
 
-@app.get("/api/folders/{folder_path:path}/details")
-async def get_videos_details(folder_path: str):
-    """
-    第二阶段：获取视频详细信息（封面、字幕状态等）
-    """
-    target_folder = VIDEOS_DIR / folder_path
-    list_file = target_folder / "list.txt"
-
-    if not list_file.exists():
-        raise HTTPException(status_code=404, detail=f"'list.txt' not found in folder '{folder_path}'")
-
-    with open(list_file, 'r', encoding='utf-8') as f:
-        bvid_lines = [line.strip() for line in f if line.strip() and not line.startswith('#')]
-
-    if not bvid_lines:
-        raise HTTPException(status_code=404, detail=f"'list.txt' is empty or contains no valid BV IDs.")
-
-    try:
-        bvid = extract_bvid_from_url(bvid_lines[0])
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-    # 获取详细信息（包含封面URL）
-    video_parts = await get_video_parts_with_covers_async(bvid)
-    if not video_parts:
-        raise HTTPException(status_code=500, detail=f"Could not fetch detailed video parts for BV ID: {bvid}")
-
-    # 返回详细信息
-    detailed_parts = []
-    for part in video_parts:
-        # 异步检查字幕可用性
-        has_subtitle = await check_subtitle_availability_async(bvid, part['page'], part['cid'])
-
-        detailed_parts.append({
-            "page": part['page'],
-            "cover_source": part.get('cover_url', ''),
-            "duration": part.get('duration', 0),
-            "has_subtitle": has_subtitle
-        })
-
-    return JSONResponse(content=detailed_parts, headers={"Content-Type": "application/json; charset=utf-8"})
-
 @app.get("/api/batch/covers/{bvid}")
 async def get_batch_covers(bvid: str, pages: str):
     """
@@ -980,25 +1285,22 @@ async def get_batch_covers(bvid: str, pages: str):
         # 创建页码到封面URL的映射
         page_to_cover = {}
         for part in video_parts:
-            if part['page'] in page_numbers:
-                page_to_cover[part['page']] = part.get('cover_url', '')
+            if part['page'] in page_numbers and part.get('cover_url'):
+                page_to_cover[part['page']] = part['cover_url']
 
-        # 批量下载封面
+        # 已缓存的直接返回，其余并行下载（受并发上限与外呼限流约束）
         covers = {}
-        for page_num in page_numbers:
-            cover_url = page_to_cover.get(page_num, '')
-            if cover_url:
-                # 检查是否已缓存
-                cover_filename = f"{bvid}_p{page_num}.jpg"
-                cover_path = COVERS_DIR / cover_filename
-
-                if cover_path.exists():
-                    covers[str(page_num)] = f"/covers/{cover_filename}"
-                else:
-                    # 异步下载
-                    downloaded_url = await download_and_cache_cover_async(bvid, page_num, cover_url)
-                    if downloaded_url:
-                        covers[str(page_num)] = downloaded_url
+        missing = {}
+        for page_num, cover_url in page_to_cover.items():
+            cover_filename = f"{bvid}_p{page_num}.jpg"
+            if (COVERS_DIR / cover_filename).exists():
+                covers[str(page_num)] = f"/covers/{cover_filename}"
+            else:
+                missing[page_num] = cover_url
+
+        if missing:
+            downloaded = await cover_prefetcher.fetch_many(bvid, missing, order=page_numbers)
+            covers.update({str(page_num): url for page_num, url in downloaded.items()})
 
         return JSONResponse(content={"covers": covers}, headers={"Content-Type": "application/json; charset=utf-8"})
 
@@ -1034,8 +1336,8 @@ async def get_video_cover(bvid: str, page_number: int):
         if not target_part or not target_part.get('cover_url'):
             return JSONResponse(content={"cover_url": "", "cached": False}, headers={"Content-Type": "application/json; charset=utf-8"})
 
-        # 下载并缓存封面
-        cover_url = await download_and_cache_cover_async(bvid, page_number, target_part['cover_url'])
+        # 下载并缓存封面（与预取中的同一封面共用一次下载）
+        cover_url = await cover_prefetcher.fetch(bvid, page_number, target_part['cover_url'])
         return JSONResponse(content={"cover_url": cover_url, "cached": False}, headers={"Content-Type": "application/json; charset=utf-8"})
 
     except Exception as e:
@@ -1046,91 +1348,88 @@ async def get_video_cover(bvid: str, page_number: int):
 async def preload_covers(request_data: dict):
     """
     预加载封面，用于提升用户体验
-    request_data: {"bvid": "BV1xx", "pages": [1, 2, 3]}
+    request_data: {"episodes": ["BV1xx_p1", "BV1yy_p2"], "priority": false}
+    或单个来源的 {"bvid": "BV1xx", "pages": [1, 2, 3]}
+    priority 为 true 时（如剧集进入可视区域）把这些封面提到下载队列最前
     """
     try:
-        bvid = request_data.get('bvid')
-        pages = request_data.get('pages', [])
-
-        if not bvid or not pages:
-            return {"status": "error", "message": "Missing bvid or pages"}
-
-        # 获取视频详细信息
-        video_parts = await get_video_parts_with_covers_async(bvid)
-        if not video_parts:
-            return {"status": "error", "message": "Could not fetch video parts"}
-
-        # 创建页码到封面URL的映射
-        page_to_cover = {}
-        for part in video_parts:
-            if part['page'] in pages:
-                page_to_cover[part['page']] = part.get('cover_url', '')
-
-        # 异步预加载封面（不等待完成）
-        preload_tasks = []
-        for page_num in pages:
-            cover_url = page_to_cover.get(page_num, '')
-            if cover_url:
-                # 检查是否已缓存
-                cover_filename = f"{bvid}_p{page_num}.jpg"
-                cover_path = COVERS_DIR / cover_filename
-
-                if not cover_path.exists():
-                    # 创建预加载任务
-                    task = asyncio.create_task(
-                        download_and_cache_cover_async(bvid, page_num, cover_url)
-                    )
-                    preload_tasks.append(task)
-
-        # 启动预加载任务（不等待完成）
-        if preload_tasks:
-            asyncio.create_task(asyncio.gather(*preload_tasks, return_exceptions=True))
-
-        return {"status": "success", "preloading": len(preload_tasks)}
+        # 按来源分组：bvid -> 页码列表
+        groups: Dict[str, List[int]] = {}
+        for eid in request_data.get('episodes', []):
+            parsed = parse_episode_id(str(eid))
+            if parsed:
+                groups.setdefault(parsed[0], []).append(parsed[1])
+        if request_data.get('bvid') and request_data.get('pages'):
+            groups.setdefault(request_data['bvid'], []).extend(request_data['pages'])
+
+        if not groups:
+            return {"status": "error", "message": "Missing episodes or bvid/pages"}
+
+        preloading = 0
+        for bvid, pages in groups.items():
+            # 获取视频详细信息
+            video_parts = await get_video_parts_with_covers_async(bvid)
+            if not video_parts:
+                continue
+
+            # 创建页码到封面URL的映射
+            page_to_cover = {}
+            for part in video_parts:
+                if part['page'] in pages:
+                    page_to_cover[part['page']] = part.get('cover_url', '')
+
+            # 交给预取引擎在后台下载（不等待完成），任务由引擎跟踪
+            for page_num in pages:
+                cover_url = page_to_cover.get(page_num, '')
+                if cover_url and not (COVERS_DIR / f"{bvid}_p{page_num}.jpg").exists():
+                    cover_prefetcher.prefetch(bvid, page_num, cover_url)
+                    preloading += 1
+            if request_data.get('priority'):
+                cover_prefetcher.promote(bvid, pages)
+
+        return {"status": "success", "preloading": preloading}
 
     except Exception as e:
         print(f"预加载封面失败: {e}")
         return {"status": "error", "message": str(e)}
 
+@app.get("/api/covers/status")
+async def get_cover_prefetch_status():
+    """封面预取引擎与缩略图生成状态"""
+    return {**cover_prefetcher.status(), "thumbnails": thumbnail_pipeline.status()}
+
 
-@app.get("/api/play/{folder_path:path}/{page_number}")
-async def play_video(folder_path: str, page_number: int):
+@app.get("/api/play/{folder_path:path}/{episode}")
+async def play_video(folder_path: str, episode: str, max_height: Optional[int] = None,
+                     codecs: Optional[str] = None, max_bandwidth: Optional[int] = None):
     """
-    播放视频，包含字幕检查（恢复原有功能）
+    播放视频，包含字幕检查（恢复原有功能）；episode 为剧集 ID（BV1xx_p3）或专辑序号
+    max_height / codecs / max_bandwidth 为客户端的清晰度偏好
     """
-    target_folder = VIDEOS_DIR / folder_path
-    list_file = target_folder / "list.txt"
-
-    if not list_file.exists():
-        raise HTTPException(status_code=404, detail=f"'list.txt' not found in folder '{folder_path}'")
-
-    with open(list_file, 'r', encoding='utf-8') as f:
-        bvid_lines = [line.strip() for line in f if line.strip() and not line.startswith('#')]
-
-    if not bvid_lines:
-        raise HTTPException(status_code=404, detail="'list.txt' is empty.")
+    # 播放请求的外呼（分P信息、字幕）优先于详情与封面预取
+    with outbound_priority(PLAY):
+        return await _play_video(folder_path, episode, max_height, codecs, max_bandwidth)
 
+async def _play_video(folder_path: str, episode: str, max_height: Optional[int],
+                      codecs: Optional[str], max_bandwidth: Optional[int]):
+    target_folder = video_folder(folder_path)
     try:
-        bvid = extract_bvid_from_url(bvid_lines[0])
+        policy = resolve_policy(target_folder, max_height, codecs, max_bandwidth)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    # 使用异步函数获取视频分P信息
-    video_parts = await get_video_parts_async(bvid)
-    if not video_parts:
-        raise HTTPException(status_code=500, detail="Could not fetch video parts.")
+    target_part = await load_episode(folder_path, episode)
+    bvid = target_part['bvid']
+    page_number = target_part['page']
 
-    target_part = None
-    for part in video_parts:
-        if part['page'] == page_number:
-            target_part = part
-            break
-
-    if not target_part:
-        raise HTTPException(status_code=404, detail=f"Page number {page_number} not found for this BV ID.")
-
-    clean_name = re.sub(r'[\\/*?:"<>|]', "", target_part['part'])
-    final_video_path = target_folder / f"{clean_name}.mp4"
+    # 该策略选过档位时查找对应文件；尚未下载、但默认档位已在本地时直接播放，不再重复下载
+    default_video_path = target_folder / f"{target_part['file_name']}.mp4"
+    suffix = await known_variant_suffix(bvid, target_part['cid'], policy)
+    final_video_path = default_video_path
+    if suffix:
+        final_video_path = target_folder / f"{target_part['file_name']}{suffix}.mp4"
+        if not final_video_path.exists() and default_video_path.exists():
+            final_video_path = default_video_path
 
     # 检查字幕可用性和获取字幕（恢复原有功能）
     has_subtitle = await check_subtitle_availability(bvid, page_number, target_part['cid'])
@@ -1140,89 +1439,242 @@ async def play_video(folder_path: str, page_number: int):
 
     # If file exists, return its path immediately.
     if final_video_path.exists():
+        # 已打包 HLS 时一并返回主播放列表，否则在后台补打包；HLS 按实际播放的文件的档位区分
+        hls_url = ""
+        package_dir = hls_package_dir(bvid, page_number, variant_suffix(final_video_path))
+        if (package_dir / MASTER_PLAYLIST).exists():
+            hls_url = f"/hls/{package_dir.name}/{MASTER_PLAYLIST}"
+        else:
+            _schedule_hls_packaging(bvid, target_part, final_video_path)
         return {
             "status": "ready",
             "video_url": f"/static/{folder_path}/{final_video_path.name}",
+            "hls_url": hls_url,
             "has_subtitle": has_subtitle,
             "subtitle_url": subtitle_url
         }
 
     # If file does not exist, start download and return a "pending" status.
+    # 文件名在任务选定档位后确定，届时更新任务的 video_url
+    job = submit_download_job(
+        bvid,
+        {"p_info": target_part, "target_dir": target_folder, "policy": policy},
+        folder_path=folder_path,
+        page=page_number,
+        video_url=f"/static/{folder_path}/{final_video_path.name}",
+        key=_job_key(bvid, target_part['cid'], policy),
+    )
+    return {
+        "status": "pending",
+        "job_id": job.task_id,
+        "video_url": job.video_url,
+        "quality": policy.to_dict(),
+        "has_subtitle": has_subtitle,
+        "subtitle_url": subtitle_url
+    }
+
+# --- Download Jobs ---
+
+def _job_key(bvid: str, cid: int, policy: QualityPolicy = DEFAULT_POLICY) -> str:
+    """任务去重键：bvid + cid + 清晰度策略，同一策略的重复请求复用同一个任务"""
+    return f"{bvid}:{cid}:{policy.key()}"
+
+def submit_download_job(bv_id: str, payload: Dict[str, Any], **kwargs) -> DownloadStatus:
+    """提交下载任务；调度器未运行（应用未经 lifespan 启动或正在关闭）时返回 503"""
     try:
-        # 使用异步线程池下载
-        await asyncio.to_thread(download_and_merge, bvid, target_part, target_folder)
-        return {
-            "status": "ready",
-            "video_url": f"/static/{folder_path}/{final_video_path.name}",
-            "has_subtitle": has_subtitle,
-            "subtitle_url": subtitle_url
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to download video: {str(e)}")
+        return download_scheduler.submit(bv_id, payload, **kwargs)
+    except SchedulerNotRunning as e:
+        print(f"无法提交下载任务: {e}")
+        raise HTTPException(status_code=503, detail="Download scheduler is not running.")
+
+def _download_key(bvid: str, cid: int, variant: str) -> str:
+    """下载去重键：bvid + cid + 选中的档位，不同策略选中同一路流时只下载一次"""
+    return f"{bvid}:{cid}:{variant}"
+
+async def _run_download_job(job: DownloadStatus, payload: Dict[str, Any], report: Callable[..., None]):
+    """在线程池中执行下载与合并，进度通过 report 回传给调度器；同一分P同一档位的并发下载合并为一次"""
+    p_info = payload["p_info"]
+    policy = payload.get("policy", DEFAULT_POLICY)
+    # 下载有人在等着看，外呼优先于详情与封面预取
+    with outbound_priority(PLAY):
+        selection = await resolve_selection(job.bv_id, p_info, policy)
+        clean_name = selection.file_stem(p_info.get('file_name') or sanitize_filename(p_info['part']))
+        report(video_url=f"/static/{job.folder_path}/{clean_name}.mp4")
+        key = _download_key(job.bv_id, p_info['cid'], selection.variant)
+        video_path = await _singleflight.do(
+            ("download", key),
+            lambda: download_and_merge(job.bv_id, p_info, payload["target_dir"], report, key, policy, selection),
+        )
+    _schedule_hls_packaging(job.bv_id, p_info, Path(video_path))
+    return video_path
 
+download_scheduler = DownloadScheduler(
+    _run_download_job,
+    max_workers=_DOWNLOAD_WORKERS,
+)
 
+@app.post("/api/jobs")
+async def create_download_job(request: DownloadRequest):
+    """提交下载任务，立即返回任务状态"""
+    target_folder = video_folder(request.folder_path)
+    if not target_folder.is_dir():
+        raise HTTPException(status_code=404, detail=f"Folder not found: {request.folder_path}")
+    try:
+        policy = resolve_policy(target_folder, request.max_height, request.codecs, request.max_bandwidth)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+    # 文件夹的专辑中有该剧集时沿用专辑中的文件名（同名分P已去重）
+    try:
+        target_part = (await load_album(request.folder_path)).find(episode_id(request.bv_id, request.page))
+    except HTTPException:
+        target_part = None
+    if not target_part:
+        video_parts = await get_video_parts_async(request.bv_id)
+        if not video_parts:
+            raise HTTPException(status_code=500, detail="Could not fetch video parts.")
+        target_part = next((part for part in video_parts if part['page'] == request.page), None)
+    if not target_part:
+        raise HTTPException(status_code=404, detail=f"Page number {request.page} not found for this BV ID.")
+
+    # 文件名在任务选定档位后确定，此处先给出已知的选择（尚未选过时为默认档位的文件名）
+    clean_name = target_part.get('file_name') or sanitize_filename(target_part['part'])
+    suffix = await known_variant_suffix(request.bv_id, target_part['cid'], policy)
+    job = submit_download_job(
+        request.bv_id,
+        {"p_info": target_part, "target_dir": target_folder, "policy": policy},
+        folder_path=request.folder_path,
+        page=request.page,
+        video_url=f"/static/{request.folder_path}/{clean_name}{suffix or ''}.mp4",
+        key=_job_key(request.bv_id, target_part['cid'], policy),
+    )
+    return job
+
+@app.get("/api/jobs")
+async def list_download_jobs():
+    """列出近期的下载任务"""
+    return download_scheduler.list()
+
+@app.get("/api/jobs/{job_id}")
+async def get_download_job(job_id: str):
+    """轮询单个下载任务的状态与进度"""
+    job = download_scheduler.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_download_job(job_id: str):
+    """以 Server-Sent Events 推送下载任务状态，直到任务结束"""
+    if not download_scheduler.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found.")
+
+    async def event_stream():
+        async for snapshot in download_scheduler.subscribe(job_id):
+            yield f"data: {snapshot.model_dump_json()}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/api/downloads/metrics")
+async def get_download_metrics():
+    """最近完成的下载指标（字节数、速率、峰值缓冲）与合并池状态"""
+    return {"downloads": list(_recent_download_metrics), "merges": merge_pool.status()}
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """进程内缓存的条目数、估算字节数与命中/淘汰统计"""
+    return {"caches": [_video_parts_cache.stats(), _wbi_key_cache.stats(), _subtitle_index.stats(),
+                       _hls_segment_cache.stats(), album_manifests.stats(), list_index.stats(),
+                       folder_index.stats()]}
+
+@app.get("/api/outbound/stats")
+async def get_outbound_stats():
+    """外呼限流状态：各主机令牌与排队数、并发占用、各优先级的排队等待时间，以及冷却中的端点"""
+    now = time.monotonic()
+    cooldowns = {key: round(until - now, 1) for key, until in list(_cooldowns.items()) if until > now}
+    return {**outbound_limiter.stats(), "cooldowns": cooldowns}
 
-@app.get("/static/{folder_path:path}/{file_name}")
-async def serve_static_video(folder_path: str, file_name: str):
+@app.api_route("/static/{folder_path:path}/{file_name}", methods=["GET", "HEAD"])
+async def serve_static_video(folder_path: str, file_name: str, request: Request):
     """Serves the video files statically."""
     file_path = VIDEOS_DIR / folder_path / file_name
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="File not found.")
-    return FileResponse(file_path)
+    return await serve_file_with_ranges(request, file_path, REVALIDATE_DAILY)
+
+@app.get("/progressive/{token}")
+async def serve_progressive_video(token: str, request: Request):
+    """边下边播：推送正在封装的 fMP4，直到下载完成；Range 请求返回已写出的部分"""
+    entry = progressive_registry.get(token)
+    if not entry or not entry.path.exists():
+        raise HTTPException(status_code=404, detail="Progressive stream not available.")
+    return GrowingFileResponse(entry, request.headers.get("range"))
+
+_hls_segment_cache = SegmentCache()
+
+@app.get("/hls/{package}/{file_path:path}")
+async def serve_hls_file(package: str, file_path: str, request: Request):
+    """提供 HLS 播放列表与分片；分片经内存缓存读取，可长期缓存，播放列表每次重新验证"""
+    parts = file_path.split("/")
+    if (not re.fullmatch(rf'BV\w+_p\d+(\.{POLICY_KEY_PATTERN.pattern})?', package) or len(parts) > 2
+            or any(not re.fullmatch(r'[\w.\-]+', p) or p.startswith('.') for p in parts)):
+        raise HTTPException(status_code=404, detail="HLS file not found.")
+    path = HLS_DIR / package / file_path
+    try:
+        stat_result = await asyncio.to_thread(os.stat, path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="HLS file not found.")
+
+    etag = f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": NO_CACHE if path.suffix == ".m3u8" else LONG_LIVED,
+    }
+    if is_not_modified(request.headers, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    data = await asyncio.to_thread(_hls_segment_cache.read, path, stat_result)
+    return Response(content=data, media_type=HLS_MEDIA_TYPES.get(path.suffix, "application/octet-stream"),
+                    headers=headers)
 
 @app.get("/covers/{file_name}")
-async def serve_cover_image(file_name: str):
-    """Serves the cover images statically."""
+async def serve_cover_image(file_name: str, request: Request, w: Optional[int] = None):
+    """
+    提供封面图片；w 为期望显示宽度（像素），按 Accept 优先返回 AVIF/WebP 缩略图
+    缩略图尚未生成时返回原图并在后台生成
+    """
     file_path = COVERS_DIR / file_name
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Cover image not found.")
-    return FileResponse(file_path)
+    if not w:
+        return await cached_file_response(request, file_path, LONG_LIVED)
+    # 按清单选择变体，不逐个 stat；没有清单（尚未生成或原图已变化）时在后台生成
+    manifest = await thumbnail_pipeline.manifest(file_path)
+    pending = thumbnail_pipeline.enabled and manifest is None
+    if pending:
+        thumbnail_pipeline.schedule(file_path)
+    variant = choose_variant(file_path, w, request.headers.get("accept"), thumbnail_pipeline.widths, manifest)
+    media_type = MEDIA_TYPES.get(variant.suffix.lstrip('.'))
+    # 缩略图尚未生成时返回的原图不长期缓存，之后可拿到更小的变体
+    cache_control = NO_CACHE if pending and variant == file_path else LONG_LIVED
+    return await cached_file_response(request, variant, cache_control, media_type=media_type,
+                                      headers={"Vary": "Accept"})
 
 @app.get("/subtitles/{file_name}")
-async def serve_subtitle_file(file_name: str):
+async def serve_subtitle_file(file_name: str, request: Request):
     """Serves the subtitle files statically."""
     file_path = SUBTITLES_DIR / file_name
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Subtitle file not found.")
-    return FileResponse(file_path, media_type="text/vtt")
-
-@app.get("/api/subtitle/{folder_path:path}/{page_number}")
-async def get_subtitle(folder_path: str, page_number: int):
-    """获取指定视频的字幕文件"""
-    target_folder = VIDEOS_DIR / folder_path
-    list_file = target_folder / "list.txt"
-
-    if not list_file.exists():
-        raise HTTPException(status_code=404, detail=f"'list.txt' not found in folder '{folder_path}'")
-
-    with open(list_file, 'r', encoding='utf-8') as f:
-        bvid_lines = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    return await cached_file_response(request, file_path, LONG_LIVED, media_type="text/vtt")
 
-    if not bvid_lines:
-        raise HTTPException(status_code=404, detail="'list.txt' is empty.")
-
-    try:
-        bvid = extract_bvid_from_url(bvid_lines[0])
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-    # 获取视频分P信息
-    video_parts = get_video_parts_with_covers(bvid)
-    if not video_parts:
-        video_parts = get_video_parts(bvid)
-        if not video_parts:
-            raise HTTPException(status_code=500, detail="Could not fetch video parts.")
-
-    # 找到对应的分P
-    target_part = None
-    for part in video_parts:
-        if part['page'] == page_number:
-            target_part = part
-            break
-
-    if not target_part:
-        raise HTTPException(status_code=404, detail=f"Page number {page_number} not found.")
+@app.get("/api/subtitle/{folder_path:path}/{episode}")
+async def get_subtitle(folder_path: str, episode: str):
+    """获取指定视频的字幕文件；episode 为剧集 ID（BV1xx_p3）或专辑序号"""
+    target_part = await load_episode(folder_path, episode)
+    bvid = target_part['bvid']
+    page_number = target_part['page']
 
     # 下载并缓存字幕
     subtitle_path = await download_and_cache_subtitle(bvid, page_number, target_part['cid'])
@@ -1233,39 +1685,61 @@ async def get_subtitle(folder_path: str, page_number: int):
     return {"subtitle_url": subtitle_path}
 
 # --- Frontend Routes ---
+def render_index_html() -> str:
+    """读取 index.html 并把资源引用替换为带内容哈希的 URL"""
+    return asset_fingerprints.rewrite_html((FRONTEND_DIR / "index.html").read_text(encoding='utf-8'))
+
 @app.get("/", response_class=HTMLResponse)
 async def serve_frontend():
     """服务前端主页"""
     index_file = FRONTEND_DIR / "index.html"
     if index_file.exists():
-        return HTMLResponse(content=index_file.read_text(encoding='utf-8'))
+        return HTMLResponse(content=render_index_html(), headers={"Cache-Control": NO_CACHE})
     return HTMLResponse("<h1>Frontend not found</h1>", status_code=404)
 
 @app.get("/{file_path:path}")
-async def serve_frontend_files(file_path: str):
+async def serve_frontend_files(file_path: str, request: Request):
     """服务前端静态文件"""
-    file = FRONTEND_DIR / file_path
+    # 带内容哈希的资源（如 app.<hash>.js）可永久缓存；哈希已过期时按普通文件提供
+    real_path, fingerprinted = asset_fingerprints.resolve(file_path)
+    file = FRONTEND_DIR / real_path
     if file.exists() and file.is_file():
-        # 为前端文件添加缓存控制头
-        if file_path.endswith(('.js', '.css')):
-            headers = {
-                "Cache-Control": "no-cache, no-store, must-revalidate",
-                "Pragma": "no-cache",
-                "Expires": "0"
-            }
-            return FileResponse(file, headers=headers)
-        return FileResponse(file)
+        if real_path == "index.html":
+            return HTMLResponse(content=render_index_html(), headers={"Cache-Control": NO_CACHE})
+        return await cached_file_response(request, file, IMMUTABLE if fingerprinted else NO_CACHE)
     # 如果文件不存在，返回主页（用于SPA路由）
     index_file = FRONTEND_DIR / "index.html"
     if index_file.exists():
-        return HTMLResponse(content=index_file.read_text(encoding='utf-8'))
+        return HTMLResponse(content=render_index_html(), headers={"Cache-Control": NO_CACHE})
     return HTMLResponse("<h1>File not found</h1>", status_code=404)
 
-# --- 应用生命周期管理 ---
-@app.on_event("shutdown")
-async def shutdown_event():
+# --- 应用生命周期管理（由 lifespan 调用） ---
+async def startup():
+    """应用启动时预热元数据缓存、索引 list.txt 并启动文件监视与下载工作池"""
+    global fs_watcher
+    loaded = await asyncio.to_thread(warm_metadata_cache)
+    print(f"📦 已从本地载入 {loaded} 条元数据缓存")
+    # 先启动监视再扫描，扫描期间的修改不会丢失；没有可用的监视后端时按请求读取磁盘
+    fs_watcher = await asyncio.to_thread(create_watcher, VIDEOS_DIR, _on_videos_changed)
+    await asyncio.to_thread(index_videos_dir)
+    list_index.watching = folder_index.watching = fs_watcher is not None
+    print(f"👀 文件监视: {fs_watcher.name if fs_watcher else '未启用'}")
+    await download_scheduler.start()
+
+async def shutdown():
     """应用关闭时清理资源"""
+    await download_scheduler.stop()
+    if fs_watcher is not None:
+        fs_watcher.stop()
+    merge_pool.shutdown()
+    progressive_registry.close()
+    await cover_prefetcher.shutdown()
+    thumbnail_pipeline.shutdown()
+    for task in list(_background_tasks):
+        task.cancel()
     await close_http_session()
+    _metadata_store.close()
+    _subtitle_index.flush()
     print("🔄 HTTP会话已关闭")
 
 # --- Main Execution ---
@@ -0,0 +1,207 @@
+"""
+音视频合并工作池：用 asyncio.create_subprocess_exec 运行 ffmpeg（-c copy），不占用线程池线程；
+并发数按 CPU 核数限制，输出带 +faststart（moov 前置，浏览器无需先取文件尾即可起播），
+解析 -progress 输出上报进度，支持超时与取消（终止 ffmpeg 并删除半成品）。
+输入既可以是文件，也可以是边下载边写入的管道（pipe:N），后者不产生临时文件；
+管道输入时超时从输入结束（下载完成）后开始计算，只限制封装本身。
+管道输入的合并在整个下载期间占用名额，因此与文件输入分开限流（pipe_concurrency，由调用方按下载并发数设置），
+CPU 名额（MERGE_CONCURRENCY）只限制文件输入的合并，不会反过来限制同时进行的下载数。
+"""
+import asyncio
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+# 同时运行的 ffmpeg 合并进程上限（-c copy 主要消耗磁盘 IO，默认取核数的一半）
+MERGE_CONCURRENCY = int(os.getenv("MERGE_CONCURRENCY", str(max(1, (os.cpu_count() or 2) // 2))))
+# 单次合并的超时（秒）；管道输入时从输入结束后开始计时
+MERGE_TIMEOUT = float(os.getenv("MERGE_TIMEOUT", "1800"))
+# 是否把下载流经管道直接交给 ffmpeg 合并（Windows 不支持向子进程传递额外的管道描述符）
+PIPE_MERGE_ENABLED = os.getenv("PIPE_MERGE", "1") == "1" and os.name != "nt"
+
+
+class MergeError(Exception):
+    """ffmpeg 合并失败（含超时）"""
+
+
+def pipe_merge_available() -> bool:
+    return PIPE_MERGE_ENABLED and shutil.which("ffmpeg") is not None
+
+
+def merging_path_for(output: Path) -> Path:
+    """合并中的临时输出，如 第1集.mp4 -> 第1集.merging.mp4"""
+    return output.with_name(f"{output.stem}.merging{output.suffix}")
+
+
+def build_merge_command(video_input: str, audio_input: str, output: Path,
+                        extra_args: Sequence[str] = (), faststart: bool = True,
+                        extra_outputs: Sequence[str] = ()) -> List[str]:
+    """合并命令：进度以 key=value 形式写到 stdout，错误写到 stderr。
+    extra_outputs 为同一输入的其他输出（含各自的选项），写在最终输出之前"""
+    command = [
+        'ffmpeg', '-y', '-nostdin', '-loglevel', 'error', '-nostats', '-progress', 'pipe:1',
+        '-i', video_input, '-i', audio_input,
+        *extra_outputs,
+        '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy',
+        *extra_args,
+    ]
+    if faststart:
+        command += ['-movflags', '+faststart']
+    return command + [str(output)]
+
+
+def parse_progress_line(line: str, state: Dict[str, str]) -> bool:
+    """累积一行 -progress 输出；读到一组的结束行（progress=continue/end）时返回 True"""
+    key, sep, value = line.strip().partition("=")
+    if not sep:
+        return False
+    state[key] = value
+    return key == "progress"
+
+
+def _close_fds(fds: Sequence[int]) -> None:
+    for fd in fds:
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+
+class MergePool:
+    """有界的 ffmpeg 合并池：超出上限的合并排队等待"""
+
+    def __init__(self, max_concurrency: int = MERGE_CONCURRENCY, timeout: float = MERGE_TIMEOUT,
+                 pipe_concurrency: int = MERGE_CONCURRENCY):
+        self.max_concurrency = max(1, max_concurrency)
+        self.pipe_concurrency = max(1, pipe_concurrency)
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        # 管道输入的合并边下载边封装，名额按下载槽位而不是 CPU 核数计算
+        self._pipe_semaphore = asyncio.Semaphore(self.pipe_concurrency)
+        self._processes: Dict[int, asyncio.subprocess.Process] = {}
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.total_seconds = 0.0
+
+    async def merge(self, video_input: str, audio_input: str, output: Path,
+                    duration: Optional[float] = None, extra_args: Sequence[str] = (),
+                    on_progress: Optional[Callable[[float], None]] = None,
+                    timeout: Optional[float] = None, faststart: bool = True,
+                    pass_fds: Sequence[int] = (), on_started: Optional[Callable[[], None]] = None,
+                    inputs_done: Optional[asyncio.Event] = None, extra_outputs: Sequence[str] = ()) -> Path:
+        """合并到 output：先写 .merging 临时文件，成功后原子替换。
+        duration（秒）已知时 on_progress 收到 0-1 的进度。失败或超时抛出 MergeError。
+        输入为管道时通过 pass_fds 传入读端（由合并池负责关闭），ffmpeg 启动后调用 on_started 开始写入；
+        给出 inputs_done 时，超时从该事件触发（输入全部写完）后开始计算，下载耗时不计入。
+        管道输入使用独立的名额（pipe_concurrency），不占用文件合并的 CPU 名额。"""
+        merging_path = merging_path_for(output)
+        command = build_merge_command(video_input, audio_input, merging_path, extra_args, faststart, extra_outputs)
+        semaphore = self._pipe_semaphore if pass_fds else self._semaphore
+        self.queued += 1
+        try:
+            await semaphore.acquire()
+        except BaseException:
+            _close_fds(pass_fds)
+            raise
+        finally:
+            self.queued -= 1
+        started = time.monotonic()
+        process = None
+        stderr_task = None
+        follow = None
+        try:
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *command, stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                    pass_fds=tuple(pass_fds))
+            finally:
+                # 读端已复制给 ffmpeg，父进程不再持有，写端关闭后 ffmpeg 才能读到 EOF
+                _close_fds(pass_fds)
+            self._processes[process.pid] = process
+            if on_started:
+                on_started()
+            stderr_task = asyncio.ensure_future(process.stderr.read())
+            follow = asyncio.ensure_future(self._follow_progress(process, duration, on_progress))
+            if inputs_done is not None:
+                waiter = asyncio.ensure_future(inputs_done.wait())
+                try:
+                    await asyncio.wait({follow, waiter}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    waiter.cancel()
+            try:
+                await asyncio.wait_for(follow, timeout or self.timeout)
+                await process.wait()
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise MergeError(f"ffmpeg merge timed out after {timeout or self.timeout:g}s")
+            stderr = (await stderr_task).decode("utf-8", "replace")
+            if process.returncode != 0:
+                raise MergeError(stderr.strip() or f"ffmpeg exited with {process.returncode}")
+            os.replace(merging_path, output)
+            self.completed += 1
+            self.total_seconds += time.monotonic() - started
+            return output
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        except MergeError:
+            self.failed += 1
+            raise
+        finally:
+            try:
+                for task in (stderr_task, follow):
+                    if task is not None and not task.done():
+                        task.cancel()
+                if process is not None and process.returncode is None:
+                    # 超时或取消：终止 ffmpeg，不留下半成品
+                    process.kill()
+                    await asyncio.shield(process.wait())
+            finally:
+                # 等待 ffmpeg 退出时再次被取消也要归还名额
+                if process is not None:
+                    self._processes.pop(process.pid, None)
+                merging_path.unlink(missing_ok=True)
+                semaphore.release()
+
+    async def _follow_progress(self, process: asyncio.subprocess.Process, duration: Optional[float],
+                               on_progress: Optional[Callable[[float], None]]) -> None:
+        state: Dict[str, str] = {}
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                return
+            if not parse_progress_line(line.decode("utf-8", "replace"), state):
+                continue
+            if state.get("progress") == "end":
+                fraction = 1.0
+            elif duration and state.get("out_time_us", "").isdigit():
+                fraction = min(1.0, int(state["out_time_us"]) / 1e6 / duration)
+            else:
+                continue
+            if on_progress:
+                on_progress(fraction)
+
+    def status(self) -> Dict[str, object]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "pipe_concurrency": self.pipe_concurrency,
+            "running": len(self._processes),
+            "queued": self.queued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "cancelled": self.cancelled,
+            "avg_seconds": round(self.total_seconds / self.completed, 3) if self.completed else None,
+        }
+
+    def shutdown(self) -> None:
+        """终止所有运行中的 ffmpeg；等待中的合并随所在任务取消"""
+        for process in list(self._processes.values()):
+            if process.returncode is None:
+                process.kill()
@@ -0,0 +1,94 @@
+"""
+持久化元数据缓存（SQLite）：保存分P列表等B站元数据及其抓取时间，
+重启后可直接从本地读取，过期条目由调用方在后台重新验证。
+"""
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, List, Optional
+
+
+class MetadataEntry:
+    """一条元数据：值、抓取时间（epoch 秒）与有效期（秒）"""
+
+    __slots__ = ("key", "value", "fetched_at", "ttl")
+
+    def __init__(self, key: str, value: Any, fetched_at: float, ttl: float):
+        self.key = key
+        self.value = value
+        self.fetched_at = fetched_at
+        self.ttl = ttl
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def is_fresh(self) -> bool:
+        return self.age < self.ttl
+
+
+class MetadataStore:
+    """基于 SQLite 的键值元数据存储，值以 JSON 保存；可在多个线程中使用"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL,"
+                " ttl REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[MetadataEntry]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, fetched_at, ttl FROM metadata WHERE key = ?", (key,)
+            ).fetchone()
+        if not row:
+            return None
+        return MetadataEntry(key, json.loads(row[0]), row[1], row[2])
+
+    def put(self, key: str, value: Any, ttl: float, fetched_at: Optional[float] = None) -> MetadataEntry:
+        entry = MetadataEntry(key, value, fetched_at if fetched_at is not None else time.time(), ttl)
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metadata (key, value, fetched_at, ttl) VALUES (?, ?, ?, ?)",
+                (key, payload, entry.fetched_at, ttl),
+            )
+            self._conn.commit()
+        return entry
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM metadata WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def load_all(self, max_age: Optional[float] = None) -> List[MetadataEntry]:
+        """读取全部条目（用于启动预热）；max_age 之外的过旧条目不返回"""
+        query = "SELECT key, value, fetched_at, ttl FROM metadata"
+        params: tuple = ()
+        if max_age is not None:
+            query += " WHERE fetched_at >= ?"
+            params = (time.time() - max_age,)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        entries = []
+        for key, value, fetched_at, ttl in rows:
+            try:
+                entries.append(MetadataEntry(key, json.loads(value), fetched_at, ttl))
+            except ValueError:
+                continue
+        return entries
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
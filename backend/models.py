@@ -33,9 +33,16 @@ class DownloadStatus(BaseModel):
     """下载状态模型"""
     task_id: str
     bv_id: str
-    status: str  # pending, downloading, completed, failed
+    status: str  # pending, downloading, merging, completed, failed
     progress: int = 0  # 0-100
     message: str = ""
+    folder_path: str = ""
+    page: Optional[int] = None
+    bytes_downloaded: int = 0
+    total_bytes: Optional[int] = None
+    video_url: str = ""
+    stream_url: str = ""  # 边下边播地址（.part 已可播放时设置）
+    merge_progress: int = 0  # 合并进度 0-100
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
 
@@ -43,3 +50,8 @@ class DownloadRequest(BaseModel):
     """下载请求模型"""
     bv_id: str
     folder_path: str
+    page: int = 1
+    # 可选的清晰度偏好，叠加在默认与专辑策略之上（只能收紧）
+    max_height: Optional[int] = None
+    codecs: Optional[str] = None  # 逗号分隔，靠前优先，如 "hevc,avc"
+    max_bandwidth: Optional[int] = None  # bit/s
@@ -0,0 +1,292 @@
+"""
+边下边播：下载音视频流的同时，通过管道交给 ffmpeg 即时封装为分片 MP4（fMP4），
+写出的 .part 文件一旦包含文件头与首个分片即可开始播放；
+增长中的文件由 GrowingFileResponse 持续推送，直到封装结束；
+封装成功后 .part 文件与令牌再保留 PROGRESSIVE_GRACE 秒，仍在用 Range 请求播放的客户端不会中途收到 404。
+支持管道合并时，fMP4 作为合并进程的另一个输出（fragmented_output_args），与最终的 .mp4 共用同一份输入；
+否则（remux_progressively）下载数据同时写入常规临时文件，之后仍按原流程合并为普通的 .mp4。
+"""
+import asyncio
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from fastapi.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from download_pipeline import DEFAULT_CHUNK_SIZE, DownloadMetrics, write_all
+from video_serving import RangeNotSatisfiable, parse_range_header
+
+# Windows 不支持向子进程传递额外的管道描述符，也不能改名正在读取的文件，不启用
+PROGRESSIVE_ENABLED = os.getenv("PROGRESSIVE_PLAYBACK", "1") == "1" and os.name != "nt"
+# .part 文件至少写出多少字节后通知前端起播（包含 moov 与首个分片）
+PROGRESSIVE_MIN_BYTES = int(os.getenv("PROGRESSIVE_MIN_BYTES", str(512 * 1024)))
+# 每个 fMP4 分片的最长时长（微秒），越小起播越快
+FRAGMENT_DURATION_US = 1000000
+# 推送增长文件时检查新数据的间隔（秒）
+POLL_INTERVAL = 0.1
+# Range 请求的起点尚未写出时最多等待的秒数
+RANGE_WAIT = 5.0
+# 封装成功后 .part 文件与令牌保留的秒数（Safari 等按 Range 分段取数据的客户端可继续播放）
+PROGRESSIVE_GRACE = float(os.getenv("PROGRESSIVE_GRACE", "600"))
+
+
+def progressive_available() -> bool:
+    return PROGRESSIVE_ENABLED and shutil.which("ffmpeg") is not None
+
+
+def fragmented_output_args(path: Path, extra_args: List[str] = ()) -> List[str]:
+    """把输入 0 的视频与输入 1 的音频封装为可边写边播的 fMP4 的 ffmpeg 输出参数"""
+    return [
+        '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy', *extra_args,
+        '-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+        '-frag_duration', str(FRAGMENT_DURATION_US),
+        str(path),
+    ]
+
+
+class GrowingFile:
+    """正在写入的 fMP4 文件：done 之后不会再增长"""
+
+    def __init__(self, token: str, path: Path):
+        self.token = token
+        self.path = path
+        self.done = False
+        self.failed = False
+
+
+class ProgressiveRegistry:
+    """当前可边下边播的文件，按下载键的哈希索引；可在多个线程中使用。
+    写入失败的文件立即移出索引并删除，成功的在 grace 秒后删除"""
+
+    def __init__(self, grace: float = PROGRESSIVE_GRACE):
+        self.grace = grace
+        self._lock = threading.Lock()
+        self._files: Dict[str, GrowingFile] = {}
+
+    @staticmethod
+    def token_for(key: str) -> str:
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+    def register(self, key: str, path: Path) -> GrowingFile:
+        entry = GrowingFile(self.token_for(key), path)
+        with self._lock:
+            self._files[entry.token] = entry
+        return entry
+
+    def get(self, token: str) -> Optional[GrowingFile]:
+        with self._lock:
+            return self._files.get(token)
+
+    def finish(self, entry: GrowingFile, failed: bool = False) -> None:
+        """标记写入结束；已在推送的响应持有该对象，会发送完剩余数据。
+        失败时立即移出索引并删除文件，成功时保留 grace 秒（需在事件循环中调用，否则立即删除）"""
+        entry.failed = failed
+        entry.done = True
+        if failed or self.grace <= 0:
+            self._expire(entry)
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._expire(entry)
+            return
+        loop.call_later(self.grace, self._expire, entry)
+
+    def _expire(self, entry: GrowingFile) -> None:
+        with self._lock:
+            if self._files.get(entry.token) is entry:
+                del self._files[entry.token]
+            # 同一分P重新下载时新的条目沿用同一路径，不能删掉
+            in_use = any(other.path == entry.path for other in self._files.values())
+        if not in_use:
+            entry.path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        """关闭时删除所有 .part 文件"""
+        with self._lock:
+            entries, self._files = list(self._files.values()), {}
+        for entry in entries:
+            entry.path.unlink(missing_ok=True)
+
+
+def remux_progressively(responses: List, temp_paths: List[Path], entry: GrowingFile,
+                        on_progress: Callable[[int], None], on_ready: Callable[[], None]) -> List[DownloadMetrics]:
+    """把 (视频, 音频) 两个流式响应同时写入临时文件并经管道交给 ffmpeg 封装为 fMP4。
+
+    返回两路下载指标。下载失败时抛出异常；仅 ffmpeg 失败时下载数据仍完整，
+    entry 标记为失败，调用方可照常用临时文件合并。
+    """
+    read_fds, write_fds = [], []
+    for _ in responses:
+        r, w = os.pipe()
+        read_fds.append(r)
+        write_fds.append(w)
+
+    command = ['ffmpeg', '-y', '-loglevel', 'error']
+    for r in read_fds:
+        command += ['-i', f'pipe:{r}']
+    command += fragmented_output_args(entry.path)
+    try:
+        process = subprocess.Popen(command, pass_fds=read_fds, stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    finally:
+        for r in read_fds:
+            os.close(r)
+
+    metrics = [DownloadMetrics(path.name) for path in temp_paths]
+    errors: List[Exception] = []
+    lock = threading.Lock()
+    total = [0]
+
+    def feed(response, temp_path: Path, write_fd: int, m: DownloadMetrics) -> None:
+        # ffmpeg 提前退出后管道写入会失败，此时只继续写临时文件
+        pipe_open = True
+        try:
+            with open(temp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=DEFAULT_CHUNK_SIZE):
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    if pipe_open:
+                        try:
+                            write_all(write_fd, chunk)
+                        except (BrokenPipeError, OSError):
+                            pipe_open = False
+                    m.bytes_written += len(chunk)
+                    with lock:
+                        total[0] += len(chunk)
+                        current = total[0]
+                    on_progress(current)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            response.close()
+            os.close(write_fd)
+            m.finished_at = time.monotonic()
+
+    feeders = [threading.Thread(target=feed, args=args, daemon=True)
+               for args in zip(responses, temp_paths, write_fds, metrics)]
+    for thread in feeders:
+        thread.start()
+
+    # 等待 .part 写出足够数据后通知起播
+    ready = False
+    while process.poll() is None:
+        if not ready and entry.path.exists() and entry.path.stat().st_size >= PROGRESSIVE_MIN_BYTES:
+            ready = True
+            on_ready()
+        time.sleep(POLL_INTERVAL)
+    for thread in feeders:
+        thread.join()
+    stderr = process.stderr.read().decode("utf-8", "replace") if process.stderr else ""
+
+    if errors:
+        raise errors[0]
+    if process.returncode != 0:
+        print(f"边下边播封装失败，将在下载完成后照常合并: {stderr.strip()[:500]}")
+        entry.failed = True
+    elif not ready:
+        on_ready()
+    return metrics
+
+
+async def notify_when_playable(entry: GrowingFile, on_ready: Callable[[], None]) -> None:
+    """.part 文件写出足够数据后调用一次 on_ready；写入结束前仍不够时不调用（由调用方取消）"""
+    while not entry.done:
+        try:
+            size = (await asyncio.to_thread(os.stat, entry.path)).st_size
+        except OSError:
+            size = 0
+        if size >= PROGRESSIVE_MIN_BYTES:
+            on_ready()
+            return
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+class GrowingFileResponse(Response):
+    """推送仍在增长的文件。
+    不带 Range 时以 200 分块传输从头发送，读到末尾时等待新数据，直到写入结束；
+    带 Range 时只返回已写出的部分（206，总长度未知时 Content-Range 为 bytes a-b/*），
+    起点尚未写到时最多等待 RANGE_WAIT 秒。Safari / iPadOS 的 <video> 只通过 Range 请求取数据。"""
+
+    def __init__(self, entry: GrowingFile, range_header: Optional[str] = None, media_type: str = "video/mp4"):
+        self.entry = entry
+        self.range_header = range_header
+        super().__init__(status_code=200, media_type=media_type,
+                         headers={"Cache-Control": "no-store", "Accept-Ranges": "bytes"})
+        # 去掉空内容自动生成的 Content-Length，使用分块传输
+        del self.headers["content-length"]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if self.range_header:
+            await self._send_range(send)
+            return
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        offset = 0
+        with open(self.entry.path, 'rb', buffering=0) as f:
+            while True:
+                # 先读 done 再取大小：done 之后看到的大小即为最终大小
+                done = self.entry.done
+                size = os.fstat(f.fileno()).st_size
+                if offset < size:
+                    f.seek(offset)
+                    chunk = await asyncio.to_thread(f.read, min(DEFAULT_CHUNK_SIZE * 4, size - offset))
+                    offset += len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                    continue
+                if done:
+                    break
+                await asyncio.sleep(POLL_INTERVAL)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _send_range(self, send: Send) -> None:
+        with open(self.entry.path, 'rb', buffering=0) as f:
+            deadline = time.monotonic() + RANGE_WAIT
+            while True:
+                done = self.entry.done
+                size = os.fstat(f.fileno()).st_size
+                try:
+                    ranges = parse_range_header(self.range_header, size)
+                    break
+                except RangeNotSatisfiable:
+                    if done or time.monotonic() >= deadline:
+                        # 仍在增长时给出当前长度，客户端可据此改为请求已写出的部分
+                        await self._send_status(send, 416, [("content-range", f"bytes */{size}")])
+                        return
+                await asyncio.sleep(POLL_INTERVAL)
+            if ranges is None:
+                # 无法识别的 Range 按规范忽略：返回当前已写出的全部内容
+                ranges = [(0, size - 1)] if size else []
+            if not ranges:
+                await self._send_status(send, 200, [("content-length", "0")])
+                return
+            # 多段请求只返回第一段
+            start, end = ranges[0]
+            headers = [(k, v) for k, v in self.raw_headers if k != b"content-length"]
+            headers += [(b"content-range", f"bytes {start}-{end}/{size if done else '*'}".encode("latin-1")),
+                        (b"content-length", str(end - start + 1).encode("latin-1"))]
+            await send({"type": "http.response.start", "status": 206, "headers": headers})
+            offset = start
+            while offset <= end:
+                f.seek(offset)
+                chunk = await asyncio.to_thread(f.read, min(DEFAULT_CHUNK_SIZE * 4, end - offset + 1))
+                if not chunk:
+                    break
+                offset += len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": offset <= end})
+            if offset <= end:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _send_status(self, send: Send, status: int, extra: List) -> None:
+        headers = [(b"cache-control", b"no-store"), (b"accept-ranges", b"bytes")]
+        headers += [(k.encode("latin-1"), v.encode("latin-1")) for k, v in extra]
+        if status == 416:
+            headers.append((b"content-length", b"0"))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
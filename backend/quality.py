@@ -0,0 +1,241 @@
+"""
+清晰度选择：解析 DASH 提供的全部视频/音频流（码率、编码、分辨率），按策略挑选下载的一路视频与一路音频。
+策略依次由环境变量默认值、专辑目录下的 quality.json、客户端请求参数叠加，后者只能收紧前者；
+下载去重键与文件名取实际选中的档位（高度 + 编码，见 StreamSelection），策略不同但选中同一路流时共用一个文件。
+"""
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# B 站 codecid -> 编码名
+CODEC_IDS = {7: "avc", 12: "hevc", 13: "av1"}
+# codecs 字符串前缀 -> 编码名（codecid 缺失时使用）
+CODEC_PREFIXES = {"avc1": "avc", "hev1": "hevc", "hvc1": "hevc", "av01": "av1"}
+# 最大高度 -> 请求 playurl 时的 qn
+HEIGHT_QN = [(360, 16), (480, 32), (720, 64), (1080, 80), (2160, 120)]
+AUDIO_MODES = ("best", "smallest")
+
+# 策略标识与档位标识（见 QualityPolicy.key、variant_key）的格式，用于从文件名中识别非默认档位
+POLICY_KEY_PATTERN = re.compile(r'(\d+p|max)(_[a-z0-9\-]+)*')
+
+# 专辑目录下的清晰度策略文件，如 {"max_height": 720, "codecs": ["hevc", "avc"]}
+POLICY_FILE = "quality.json"
+
+
+def parse_codecs(value: Optional[str]) -> List[str]:
+    """解析逗号分隔的编码偏好（靠前优先），忽略未知编码"""
+    known = set(CODEC_IDS.values())
+    codecs = []
+    for item in (value or "").split(","):
+        name = item.strip().lower()
+        if name in known and name not in codecs:
+            codecs.append(name)
+    return codecs
+
+
+def codec_name(stream: Dict) -> str:
+    name = CODEC_IDS.get(stream.get('codecid'))
+    if name:
+        return name
+    return CODEC_PREFIXES.get((stream.get('codecs') or "").split(".")[0], "")
+
+
+def parse_representations(streams: Optional[Sequence[Dict]]) -> List[Dict]:
+    """规范化 DASH 流：保留原字段，补充 codec / height / width / bandwidth / url"""
+    parsed = []
+    for stream in streams or []:
+        url = stream.get('baseUrl') or stream.get('base_url')
+        if not url:
+            continue
+        parsed.append({
+            **stream,
+            "codec": codec_name(stream),
+            "height": int(stream.get('height') or 0),
+            "width": int(stream.get('width') or 0),
+            "bandwidth": int(stream.get('bandwidth') or 0),
+            "url": url,
+        })
+    return parsed
+
+
+class QualityPolicy:
+    """下载清晰度策略：最大高度、编码偏好、码率上限（bit/s）与音频档位"""
+
+    def __init__(self, max_height: Optional[int] = None, codecs: Optional[Sequence[str]] = None,
+                 max_bandwidth: Optional[int] = None, audio: str = "best"):
+        if max_height is not None and max_height <= 0:
+            raise ValueError(f"Invalid max_height: {max_height}")
+        if max_bandwidth is not None and max_bandwidth <= 0:
+            raise ValueError(f"Invalid max_bandwidth: {max_bandwidth}")
+        if audio not in AUDIO_MODES:
+            raise ValueError(f"Invalid audio mode: {audio}")
+        self.max_height = max_height
+        self.codecs = list(codecs or [])
+        self.max_bandwidth = max_bandwidth
+        self.audio = audio
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "QualityPolicy":
+        codecs = data.get('codecs')
+        if isinstance(codecs, list):
+            codecs = ",".join(str(c) for c in codecs)
+        return cls(
+            max_height=int(data['max_height']) if data.get('max_height') else None,
+            codecs=parse_codecs(codecs),
+            max_bandwidth=int(data['max_bandwidth']) if data.get('max_bandwidth') else None,
+            audio=data.get('audio') or "best",
+        )
+
+    def narrow(self, other: Optional["QualityPolicy"]) -> "QualityPolicy":
+        """叠加更具体的一层策略：高度与码率取更小值，编码按新一层的顺序并限制在本层允许的范围内"""
+        if other is None:
+            return self
+        heights = [h for h in (self.max_height, other.max_height) if h]
+        bandwidths = [b for b in (self.max_bandwidth, other.max_bandwidth) if b]
+        codecs = self.codecs
+        if other.codecs:
+            codecs = [c for c in other.codecs if not self.codecs or c in self.codecs] or other.codecs
+        return QualityPolicy(
+            max_height=min(heights) if heights else None,
+            codecs=codecs,
+            max_bandwidth=min(bandwidths) if bandwidths else None,
+            audio="smallest" if "smallest" in (self.audio, other.audio) else "best",
+        )
+
+    def key(self) -> str:
+        """稳定的策略标识，如 720p_hevc-avc；用于下载任务去重与记录策略选中的档位"""
+        parts = [f"{self.max_height}p" if self.max_height else "max"]
+        if self.codecs:
+            parts.append("-".join(self.codecs))
+        if self.max_bandwidth:
+            parts.append(f"{self.max_bandwidth // 1000}k")
+        if self.audio != "best":
+            parts.append(f"a{self.audio}")
+        return "_".join(parts)
+
+    def qn(self) -> int:
+        """请求 playurl 时的 qn：不低于最大高度对应的档位"""
+        if not self.max_height:
+            return HEIGHT_QN[-1][1]
+        for height, qn in HEIGHT_QN:
+            if self.max_height <= height:
+                return qn
+        return HEIGHT_QN[-1][1]
+
+    def to_dict(self) -> Dict:
+        return {"max_height": self.max_height, "codecs": self.codecs,
+                "max_bandwidth": self.max_bandwidth, "audio": self.audio, "key": self.key()}
+
+
+# 默认策略（环境变量）：最大高度、允许的编码及其偏好顺序、音频档位
+DEFAULT_POLICY = QualityPolicy(
+    max_height=int(os.getenv("DOWNLOAD_MAX_HEIGHT", "1080")) or None,
+    codecs=parse_codecs(os.getenv("DOWNLOAD_CODECS", "avc,hevc,av1")),
+    max_bandwidth=int(os.getenv("DOWNLOAD_MAX_BANDWIDTH", "0")) or None,
+    audio=os.getenv("DOWNLOAD_AUDIO", "best"),
+)
+
+
+def strip_policy_suffix(stem: str) -> str:
+    """第1集.720p_hevc -> 第1集；不带档位标识的文件名原样返回"""
+    base, sep, suffix = stem.rpartition(".")
+    return base if sep and POLICY_KEY_PATTERN.fullmatch(suffix) else stem
+
+
+def select_video(videos: Optional[Sequence[Dict]], policy: QualityPolicy) -> Dict:
+    """挑选不超过最大高度与码率上限的最高档位，同档位按编码偏好、再按码率取舍；
+    没有满足条件的流时退而取最低的一路，保证总能下载"""
+    streams = parse_representations(videos)
+    if not streams:
+        raise Exception("No video streams offered.")
+    candidates = streams
+    if policy.max_height:
+        lowest = min(v['height'] for v in streams)
+        candidates = [v for v in streams if v['height'] <= policy.max_height] or \
+                     [v for v in streams if v['height'] == lowest]
+    if policy.max_bandwidth:
+        candidates = [v for v in candidates if v['bandwidth'] <= policy.max_bandwidth] or \
+                     [min(candidates, key=lambda v: v['bandwidth'])]
+    # 客户端无法解码的编码尽量排除
+    if policy.codecs:
+        candidates = [v for v in candidates if v['codec'] in policy.codecs] or candidates
+    top = max(v['height'] for v in candidates)
+
+    def rank(v: Dict) -> Tuple[int, int]:
+        order = policy.codecs.index(v['codec']) if v['codec'] in policy.codecs else len(policy.codecs)
+        return order, -v['bandwidth']
+
+    return min((v for v in candidates if v['height'] == top), key=rank)
+
+
+def variant_key(video: Dict) -> str:
+    """实际下载档位的标识，如 720p_hevc"""
+    return f"{video['height']}p_{video['codec'] or 'unknown'}"
+
+
+def find_variant(videos: Optional[Sequence[Dict]], variant: str) -> Optional[Dict]:
+    """DASH 中与档位标识相符的视频流（同档位有多路时取码率最高的），没有时返回 None"""
+    matches = [v for v in parse_representations(videos) if variant_key(v) == variant]
+    return max(matches, key=lambda v: v['bandwidth']) if matches else None
+
+
+def variant_height(variant: str) -> int:
+    return int(variant.split("p", 1)[0])
+
+
+def select_audio(audios: Optional[Sequence[Dict]], policy: QualityPolicy) -> Dict:
+    streams = parse_representations(audios)
+    if not streams:
+        raise Exception("No audio streams offered.")
+    if policy.audio == "smallest":
+        return min(streams, key=lambda a: a['bandwidth'])
+    return max(streams, key=lambda a: a['bandwidth'])
+
+
+def select_streams(dash: Dict, policy: QualityPolicy) -> Tuple[Dict, Dict]:
+    """按策略从 DASH 信息中选出 (视频流, 音频流)"""
+    return select_video(dash.get('video'), policy), select_audio(dash.get('audio'), policy)
+
+
+def dash_qn(policy: QualityPolicy) -> int:
+    """请求 playurl 的 qn：至少覆盖默认策略的档位，才能判断选中的流是否与默认策略相同"""
+    return max(policy.qn(), DEFAULT_POLICY.qn())
+
+
+class StreamSelection:
+    """按策略选中的视频流与音频流；文件名与下载去重键取选中的档位而不是策略"""
+
+    def __init__(self, dash: Dict, policy: QualityPolicy):
+        self.video, self.audio = select_streams(dash, policy)
+        self.variant = variant_key(self.video)
+        # 与默认策略选中同一档位时沿用不带后缀的文件名（兼容已下载的文件）
+        default_variant = variant_key(select_video(dash.get('video'), DEFAULT_POLICY))
+        self.suffix = "" if self.variant == default_variant else f".{self.variant}"
+
+    def file_stem(self, clean_name: str) -> str:
+        return f"{clean_name}{self.suffix}"
+
+
+def load_album_policy(folder: Path) -> Optional[QualityPolicy]:
+    """读取专辑目录下的 quality.json；不存在或格式错误时返回 None"""
+    path = folder / POLICY_FILE
+    if not path.is_file():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return QualityPolicy.from_dict(json.load(f))
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        print(f"忽略无效的清晰度策略 {path}: {e}")
+        return None
+
+
+def resolve_policy(folder: Path, max_height: Optional[int] = None, codecs: Optional[str] = None,
+                   max_bandwidth: Optional[int] = None) -> QualityPolicy:
+    """叠加默认策略、专辑策略与客户端参数；客户端参数无效时抛出 ValueError"""
+    policy = DEFAULT_POLICY.narrow(load_album_policy(folder))
+    if max_height or codecs or max_bandwidth:
+        policy = policy.narrow(QualityPolicy(max_height=max_height, codecs=parse_codecs(codecs),
+                                             max_bandwidth=max_bandwidth))
+    return policy
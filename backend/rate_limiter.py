@@ -0,0 +1,317 @@
+"""
+外呼限流：同步（requests，工作线程）与异步（aiohttp，事件循环）路径共用同一份预算。
+每个主机一个令牌桶（速率 + 突发容量），全局并发上限跨主机共享；
+等待令牌的请求按优先级排队（播放 > 详情 > 封面预取），并统计各优先级的排队等待时间。
+全局并发名额同样按优先级分配：其他主机有已拿得到令牌的更高优先级请求时让给它。
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# 优先级：数值越小越先获得令牌
+PLAY = 0
+DETAILS = 1
+PREFETCH = 2
+PRIORITY_NAMES = {PLAY: "play", DETAILS: "details", PREFETCH: "prefetch"}
+
+# 每个主机的默认速率（请求/秒）与突发容量
+DEFAULT_RATE = float(os.getenv("OUTBOUND_MAX_QPS", "2"))
+DEFAULT_BURST = float(os.getenv("OUTBOUND_BURST", "4"))
+# 全局并发外呼上限（同步与异步路径合计）
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("OUTBOUND_MAX_CONCURRENCY", "3"))
+# 按主机覆盖速率与突发，如 "bilivideo.com=10:20,hdslb.com=5:10"（后缀匹配子域名）
+HOST_LIMITS = os.getenv("OUTBOUND_HOST_LIMITS", "")
+# 每个优先级保留的最近等待时间样本数（用于分位数）
+WAIT_SAMPLES = 512
+
+# 当前上下文的外呼优先级；asyncio.to_thread 与新建任务会继承
+_current_priority: contextvars.ContextVar[int] = contextvars.ContextVar("outbound_priority", default=DETAILS)
+
+
+def parse_host_limits(value: str) -> Dict[str, Tuple[float, float]]:
+    """解析 "host=rate:burst,..."，忽略格式错误的项"""
+    limits = {}
+    for item in value.split(","):
+        host, sep, spec = item.strip().partition("=")
+        rate_text, _, burst_text = spec.partition(":")
+        try:
+            rate = float(rate_text)
+            burst = float(burst_text) if burst_text else max(1.0, rate)
+        except ValueError:
+            continue
+        if sep and host and rate > 0 and burst >= 1:
+            limits[host.lower()] = (rate, burst)
+    return limits
+
+
+def current_priority() -> int:
+    return _current_priority.get()
+
+
+@contextmanager
+def outbound_priority(priority: int) -> Iterator[None]:
+    """在此范围内发起的外呼（含 to_thread 中的同步请求）默认使用该优先级"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class TokenBucket:
+    """令牌桶：按速率补充，最多累积 capacity 个令牌"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = max(rate, 0.0001)
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """距离有一个完整令牌还需等待的秒数"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Waiter:
+    """排队中的请求；同步等待用 Event，异步等待用事件循环中的 Future"""
+
+    def __init__(self, host: str, priority: int, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.host = host
+        self.priority = priority
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future: Optional[asyncio.Future] = loop.create_future() if loop is not None else None
+
+    def notify(self) -> None:
+        if self.event is not None:
+            self.event.set()
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # 事件循环已关闭（进程退出中）
+            pass
+
+    def _wake(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+    def reset(self) -> None:
+        if self.event is not None:
+            self.event.clear()
+        else:
+            self.future = self.loop.create_future()
+
+
+class RateLimiter:
+    """按主机分桶、按优先级排队的令牌桶限流器，可同时在线程与事件循环中使用"""
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: float = DEFAULT_BURST,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 host_limits: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max(1, max_concurrency)
+        self.host_limits = dict(host_limits if host_limits is not None else parse_host_limits(HOST_LIMITS))
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        # 主机 -> [(优先级, 序号, 等待者)] 小顶堆
+        self._queues: Dict[str, List[Tuple[int, int, _Waiter]]] = {}
+        self._seq = itertools.count()
+        self._active = 0
+        self._granted: Dict[int, int] = {p: 0 for p in PRIORITY_NAMES}
+        self._total_wait: Dict[int, float] = {p: 0.0 for p in PRIORITY_NAMES}
+        self._max_wait: Dict[int, float] = {p: 0.0 for p in PRIORITY_NAMES}
+        self._recent_waits: Dict[int, deque] = {p: deque(maxlen=WAIT_SAMPLES) for p in PRIORITY_NAMES}
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        return (urlparse(url).hostname or "").lower()
+
+    def _limits_for(self, host: str) -> Tuple[float, float]:
+        for suffix, limits in self.host_limits.items():
+            if host == suffix or host.endswith("." + suffix):
+                return limits
+        return self.rate, self.burst
+
+    def _bucket(self, host: str) -> TokenBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(*self._limits_for(host))
+        return bucket
+
+    # --- 排队与放行（均在 self._lock 内调用） ---
+    def _enqueue(self, waiter: _Waiter) -> None:
+        heapq.heappush(self._queues.setdefault(waiter.host, []), (waiter.priority, next(self._seq), waiter))
+
+    def _try_grant(self, waiter: _Waiter) -> Optional[float]:
+        """轮到该等待者且有令牌与并发名额时放行并返回 0；
+        否则返回需要等待的秒数（None 表示等待其他请求让出位置后的通知）"""
+        queue = self._queues[waiter.host]
+        if queue[0][2] is not waiter or self._active >= self.max_concurrency:
+            return None
+        now = time.monotonic()
+        bucket = self._bucket(waiter.host)
+        wait = bucket.wait_time(now)
+        if wait > 0:
+            return wait
+        if self._outranked(waiter, now):
+            return None
+        bucket.take(now)
+        heapq.heappop(queue)
+        if not queue:
+            del self._queues[waiter.host]
+        self._active += 1
+        if self._active < self.max_concurrency:
+            # 还有并发名额：让出过名额的其他主机队首重新检查
+            self._notify_heads()
+        elif queue:
+            # 下一位可能也有令牌（突发），唤醒它自行检查
+            queue[0][2].notify()
+        return 0.0
+
+    def _outranked(self, waiter: _Waiter, now: float) -> bool:
+        """其他主机的队首优先级更高且已有令牌时，并发名额留给它；在等令牌的不算，避免名额空转"""
+        for host, queue in self._queues.items():
+            if host != waiter.host and queue[0][0] < waiter.priority \
+                    and self._bucket(host).wait_time(now) == 0:
+                return True
+        return False
+
+    def _notify_heads(self) -> None:
+        for queue in self._queues.values():
+            queue[0][2].notify()
+
+    def _remove(self, waiter: _Waiter) -> None:
+        """等待者放弃排队（取消或异常）"""
+        queue = self._queues.get(waiter.host)
+        if not queue:
+            return
+        was_head = queue[0][2] is waiter
+        queue[:] = [item for item in queue if item[2] is not waiter]
+        heapq.heapify(queue)
+        if not queue:
+            del self._queues[waiter.host]
+        if was_head:
+            # 让出名额的其他主机队首可能正等着它
+            self._notify_heads()
+
+    def _record(self, priority: int, waited: float) -> None:
+        self._granted[priority] = self._granted.get(priority, 0) + 1
+        self._total_wait[priority] = self._total_wait.get(priority, 0.0) + waited
+        self._max_wait[priority] = max(self._max_wait.get(priority, 0.0), waited)
+        self._recent_waits.setdefault(priority, deque(maxlen=WAIT_SAMPLES)).append(waited)
+
+    def release(self) -> None:
+        """归还并发名额"""
+        with self._lock:
+            self._active -= 1
+            # 并发名额空出，通知各主机队首
+            self._notify_heads()
+
+    # --- 同步路径 ---
+    def acquire_sync(self, url: str, priority: Optional[int] = None) -> float:
+        """阻塞直到取得令牌与并发名额，返回排队秒数；用完须调用 release()"""
+        priority = current_priority() if priority is None else priority
+        waiter = _Waiter(self.host_of(url), priority)
+        started = time.monotonic()
+        with self._lock:
+            self._enqueue(waiter)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_grant(waiter)
+                    if wait == 0:
+                        waited = time.monotonic() - started
+                        self._record(priority, waited)
+                        return waited
+                    waiter.reset()
+                waiter.event.wait(wait)
+        except BaseException:
+            with self._lock:
+                self._remove(waiter)
+            raise
+
+    @contextmanager
+    def limit_sync(self, url: str, priority: Optional[int] = None) -> Iterator[None]:
+        self.acquire_sync(url, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    # --- 异步路径 ---
+    async def acquire(self, url: str, priority: Optional[int] = None) -> float:
+        """等待取得令牌与并发名额（不阻塞事件循环），返回排队秒数；用完须调用 release()"""
+        priority = current_priority() if priority is None else priority
+        waiter = _Waiter(self.host_of(url), priority, asyncio.get_running_loop())
+        started = time.monotonic()
+        with self._lock:
+            self._enqueue(waiter)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_grant(waiter)
+                    if wait == 0:
+                        waited = time.monotonic() - started
+                        self._record(priority, waited)
+                        return waited
+                    waiter.reset()
+                    future = waiter.future
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._lock:
+                self._remove(waiter)
+            raise
+
+    @asynccontextmanager
+    async def limit(self, url: str, priority: Optional[int] = None):
+        await self.acquire(url, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            waits = {}
+            for priority, name in PRIORITY_NAMES.items():
+                granted = self._granted.get(priority, 0)
+                recent = sorted(self._recent_waits.get(priority, ()))
+                waits[name] = {
+                    "granted": granted,
+                    "avg_wait_ms": round(self._total_wait[priority] / granted * 1000, 1) if granted else 0.0,
+                    "p95_wait_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 1)
+                    if recent else 0.0,
+                    "max_wait_ms": round(self._max_wait[priority] * 1000, 1),
+                }
+            now = time.monotonic()
+            hosts = {}
+            for host, bucket in self._buckets.items():
+                bucket.wait_time(now)
+                hosts[host] = {"rate": bucket.rate, "burst": bucket.capacity,
+                               "tokens": round(bucket.tokens, 2),
+                               "queued": len(self._queues.get(host, ()))}
+            return {"max_concurrency": self.max_concurrency, "active": self._active,
+                    "waits": waits, "hosts": hosts}
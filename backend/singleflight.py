@@ -0,0 +1,37 @@
+"""
+按 key 合并并发调用（single-flight）：同一 key 同时只执行一次，
+其余调用方等待同一个结果，避免重复外呼与对同一文件的竞争写入。
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """进程内的 single-flight 协调器"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """执行 fn 或等待同 key 正在执行的调用。单个调用方被取消不会中断共享的执行。"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 没有调用方在等待时也要取走异常，避免 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
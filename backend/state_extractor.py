@@ -0,0 +1,146 @@
+"""
+从视频页面中提取 window.__INITIAL_STATE__：
+- 逐块扫描响应体，状态脚本结束后即停止读取，页面其余部分不再下载
+- 只解码需要的 videoData 子树（json 的 raw_decode 从子树起点解码到子树结束）；
+  安装了 orjson 时直接用 orjson 解码整个状态对象
+同步路径取播放 session（位于状态脚本之前的 __playinfo__ 中）时同样读到即停止。
+扫描只做字节查找，可在事件循环中进行；解码由调用方放到线程池（见 main._fetch_video_parts_with_covers）。
+"""
+import json
+import re
+from typing import AsyncIterable, Iterable, List, Optional
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+# 按块读取响应体的块大小
+STATE_CHUNK_SIZE = 64 * 1024
+
+START_MARKER = b"window.__INITIAL_STATE__="
+# 状态对象之后紧跟的脚本（与旧正则 `;\(function\(\)` 一致）
+STATE_END = b";(function()"
+SCRIPT_END = b"</script>"
+
+_VIDEO_DATA_KEY = re.compile(r'"videoData"\s*:\s*')
+_SESSION_PATTERN = re.compile(rb'"session"\s*:\s*"([^"\n]*)"')
+# 跨块匹配 session 时保留的上一块尾部长度
+_SESSION_TAIL = 256
+_decoder = json.JSONDecoder()
+
+
+class InitialStateScanner:
+    """逐块输入页面字节，状态脚本完整后 feed 返回 True，state 为状态对象的 JSON 字节"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._found_start = False
+        # 已查找过结束标记的位置，新数据到达时不重复扫描
+        self._searched = 0
+        self.bytes_read = 0
+        self.state: Optional[bytes] = None
+
+    def feed(self, chunk: bytes) -> bool:
+        if self.state is not None:
+            return True
+        self.bytes_read += len(chunk)
+        self._buffer += chunk
+        if not self._found_start:
+            index = self._buffer.find(START_MARKER)
+            if index < 0:
+                # 只保留可能是起始标记前缀的尾部
+                del self._buffer[:max(0, len(self._buffer) - len(START_MARKER) + 1)]
+                return False
+            del self._buffer[:index + len(START_MARKER)]
+            self._found_start = True
+        # JSON 中的 "</script>" 必须转义，第一个结束标签即状态脚本的结尾
+        end = self._buffer.find(SCRIPT_END, self._searched)
+        if end < 0:
+            self._searched = max(0, len(self._buffer) - len(SCRIPT_END) + 1)
+            return False
+        script = bytes(self._buffer[:end])
+        cut = _find_state_end(script)
+        self.state = script[:cut] if cut >= 0 else script.rstrip().rstrip(b";")
+        self._buffer = bytearray()
+        return True
+
+
+def _find_state_end(script: bytes) -> int:
+    """状态对象之后的结束标记位置；跳过出现在 JSON 字符串里的（如简介中的 ";(function()"）"""
+    cut = script.find(STATE_END)
+    while cut >= 0 and _inside_string(script, cut):
+        cut = script.find(STATE_END, cut + 1)
+    return cut
+
+
+def _inside_string(script: bytes, index: int) -> bool:
+    # 之前未转义的引号数为奇数即在字符串内。前面恰有 j 个反斜杠的引号在 j 为奇数时是转义的，
+    # 交替加减「至少 k 个反斜杠 + 引号」的出现次数正好得到转义引号数；全部是 C 层的 count
+    quotes = script.count(b'"', 0, index)
+    escaped, sign, k = 0, 1, 1
+    while True:
+        count = script.count(b"\\" * k + b'"', 0, index)
+        if not count:
+            break
+        escaped += sign * count
+        sign, k = -sign, k + 1
+    return (quotes - escaped) % 2 == 1
+
+
+def read_initial_state(chunks: Iterable[bytes]) -> Optional[bytes]:
+    """从字节块（如 requests 的 iter_content）中读取状态对象，读到即停止；页面中没有时返回 None"""
+    scanner = InitialStateScanner()
+    for chunk in chunks:
+        if scanner.feed(chunk):
+            break
+    return scanner.state
+
+
+async def read_initial_state_async(chunks: AsyncIterable[bytes]) -> Optional[bytes]:
+    """异步版本（如 aiohttp 的 response.content.iter_chunked）"""
+    scanner = InitialStateScanner()
+    async for chunk in chunks:
+        if scanner.feed(chunk):
+            break
+    return scanner.state
+
+
+def read_play_session(chunks: Iterable[bytes]) -> Optional[str]:
+    """从页面字节块中读取播放信息的 session，读到即停止；页面中没有时返回 None"""
+    tail = b""
+    for chunk in chunks:
+        data = tail + chunk
+        match = _SESSION_PATTERN.search(data)
+        if match:
+            return match.group(1).decode("utf-8", errors="replace")
+        tail = data[-_SESSION_TAIL:]
+    return None
+
+
+def decode_video_data(state: bytes) -> Optional[dict]:
+    """从状态对象中解码 videoData"""
+    if ORJSON_AVAILABLE:
+        data = orjson.loads(state)
+        return data.get("videoData") if isinstance(data, dict) else None
+    text = state.decode("utf-8")
+    for match in _VIDEO_DATA_KEY.finditer(text):
+        try:
+            value, _ = _decoder.raw_decode(text, match.end())
+        except json.JSONDecodeError:
+            continue
+        # 其他子树中也可能有同名的键，以含分P列表为准
+        if isinstance(value, dict) and "pages" in value:
+            return value
+    # 结构不符合预期时退回整体解码
+    data = json.loads(text)
+    return data.get("videoData") if isinstance(data, dict) else None
+
+
+def extract_video_pages(state: bytes) -> List[dict]:
+    """状态对象中的分P列表（videoData.pages），没有时返回空列表"""
+    video_data = decode_video_data(state)
+    pages = video_data.get("pages") if isinstance(video_data, dict) else None
+    return pages if isinstance(pages, list) else []
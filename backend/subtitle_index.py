@@ -0,0 +1,130 @@
+"""
+字幕轨道索引：按 (bvid, cid) 保存播放器接口返回的完整字幕轨道列表及抓取时间，
+包括"没有用户字幕"的否定结果，持久化为 subtitles/ 下的 JSON 文件。
+过期条目在落盘时删除；文件夹被删除、其中的视频不再被其他 list.txt 列出时由 discard 删除其条目。
+只在文件夹删除时清理：list.txt 暂时无法读取、正在被编辑器替换时不会误删（最多等条目过期后重新抓取）。
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+# 延迟落盘间隔（秒），批量检查时合并多次写入
+FLUSH_DELAY = 1.0
+
+
+def has_user_subtitle(tracks: List[Dict]) -> bool:
+    return any(t.get('ai_type') == 0 and t.get('subtitle_url') for t in tracks)
+
+
+class SubtitleTrackIndex:
+    """字幕轨道索引；有用户字幕与无用户字幕的条目分别使用不同的有效期"""
+
+    def __init__(self, path: Path, positive_ttl: float, negative_ttl: float):
+        self.path = path
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        self._flush_scheduled = False
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @staticmethod
+    def _key(bvid: str, cid: int) -> str:
+        return f"{bvid}:{cid}"
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._entries = data.get("entries", {})
+        except (OSError, ValueError) as e:
+            print(f"读取字幕索引失败，将重新建立: {e}")
+            self._entries = {}
+
+    def _ttl_for(self, entry: Dict[str, Any]) -> float:
+        return self.positive_ttl if has_user_subtitle(entry.get("tracks", [])) else self.negative_ttl
+
+    def get(self, bvid: str, cid: int) -> Optional[List[Dict]]:
+        """返回未过期的字幕轨道列表（可能为空列表）；无记录或已过期返回 None"""
+        with self._lock:
+            entry = self._entries.get(self._key(bvid, cid))
+            if entry is not None and time.time() - entry.get("fetched_at", 0) < self._ttl_for(entry):
+                self.hits += 1
+                return entry.get("tracks", [])
+            self.misses += 1
+            return None
+
+    def put(self, bvid: str, cid: int, tracks: List[Dict]) -> None:
+        with self._lock:
+            self._entries[self._key(bvid, cid)] = {"tracks": tracks, "fetched_at": time.time()}
+            self._dirty = True
+        self._schedule_flush()
+
+    def discard(self, bvids: Set[str]) -> int:
+        """删除给定 BV 号的条目，返回删除的条目数"""
+        with self._lock:
+            stale = [key for key in self._entries if key.partition(":")[0] in bvids]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self._dirty = True
+        if stale:
+            self._schedule_flush()
+        return len(stale)
+
+    def _schedule_flush(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        with self._lock:
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        loop.call_later(FLUSH_DELAY, lambda: loop.run_in_executor(None, self.flush))
+
+    def flush(self) -> None:
+        """把索引原子写入磁盘"""
+        with self._lock:
+            self._flush_scheduled = False
+            if not self._dirty:
+                return
+            now = time.time()
+            self._entries = {key: entry for key, entry in self._entries.items()
+                             if now - entry.get("fetched_at", 0) < self._ttl_for(entry)}
+            payload = json.dumps({"version": 1, "entries": self._entries}, ensure_ascii=False)
+            self._dirty = False
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with self._write_lock:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.write(payload)
+                os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"写入字幕索引失败: {e}")
+            with self._lock:
+                self._dirty = True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            positive = sum(1 for e in self._entries.values() if has_user_subtitle(e.get("tracks", [])))
+            total = len(self._entries)
+        return {
+            "name": "subtitle_tracks",
+            "entries": total,
+            "positive": positive,
+            "negative": total - positive,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,120 @@
+import http.server
+import os
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# 测试用的 ffmpeg：读完所有输入（pipe:N 或文件），把拼接结果写到每个 .mp4 输出
+FAKE_FFMPEG = r'''#!/usr/bin/env python3
+import os, sys, threading
+args = sys.argv[1:]
+inputs = [args[i + 1] for i, a in enumerate(args) if a == '-i']
+outputs = [a for i, a in enumerate(args) if a.endswith('.mp4') and (i == 0 or args[i - 1] != '-i')]
+data = [b''] * len(inputs)
+def read(k, src):
+    if src.startswith('pipe:'):
+        fd, chunks = int(src[5:]), []
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        data[k] = b''.join(chunks)
+    else:
+        data[k] = open(src, 'rb').read()
+threads = [threading.Thread(target=read, args=(k, s)) for k, s in enumerate(inputs)]
+[t.start() for t in threads]
+[t.join() for t in threads]
+if os.environ.get('FAKE_FFMPEG_FAIL') and any(s.startswith('pipe:') for s in inputs):
+    sys.exit('fake failure')
+for output in outputs:
+    open(output, 'wb').write(b''.join(data))
+print('progress=end', flush=True)
+'''
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "ffmpeg"
+    script.write_text(FAKE_FFMPEG)
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+    return script
+
+
+class StreamServer:
+    """本地 HTTP 服务：按路径提供字节内容，支持 Range；可设置忽略 Range、谎报长度等行为"""
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        self.ignore_range = False
+        self.length_override = None
+        # 路径 -> 发送到该偏移后断开连接（只对一次请求生效）
+        self.cut_at = {}
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                body = server.files.get(self.path)
+                range_header = self.headers.get("Range")
+                server.requests.append((self.path, range_header))
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                start, end = 0, len(body) - 1
+                if range_header and not server.ignore_range:
+                    first, _, last = range_header[len("bytes="):].partition("-")
+                    start = int(first)
+                    end = min(int(last), end) if last else end
+                    if start >= len(body):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(body)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    total = server.length_override or len(body)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{total}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(end - start + 1))
+                self.end_headers()
+                data = body[start:end + 1]
+                cut = server.cut_at.pop(self.path, None)
+                try:
+                    if cut is not None:
+                        self.wfile.write(data[:cut])
+                        self.close_connection = True
+                        return
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def stream_server():
+    server = StreamServer()
+    yield server
+    server.close()
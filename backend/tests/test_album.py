@@ -0,0 +1,38 @@
+"""专辑清单：读取 list.txt、合并多个来源的分P、同名剧集的文件名"""
+from album import merge_episodes, read_list_file, sanitize_filename
+
+
+def part(page, title, cid=None):
+    return {"page": page, "part": title, "cid": cid or page, "duration": 60}
+
+
+def test_merge_keeps_source_and_page_order():
+    episodes = merge_episodes([("BV1b", [part(2, "第2集"), part(1, "第1集")]), ("BV1a", [part(1, "番外")])])
+    assert [(e["index"], e["id"], e["file_name"]) for e in episodes] == [
+        (1, "BV1b_p1", "第1集"), (2, "BV1b_p2", "第2集"), (3, "BV1a_p1", "番外")]
+
+
+def test_colliding_titles_all_get_episode_suffix():
+    sources = [("BV1a", [part(1, "正片"), part(2, "预告")]), ("BV1b", [part(1, "正片")])]
+    names = [e["file_name"] for e in merge_episodes(sources)]
+    assert names == ["正片.BV1a_p1", "预告", "正片.BV1b_p1"]
+    # 文件名不随 list.txt 中来源的顺序变化
+    reordered = {e["id"]: e["file_name"] for e in merge_episodes(list(reversed(sources)))}
+    assert reordered == {"BV1a_p1": "正片.BV1a_p1", "BV1a_p2": "预告", "BV1b_p1": "正片.BV1b_p1"}
+
+
+def test_titles_colliding_after_cleaning_are_suffixed():
+    names = [e["file_name"] for e in merge_episodes([("BV1a", [part(1, "A/B"), part(2, "AB")])])]
+    assert names == ["AB.BV1a_p1", "AB.BV1a_p2"]
+
+
+def test_read_list_file_skips_indented_comments(tmp_path):
+    list_file = tmp_path / "list.txt"
+    list_file.write_text("# 第一季\n  BV1xx411c7mD\n   # BV1yy411c7mE 暂时不看\n\n"
+                         "https://www.bilibili.com/video/BV1zz411c7mF?p=2\nBV1xx411c7mD\nhttps://www.bilibili.com/bangumi\n",
+                         encoding="utf-8")
+    assert read_list_file(list_file) == (["BV1xx411c7mD", "BV1zz411c7mF"], ["https://www.bilibili.com/bangumi"])
+
+
+def test_sanitize_filename():
+    assert sanitize_filename('第1集: "开始"/结束?*<>|\\') == "第1集 开始结束"
@@ -0,0 +1,45 @@
+"""进程内 LRU 缓存：按条目数与字节数淘汰、TTL"""
+import time
+
+from cache import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache("test", max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_evicts_by_bytes_but_keeps_newest():
+    cache = LRUCache("test", max_entries=10, max_bytes=10, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "xxxx")
+    cache.set("c", "xxxx")
+    assert "a" not in cache and len(cache) == 2 and cache.size_bytes == 8
+    cache.set("big", "x" * 50)
+    assert len(cache) == 1 and cache.get("big") == "x" * 50
+
+
+def test_replacing_key_updates_size():
+    cache = LRUCache("test", max_bytes=100, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("a", "xx")
+    assert cache.size_bytes == 2
+    cache.delete("a")
+    assert cache.size_bytes == 0 and len(cache) == 0
+
+
+def test_ttl_expiry():
+    cache = LRUCache("test", ttl=60)
+    cache.set("short", 1, ttl=0.01)
+    cache.set("long", 2)
+    time.sleep(0.02)
+    assert cache.get("short", "missing") == "missing"
+    assert cache.get("long") == 2
+    stats = cache.stats()
+    assert (stats["expirations"], stats["hits"], stats["misses"]) == (1, 1, 1)
@@ -0,0 +1,59 @@
+"""文件夹名排序：自然数字顺序、类别顺序，以及 pypinyin 缺失时的 GB18030 回退"""
+from types import SimpleNamespace
+
+import pytest
+
+import collation
+from collation import sort_key, sort_names
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    sort_key.cache_clear()
+    yield
+    sort_key.cache_clear()
+
+
+@pytest.mark.parametrize("smaller, larger", [
+    ("第1集", "第2集"),
+    ("第2集", "第10集"),
+    ("第9集", "第010集"),
+    ("第２集", "第10集"),
+    ("ep2", "EP10"),
+    ("10", "abc"),
+    ("abc", "安徽"),
+    ("Zoo", "阿里"),
+    ("-", "中"),
+    ("安徽", "北京"),
+    ("北京", "中国"),
+])
+def test_ordering(smaller, larger):
+    assert sort_key(smaller) < sort_key(larger)
+
+
+def test_categories_and_episode_order():
+    names = ["中国", "第10集", "b", "第2集", "1", "A", "第1集", "20"]
+    assert sort_names(names) == ["1", "20", "A", "b", "第1集", "第2集", "第10集", "中国"]
+
+
+def test_equal_keys_fall_back_to_name():
+    assert sort_names(["Ab", "ab", "AB"]) == ["AB", "Ab", "ab"]
+
+
+def test_without_pypinyin_uses_gb18030(monkeypatch):
+    monkeypatch.setattr(collation, "PYPINYIN_AVAILABLE", False)
+    monkeypatch.setattr(collation, "lazy_pinyin", None)
+    assert sort_names(["中国", "北京", "安徽", "第10集", "第2集"]) == ["安徽", "北京", "第2集", "第10集", "中国"]
+
+
+def test_with_pypinyin_uses_pinyin(monkeypatch):
+    # 用固定读音代替 pypinyin：重(chong2)庆 排在 中(zhong1)国 之前，GB18030 下则相反
+    readings = {"重": "chong2", "庆": "qing4", "中": "zhong1", "国": "guo2"}
+    monkeypatch.setattr(collation, "PYPINYIN_AVAILABLE", True)
+    monkeypatch.setattr(collation, "Style", SimpleNamespace(TONE3="tone3"))
+    monkeypatch.setattr(collation, "lazy_pinyin",
+                        lambda run, style, neutral_tone_with_five: [readings[c] for c in run])
+    assert sort_names(["中国", "重庆"]) == ["重庆", "中国"]
+    monkeypatch.setattr(collation, "PYPINYIN_AVAILABLE", False)
+    sort_key.cache_clear()
+    assert sort_names(["中国", "重庆"]) == ["中国", "重庆"]
@@ -0,0 +1,61 @@
+"""提交下载任务：目录校验与调度器生命周期"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+from jobs import DownloadScheduler, SchedulerNotRunning
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    videos = tmp_path / "videos"
+    (videos / "专辑").mkdir(parents=True)
+    (tmp_path / "outside").mkdir()
+    monkeypatch.setattr(main, "VIDEOS_DIR", videos)
+    return TestClient(main.app)
+
+
+@pytest.mark.parametrize("folder_path", ["../outside", "专辑/../../outside", "/tmp"])
+def test_rejects_folder_outside_videos_dir(client, folder_path):
+    response = client.post("/api/jobs", json={"bv_id": "BV1xx411c7mD", "page": 1, "folder_path": folder_path})
+    assert response.status_code == 404
+
+
+def test_video_folder_stays_inside_videos_dir(client):
+    assert main.video_folder("专辑") == (main.VIDEOS_DIR / "专辑").resolve()
+    assert main.video_folder("") == main.VIDEOS_DIR.resolve()
+
+
+def test_scheduler_rejects_jobs_outside_its_lifecycle():
+    async def runner(job, payload, report):
+        return None
+
+    scheduler = DownloadScheduler(runner, max_workers=1)
+    with pytest.raises(SchedulerNotRunning):
+        scheduler.submit("BV1xx411c7mD", {})
+
+    async def scenario():
+        await scheduler.start()
+        job = scheduler.submit("BV1xx411c7mD", {})
+        await asyncio.sleep(0.01)
+        assert scheduler.get(job.task_id).status == "completed"
+        # 在事件循环之外（工作线程中）提交
+        with pytest.raises(SchedulerNotRunning):
+            await asyncio.to_thread(scheduler.submit, "BV1xx411c7mD", {})
+        await scheduler.stop()
+        with pytest.raises(SchedulerNotRunning):
+            scheduler.submit("BV1xx411c7mD", {})
+
+    asyncio.run(scenario())
+    assert not scheduler.running
+
+
+def test_submit_without_running_scheduler_is_503(client, monkeypatch):
+    scheduler = DownloadScheduler(main._run_download_job)
+    monkeypatch.setattr(main, "download_scheduler", scheduler)
+    with pytest.raises(HTTPException) as excinfo:
+        main.submit_download_job("BV1xx411c7mD", {}, folder_path="专辑")
+    assert excinfo.value.status_code == 503
@@ -0,0 +1,58 @@
+"""下载写盘的内存占用：数据按块落盘，不随文件大小增长"""
+import tracemalloc
+
+from download_pipeline import SegmentedDownload, stream_response_to_file
+
+CHUNK = 64 * 1024
+SIZE = 32 * 1024 * 1024
+# 远小于文件大小，只允许少量块同时在内存中
+MEMORY_LIMIT = 2 * 1024 * 1024
+
+
+class GeneratedResponse:
+    """按需生成数据块的流式响应，自身不持有整段内容"""
+
+    def __init__(self, start, end, status_code=200):
+        self.start, self.end = start, end
+        self.status_code = status_code
+        self.headers = {"Content-Length": str(end - start + 1)}
+
+    def iter_content(self, chunk_size):
+        offset = self.start
+        while offset <= self.end:
+            size = min(chunk_size, self.end - offset + 1)
+            yield bytes([offset // chunk_size % 256]) * size
+            offset += size
+
+    def close(self):
+        pass
+
+
+def peak_memory(download):
+    tracemalloc.start()
+    try:
+        result = download()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_stream_to_file_uses_bounded_memory(tmp_path):
+    dest = tmp_path / "video.mp4"
+    metrics, peak = peak_memory(lambda: stream_response_to_file(GeneratedResponse(0, SIZE - 1), dest,
+                                                                chunk_size=CHUNK))
+    assert metrics.bytes_written == dest.stat().st_size == SIZE
+    assert peak < MEMORY_LIMIT
+    # 顺序流式路径不测量在途字节
+    assert metrics.peak_buffered_bytes is None
+
+
+def test_segmented_download_uses_bounded_memory(tmp_path):
+    dest = tmp_path / "video.mp4"
+    download = SegmentedDownload(dest, SIZE, resource_id="video", segment_size=4 * 1024 * 1024,
+                                 max_workers=4, chunk_size=CHUNK)
+    metrics, peak = peak_memory(lambda: download.run(lambda start, end: GeneratedResponse(start, end, 206)))
+    assert dest.stat().st_size == SIZE
+    assert peak < MEMORY_LIMIT
+    # 在途字节不超过每个并行段各一块
+    assert 0 < metrics.peak_buffered_bytes <= 4 * CHUNK
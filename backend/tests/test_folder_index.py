@@ -0,0 +1,54 @@
+"""文件夹树索引：按排序键返回子文件夹、depth 层子树、已下载统计"""
+import pytest
+
+from folder_index import FolderIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    for folder in ["动画/第10季", "动画/第2季", "动画/第2季/花絮", "纪录片", ".hidden", "下载中.tmp"]:
+        (tmp_path / folder).mkdir(parents=True)
+    (tmp_path / "动画" / "list.txt").write_text("BV1xx411c7mD\n", encoding="utf-8")
+    (tmp_path / "动画" / "第1集.mp4").write_bytes(b"x" * 100)
+    (tmp_path / "动画" / "第1集.720p_hevc.mp4").write_bytes(b"x" * 50)
+    (tmp_path / "动画" / "第2集.part.mp4").write_bytes(b"x" * 10)
+    (tmp_path / "动画" / "第2季" / "第1集.mp4").write_bytes(b"x" * 30)
+    index = FolderIndex(tmp_path)
+    index.build()
+    return index
+
+
+def names(nodes):
+    return [node["name"] for node in nodes]
+
+
+def test_depth_zero_lists_direct_children(index):
+    top = index.children("")
+    assert names(top) == ["动画", "纪录片"]
+    assert top[0]["children"] == []
+
+
+def test_depth_one_includes_sorted_grandchildren(index):
+    top = index.children("", depth=1)
+    anime = top[0]
+    assert names(anime["children"]) == ["第2季", "第10季"]
+    season = anime["children"][0]
+    assert season["path"] == "动画/第2季"
+    assert season["parent_path"] == "动画"
+    assert season["depth"] == 1
+    # depth=1 只展开一层
+    assert season["children"] == []
+    assert anime["has_list_file"] is True
+    assert anime["downloaded_count"] == 1
+    assert anime["bytes"] == 150
+    assert anime["total_bytes"] == 180
+
+
+def test_album_episode_counts(index):
+    index.set_album("动画", ["第1集", "第2集"])
+    anime = index.children("")[0]
+    assert (anime["video_count"], anime["downloaded_count"]) == (2, 1)
+
+
+def test_missing_folder(index):
+    assert index.children("不存在") is None
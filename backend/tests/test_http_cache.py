@@ -0,0 +1,25 @@
+"""条件请求：If-None-Match 优先于 If-Modified-Since"""
+import pytest
+
+from http_cache import is_not_modified
+
+ETAG = '"abc123"'
+LAST_MODIFIED = "Wed, 14 Oct 2026 08:00:00 GMT"
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({}, False),
+    ({"if-none-match": '"abc123"'}, True),
+    ({"if-none-match": 'W/"abc123"'}, True),
+    ({"if-none-match": '"old", "abc123"'}, True),
+    ({"if-none-match": "*"}, True),
+    ({"if-none-match": '"old"'}, False),
+    # 有 If-None-Match 时忽略 If-Modified-Since
+    ({"if-none-match": '"old"', "if-modified-since": "Thu, 15 Oct 2026 08:00:00 GMT"}, False),
+    ({"if-modified-since": "Wed, 14 Oct 2026 08:00:00 GMT"}, True),
+    ({"if-modified-since": "Thu, 15 Oct 2026 08:00:00 GMT"}, True),
+    ({"if-modified-since": "Tue, 13 Oct 2026 08:00:00 GMT"}, False),
+    ({"if-modified-since": "not a date"}, False),
+])
+def test_is_not_modified(headers, expected):
+    assert is_not_modified(headers, ETAG, LAST_MODIFIED) is expected
@@ -0,0 +1,54 @@
+"""合并池：管道输入的合并不占用文件合并的 CPU 名额"""
+import asyncio
+import os
+
+from merge_pool import MergePool
+
+
+def test_pipe_merges_do_not_wait_for_cpu_slots(tmp_path, fake_ffmpeg):
+    async def run():
+        pool = MergePool(max_concurrency=1, pipe_concurrency=2, timeout=10)
+        pipes = [[os.pipe(), os.pipe()] for _ in range(2)]
+        inputs_done = [asyncio.Event() for _ in pipes]
+        merges = [asyncio.ensure_future(pool.merge(
+            f"pipe:{video[0]}", f"pipe:{audio[0]}", tmp_path / f"out{i}.mp4",
+            pass_fds=[video[0], audio[0]], inputs_done=inputs_done[i]))
+            for i, (video, audio) in enumerate(pipes)]
+        # 两路输入都还在"下载"时，两个管道合并已同时运行
+        for _ in range(100):
+            if pool.status()["running"] == 2:
+                break
+            await asyncio.sleep(0.02)
+        assert pool.status()["running"] == 2
+        for i, (video, audio) in enumerate(pipes):
+            os.write(video[1], b"v%d" % i)
+            os.write(audio[1], b"a%d" % i)
+            os.close(video[1])
+            os.close(audio[1])
+            inputs_done[i].set()
+        await asyncio.gather(*merges)
+        return pool
+
+    pool = asyncio.run(run())
+    assert (tmp_path / "out1.mp4").read_bytes() == b"v1a1"
+    assert pool.status()["completed"] == 2
+
+
+def test_pipe_merges_are_bounded_by_pipe_concurrency(tmp_path, fake_ffmpeg):
+    async def run():
+        pool = MergePool(max_concurrency=4, pipe_concurrency=1, timeout=10)
+        video, audio = os.pipe(), os.pipe()
+        first = asyncio.ensure_future(pool.merge(f"pipe:{video[0]}", f"pipe:{audio[0]}", tmp_path / "a.mp4",
+                                                 pass_fds=[video[0], audio[0]]))
+        other_video, other_audio = os.pipe(), os.pipe()
+        second = asyncio.ensure_future(pool.merge(f"pipe:{other_video[0]}", f"pipe:{other_audio[0]}", tmp_path / "b.mp4",
+                                                  pass_fds=[other_video[0], other_audio[0]]))
+        await asyncio.sleep(0.3)
+        status = pool.status()
+        for fd in (video[1], audio[1], other_video[1], other_audio[1]):
+            os.close(fd)
+        await asyncio.gather(first, second)
+        return status
+
+    status = asyncio.run(run())
+    assert status["running"] == 1 and status["queued"] == 1
@@ -0,0 +1,69 @@
+"""管道合并：默认只写最终文件，scratch 中不留下任何文件"""
+import asyncio
+
+import pytest
+
+import main
+from quality import DEFAULT_POLICY, StreamSelection
+
+VIDEO = bytes(range(256)) * 2000
+AUDIO = bytes(reversed(range(256))) * 800
+
+
+@pytest.fixture
+def download_env(tmp_path, monkeypatch, fake_ffmpeg, stream_server):
+    stream_server.files = {"/video.m4s": VIDEO, "/audio.m4s": AUDIO}
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+    target = tmp_path / "album"
+    target.mkdir()
+    monkeypatch.setattr(main, "SCRATCH_DIR", scratch)
+    dash = {"video": [{"baseUrl": f"{stream_server.url}/video.m4s", "height": 720, "codecid": 7, "bandwidth": 1000}],
+            "audio": [{"baseUrl": f"{stream_server.url}/audio.m4s", "bandwidth": 128}]}
+    return scratch, target, StreamSelection(dash, DEFAULT_POLICY)
+
+
+def download(target, selection, progressive_key=None):
+    p_info = {"page": 1, "cid": 1, "part": "第1集", "file_name": "第1集", "duration": 1}
+    return asyncio.run(main.download_and_merge("BV1test", p_info, target, progressive_key=progressive_key,
+                                               selection=selection))
+
+
+def test_default_pipe_merge_writes_only_the_final_file(download_env, monkeypatch):
+    scratch, target, selection = download_env
+    spools = []
+    stream_to_pipe = main.stream_response_to_pipe
+
+    def recording_stream_to_pipe(*args, spool=None, **kwargs):
+        spools.append(spool)
+        return stream_to_pipe(*args, spool=spool, **kwargs)
+
+    monkeypatch.setattr(main, "stream_response_to_pipe", recording_stream_to_pipe)
+    path = download(target, selection)
+
+    assert spools == [None, None]
+    assert open(path, "rb").read() == VIDEO + AUDIO
+    assert sorted(p.name for p in target.iterdir()) == ["第1集.mp4"]
+    assert list(scratch.iterdir()) == []
+
+
+def test_progressive_pipe_merge_cleans_up_scratch(download_env, monkeypatch):
+    scratch, target, selection = download_env
+    monkeypatch.setattr(main.progressive_registry, "grace", 0)
+    path = download(target, selection, progressive_key="BV1test:1:720p_avc")
+    assert open(path, "rb").read() == VIDEO + AUDIO
+    assert list(scratch.iterdir()) == []
+
+
+def test_progressive_stream_outlives_the_download(download_env):
+    """下载结束后 .part 与令牌仍在保留期内，按 Range 播放的客户端不会收到 404"""
+    scratch, target, selection = download_env
+    key = "BV1test:1:720p_avc"
+    download(target, selection, progressive_key=key)
+    entry = main.progressive_registry.get(main.progressive_registry.token_for(key))
+    try:
+        assert entry is not None and entry.done and not entry.failed
+        assert entry.path.read_bytes() == VIDEO + AUDIO
+    finally:
+        main.progressive_registry.close()
+    assert list(scratch.iterdir()) == []
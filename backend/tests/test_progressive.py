@@ -0,0 +1,82 @@
+"""边下边播：.part 文件的保留期与增长中文件的 Range 响应"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from progressive import ProgressiveRegistry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = ProgressiveRegistry(grace=0.2)
+    monkeypatch.setattr(main, "progressive_registry", registry)
+    yield registry
+    registry.close()
+
+
+def test_finished_stream_is_kept_for_grace_period(tmp_path, registry):
+    part = tmp_path / "a.part.mp4"
+    part.write_bytes(b"x" * 100)
+
+    async def run():
+        entry = registry.register("BV1:1:720p_avc", part)
+        registry.finish(entry)
+        kept = registry.get(entry.token) is entry and part.exists()
+        await asyncio.sleep(0.4)
+        return entry, kept
+
+    entry, kept = asyncio.run(run())
+    assert kept
+    assert registry.get(entry.token) is None
+    assert not part.exists()
+
+
+def test_failed_stream_is_removed_immediately(tmp_path, registry):
+    part = tmp_path / "a.part.mp4"
+    part.write_bytes(b"x")
+    entry = registry.register("BV1:1:720p_avc", part)
+    registry.finish(entry, failed=True)
+    assert registry.get(entry.token) is None
+    assert not part.exists()
+
+
+def test_expiry_keeps_file_of_newer_download(tmp_path, registry):
+    part = tmp_path / "a.part.mp4"
+    part.write_bytes(b"x")
+
+    async def run():
+        old = registry.register("BV1:1:720p_avc", part)
+        registry.finish(old)
+        # 保留期内同一分P重新下载
+        new = registry.register("BV1:1:720p_avc", part)
+        await asyncio.sleep(0.4)
+        return new
+
+    new = asyncio.run(run())
+    assert registry.get(new.token) is new
+    assert part.exists()
+
+
+def test_finished_stream_serves_ranges_with_total(tmp_path, registry):
+    part = tmp_path / "a.part.mp4"
+    part.write_bytes(bytes(range(100)))
+    entry = registry.register("BV1:1:720p_avc", part)
+    entry.done = True
+    client = TestClient(main.app)
+    response = client.get(f"/progressive/{entry.token}", headers={"Range": "bytes=90-"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 90-99/100"
+    assert response.content == bytes(range(90, 100))
+
+
+def test_unsatisfiable_range_on_growing_file_reports_current_length(tmp_path, registry, monkeypatch):
+    monkeypatch.setattr("progressive.RANGE_WAIT", 0.2)
+    part = tmp_path / "a.part.mp4"
+    part.write_bytes(b"x" * 50)
+    entry = registry.register("BV1:1:720p_avc", part)
+    client = TestClient(main.app)
+    response = client.get(f"/progressive/{entry.token}", headers={"Range": "bytes=1000-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */50"
@@ -0,0 +1,83 @@
+"""清晰度策略与视频流选择：客户端参数、编码回退与同档位排序"""
+import pytest
+
+import quality
+
+from quality import QualityPolicy, StreamSelection, select_video, variant_key
+
+
+def stream(id, height, codecid, bandwidth):
+    return {"id": id, "baseUrl": f"https://cdn.example/{height}_{codecid}_{bandwidth}.m4s",
+            "height": height, "width": height * 16 // 9, "codecid": codecid, "bandwidth": bandwidth}
+
+
+DASH = {
+    "video": [
+        stream(80, 1080, 7, 3000000),
+        stream(80, 1080, 12, 1800000),
+        stream(64, 720, 7, 1500000),
+        stream(64, 720, 7, 1200000),
+        stream(64, 720, 12, 900000),
+        stream(64, 720, 13, 700000),
+        stream(32, 480, 7, 600000),
+    ],
+    "audio": [
+        {"id": 30280, "baseUrl": "https://cdn.example/a192.m4s", "bandwidth": 192000, "codecs": "mp4a.40.2"},
+        {"id": 30216, "baseUrl": "https://cdn.example/a64.m4s", "bandwidth": 64000, "codecs": "mp4a.40.2"},
+    ],
+}
+
+
+def selected(policy):
+    video = select_video(DASH["video"], policy)
+    return variant_key(video), video["bandwidth"]
+
+
+@pytest.mark.parametrize("policy, expected", [
+    (QualityPolicy(), ("1080p_avc", 3000000)),
+    (QualityPolicy(max_height=720), ("720p_avc", 1500000)),
+    (QualityPolicy(max_height=720, codecs=["hevc", "avc"]), ("720p_hevc", 900000)),
+    (QualityPolicy(max_height=720, codecs=["av1", "hevc", "avc"]), ("720p_av1", 700000)),
+    (QualityPolicy(max_height=1080, codecs=["av1", "hevc"]), ("1080p_hevc", 1800000)),
+    (QualityPolicy(max_height=360), ("480p_avc", 600000)),
+    (QualityPolicy(max_bandwidth=1000000), ("720p_hevc", 900000)),
+])
+def test_client_hints(policy, expected):
+    assert selected(policy) == expected
+
+
+def test_missing_preferred_codec_falls_back():
+    # 只有 AVC 的 480p：偏好 AV1 时退回可用的编码，而不是报错或跳档
+    assert selected(QualityPolicy(max_height=480, codecs=["av1"])) == ("480p_avc", 600000)
+
+
+def test_ordering_within_tier():
+    # 同一档位先按编码偏好顺序，同编码再取码率高的
+    assert selected(QualityPolicy(max_height=720, codecs=["avc", "hevc"])) == ("720p_avc", 1500000)
+    assert selected(QualityPolicy(max_height=720, codecs=["hevc", "avc"])) == ("720p_hevc", 900000)
+    assert selected(QualityPolicy(max_height=720, codecs=["av1", "avc"])) == ("720p_av1", 700000)
+
+
+def test_client_can_only_narrow_policy():
+    base = QualityPolicy(max_height=720, codecs=["hevc", "avc"])
+    policy = base.narrow(QualityPolicy(max_height=1080, codecs=["av1", "avc"]))
+    assert policy.max_height == 720
+    assert policy.codecs == ["avc"]
+
+
+def test_selection_suffix_only_for_non_default_variant(monkeypatch):
+    monkeypatch.setattr(quality, "DEFAULT_POLICY", QualityPolicy(max_height=1080, codecs=["avc", "hevc"]))
+    # 策略不同但选中与默认策略相同的流时不加后缀
+    same = StreamSelection(DASH, QualityPolicy(max_height=1080, codecs=["avc"]))
+    assert same.variant == "1080p_avc" and same.suffix == ""
+    small = StreamSelection(DASH, QualityPolicy(max_height=720, codecs=["hevc"]))
+    assert small.variant == "720p_hevc"
+    assert small.file_stem("第1集") == "第1集.720p_hevc"
+    assert StreamSelection(DASH, QualityPolicy(audio="smallest")).audio["bandwidth"] == 64000
+
+
+def test_invalid_client_hints_rejected():
+    with pytest.raises(ValueError):
+        QualityPolicy(max_height=0)
+    with pytest.raises(ValueError):
+        QualityPolicy(audio="loudest")
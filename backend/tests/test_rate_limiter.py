@@ -0,0 +1,80 @@
+"""外呼限流：令牌桶补充与按优先级放行（同主机队列与全局并发名额）"""
+import threading
+import time
+
+import pytest
+
+from rate_limiter import DETAILS, PLAY, PREFETCH, RateLimiter, TokenBucket
+
+
+def test_token_bucket_refills_at_rate_up_to_capacity():
+    bucket = TokenBucket(rate=2, capacity=3)
+    now = bucket.updated
+    for _ in range(3):
+        assert bucket.wait_time(now) == 0
+        bucket.take(now)
+    assert bucket.wait_time(now) == pytest.approx(0.5)
+    assert bucket.wait_time(now + 0.25) == pytest.approx(0.25)
+    assert bucket.wait_time(now + 0.5) == 0
+    # 空闲再久也只累积到 capacity
+    bucket.wait_time(now + 100)
+    assert bucket.tokens == 3
+
+
+def start_waiters(limiter, requests, order):
+    """按给定顺序逐个排队（等它进入队列或已放行再排下一个），放行时记录顺序"""
+    threads = []
+    for url, priority in requests:
+        def run(url=url, priority=priority):
+            limiter.acquire_sync(url, priority)
+            order.append(priority)
+            limiter.release()
+        before = sum(len(q) for q in limiter._queues.values()) + len(order)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        threads.append(thread)
+        deadline = time.monotonic() + 2
+        while sum(len(q) for q in limiter._queues.values()) + len(order) == before \
+                and time.monotonic() < deadline:
+            time.sleep(0.005)
+    return threads
+
+
+def test_same_host_waiters_are_granted_by_priority():
+    limiter = RateLimiter(rate=1000, burst=1000, max_concurrency=1, host_limits={})
+    limiter.acquire_sync("https://api.example/hold", PLAY)
+    order = []
+    threads = start_waiters(limiter, [("https://api.example/a", PREFETCH), ("https://api.example/b", DETAILS),
+                                      ("https://api.example/c", PLAY)], order)
+    limiter.release()
+    for thread in threads:
+        thread.join(2)
+    assert order == [PLAY, DETAILS, PREFETCH]
+
+
+def test_global_slot_goes_to_higher_priority_host():
+    limiter = RateLimiter(rate=1000, burst=1000, max_concurrency=1, host_limits={})
+    limiter.acquire_sync("https://api.example/hold", PLAY)
+    order = []
+    threads = start_waiters(limiter, [("https://img.example/cover", PREFETCH),
+                                      ("https://api.example/detail", DETAILS),
+                                      ("https://cdn.example/video", PLAY)], order)
+    limiter.release()
+    for thread in threads:
+        thread.join(2)
+    assert order == [PLAY, DETAILS, PREFETCH]
+    assert limiter.stats()["active"] == 0
+
+
+def test_global_slot_not_held_for_host_without_tokens():
+    # 高优先级主机的令牌用完时，名额不为它空等
+    limiter = RateLimiter(rate=0.5, burst=1, max_concurrency=1, host_limits={})
+    limiter.acquire_sync("https://cdn.example/first", PLAY)
+    limiter.release()
+    order = []
+    threads = start_waiters(limiter, [("https://cdn.example/video", PLAY),
+                                      ("https://img.example/cover", PREFETCH)], order)
+    threads[1].join(1)
+    assert order == [PREFETCH]
+    threads[0].join(3)
+    assert order == [PREFETCH, PLAY]
@@ -0,0 +1,116 @@
+"""分段下载与断点续传：部分完成的段、忽略 Range 的服务器、长度不符与损坏的状态文件"""
+import json
+
+import pytest
+
+import main
+from download_pipeline import SegmentedDownload, state_path_for
+
+SEGMENT = 64 * 1024
+CHUNK = 16 * 1024
+BODY = bytes(i % 251 for i in range(5 * SEGMENT + 1234))
+
+
+@pytest.fixture
+def server(stream_server):
+    stream_server.files = {"/video.m4s": BODY}
+    return stream_server
+
+
+def segmented(dest, total=len(BODY)):
+    return SegmentedDownload(dest, total, resource_id="/video.m4s", segment_size=SEGMENT, max_workers=2,
+                             chunk_size=CHUNK)
+
+
+def fetch(server):
+    return lambda start, end: main._fetch_stream_range(f"{server.url}/video.m4s", start, end)
+
+
+class BrokenResponse:
+    """只给出第一块数据后连接中断的响应"""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+
+    def iter_content(self, chunk_size):
+        for chunk in self._response.iter_content(chunk_size=chunk_size):
+            yield chunk
+            raise ConnectionError("connection reset")
+
+    def close(self):
+        self._response.close()
+
+
+def test_resume_after_partial_segment(tmp_path, server):
+    dest = tmp_path / "video.mp4"
+    broken_start = 2 * SEGMENT
+    real_fetch = fetch(server)
+
+    def flaky_fetch(start, end):
+        response = real_fetch(start, end)
+        return BrokenResponse(response) if broken_start <= start <= broken_start + SEGMENT - 1 else response
+
+    with pytest.raises(Exception):
+        segmented(dest).run(flaky_fetch)
+    state = json.loads(state_path_for(dest).read_text())
+    partial = state["written"][str(broken_start)]
+    assert 0 < partial < SEGMENT
+
+    server.requests.clear()
+    download = segmented(dest)
+    metrics = download.run(fetch(server))
+    # 只补齐中断的段，从该段已写入的位置继续
+    assert server.requests == [("/video.m4s", f"bytes={broken_start + partial}-{broken_start + SEGMENT - 1}")]
+    assert metrics.resumed_bytes == len(BODY) - (SEGMENT - partial)
+    assert dest.read_bytes() == BODY
+
+
+def test_corrupted_state_starts_over(tmp_path, server):
+    dest = tmp_path / "video.mp4"
+    dest.write_bytes(b"\0" * len(BODY))
+    state_path_for(dest).write_text("{not json")
+    metrics = segmented(dest).run(fetch(server))
+    assert metrics.resumed_bytes == 0
+    assert dest.read_bytes() == BODY
+
+
+def test_state_for_other_length_is_ignored(tmp_path, server):
+    dest = tmp_path / "video.mp4"
+    segmented(dest).run(fetch(server))
+    state = json.loads(state_path_for(dest).read_text())
+    state["total_bytes"] = len(BODY) + 1
+    state_path_for(dest).write_text(json.dumps(state))
+    server.requests.clear()
+    metrics = segmented(dest).run(fetch(server))
+    assert metrics.resumed_bytes == 0
+    assert len(server.requests) == len(segmented(dest).segments())
+    assert dest.read_bytes() == BODY
+
+
+def test_server_shorter_than_advertised_length_fails(tmp_path, server):
+    dest = tmp_path / "video.mp4"
+    with pytest.raises(Exception):
+        segmented(dest, total=len(BODY) + SEGMENT).run(fetch(server))
+    # 已完成的段仍记录在状态中，不会被当作完整文件
+    state = json.loads(state_path_for(dest).read_text())
+    assert sum(state["written"].values()) == len(BODY)
+
+
+def test_range_ignored_by_server_is_not_written(tmp_path, server):
+    server.ignore_range = True
+    dest = tmp_path / "video.mp4"
+    with pytest.raises(Exception, match="Range request failed"):
+        segmented(dest).run(fetch(server))
+    assert dest.read_bytes() == b"\0" * len(BODY)
+
+
+def test_download_falls_back_to_single_stream_when_range_is_ignored(tmp_path, server):
+    server.ignore_range = True
+    server.files["/audio.m4s"] = BODY[:1000]
+    video, audio = tmp_path / "video.mp4", tmp_path / "audio.mp3"
+    done = main._download_segmented(f"{server.url}/video.m4s", f"{server.url}/audio.m4s", video, audio,
+                                    lambda **fields: None)
+    assert done == len(BODY) + 1000
+    assert video.read_bytes() == BODY and audio.read_bytes() == BODY[:1000]
+    assert not state_path_for(video).exists()
@@ -0,0 +1,66 @@
+"""single-flight：并发调用合并、异常传给所有等待者、取消单个调用方"""
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "done"
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+        return results, calls, len(flight)
+
+    results, calls, remaining = asyncio.run(scenario())
+    assert results == ["done"] * 5
+    assert calls == [1]
+    assert remaining == 0
+
+
+def test_error_propagates_to_every_waiter_and_is_not_cached():
+    async def scenario():
+        flight = SingleFlight()
+        attempts = []
+
+        async def failing():
+            attempts.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        results = await asyncio.gather(*(flight.do("key", failing) for _ in range(3)), return_exceptions=True)
+        assert not flight.in_flight("key")
+        # 失败不被缓存，下一次调用重新执行
+        retried = await flight.do("key", lambda: asyncio.sleep(0, result="ok"))
+        return results, attempts, retried
+
+    results, attempts, retried = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) and str(r) == "upstream failed" for r in results)
+    assert attempts == [1]
+    assert retried == "ok"
+
+
+def test_cancelled_caller_does_not_cancel_shared_work():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.02)
+            return 42
+
+        first = asyncio.ensure_future(flight.do("key", work))
+        second = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == 42
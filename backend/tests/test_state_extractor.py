@@ -0,0 +1,97 @@
+"""页面状态提取：嵌套对象、字符串中的结束标记、缺失状态，orjson 与标准库两种解码"""
+import asyncio
+import json
+
+import pytest
+
+import state_extractor
+from state_extractor import extract_video_pages, read_initial_state, read_initial_state_async, read_play_session
+
+PAGES = [{"cid": 101, "page": 1, "part": "第1集"}, {"cid": 102, "page": 2, "part": "第2集 {嵌套}"}]
+STATE = {
+    # 其他子树中的同名键不含分P列表，不应被当成 videoData
+    "related": {"videoData": {"bvid": "BV0"}},
+    "videoData": {
+        "bvid": "BV1xx",
+        # 以反斜杠结尾的字符串：其后的引号是真正的结束引号
+        "path": "C:\\",
+        "desc": 'see };(function(){alert(1)})(); and "quotes" \\ here',
+        "owner": {"mid": 1, "face": {"url": "x", "sizes": [[1, 2], {"a": {"b": {}}}]}},
+        "pages": PAGES,
+    },
+    "upData": {"name": "作者"},
+}
+
+
+def page(state=STATE, tail=";(function(){var s;(s=document.currentScript).parentNode.removeChild(s);}());"):
+    body = json.dumps(state, ensure_ascii=False).replace("/", "\\u002F")
+    return (f'<html><head><script>window.__playinfo__={{"session":"abc123"}}</script>'
+            f'<script>window.__INITIAL_STATE__={body}{tail}</script>'
+            f'<script>var later = 1;</script></head><body>{"x" * 5000}</body></html>').encode()
+
+
+def chunks(data, size=7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, monkeypatch):
+    if request.param == "orjson":
+        if not state_extractor.ORJSON_AVAILABLE:
+            pytest.skip("orjson not installed")
+    else:
+        monkeypatch.setattr(state_extractor, "ORJSON_AVAILABLE", False)
+    return request.param
+
+
+def test_nested_state_across_chunks(backend):
+    state = read_initial_state(chunks(page()))
+    assert json.loads(state) == STATE
+    assert extract_video_pages(state) == PAGES
+
+
+def test_end_marker_inside_string(backend):
+    # 字符串里的 "};" 与 ";(function()" 不截断状态对象
+    state = read_initial_state(chunks(page(), size=4096))
+    assert json.loads(state)["videoData"]["desc"] == STATE["videoData"]["desc"]
+    assert extract_video_pages(state) == PAGES
+
+
+def test_state_without_trailing_script(backend):
+    state = read_initial_state([page(tail=";")])
+    assert extract_video_pages(state) == PAGES
+
+
+def test_stops_reading_after_state():
+    data = page()
+    consumed = []
+
+    def tracked():
+        for chunk in chunks(data, size=256):
+            consumed.append(chunk)
+            yield chunk
+
+    read_initial_state(tracked())
+    assert sum(map(len, consumed)) < len(data) - 4000
+
+
+def test_missing_state(backend):
+    assert read_initial_state(chunks(b"<html><script>window.__other__={}</script></html>")) is None
+    state = json.dumps({"videoData": {"bvid": "BV1xx"}}).encode()
+    assert extract_video_pages(state) == []
+    assert extract_video_pages(b'{"error": 1}') == []
+
+
+def test_async_reader():
+    async def gen():
+        for chunk in chunks(page(), size=100):
+            yield chunk
+
+    state = asyncio.run(read_initial_state_async(gen()))
+    assert extract_video_pages(state) == PAGES
+
+
+def test_play_session():
+    assert read_play_session(chunks(page(), size=5)) == "abc123"
+    assert read_play_session([b"<html></html>"]) is None
@@ -0,0 +1,110 @@
+"""字幕轨道索引：有效期、落盘与重新加载，以及只在文件夹删除时清理条目"""
+import json
+import shutil
+import time
+
+import pytest
+
+import main
+from album import ListFileIndex
+from folder_index import FolderIndex
+from subtitle_index import SubtitleTrackIndex
+
+USER_TRACKS = [{"lan": "zh-CN", "ai_type": 0, "subtitle_url": "//example/sub.json"}]
+
+
+def new_index(path, positive_ttl=3600, negative_ttl=60):
+    return SubtitleTrackIndex(path, positive_ttl=positive_ttl, negative_ttl=negative_ttl)
+
+
+def test_positive_and_negative_ttl(tmp_path):
+    index = new_index(tmp_path / "tracks_index.json", positive_ttl=3600, negative_ttl=0.05)
+    index.put("BV1", 1, USER_TRACKS)
+    index.put("BV2", 2, [])
+    assert index.get("BV1", 1) == USER_TRACKS
+    assert index.get("BV2", 2) == []
+    time.sleep(0.06)
+    assert index.get("BV2", 2) is None
+    assert index.get("BV1", 1) == USER_TRACKS
+    assert index.get("BV3", 3) is None
+    assert (index.hits, index.misses) == (3, 2)
+
+
+def test_flush_drops_expired_and_reloads(tmp_path):
+    path = tmp_path / "tracks_index.json"
+    index = new_index(path, negative_ttl=0.05)
+    index.put("BV1", 1, USER_TRACKS)
+    index.put("BV2", 2, [])
+    time.sleep(0.06)
+    index.put("BV1", 3, [])
+    index.flush()
+    assert set(json.loads(path.read_text(encoding="utf-8"))["entries"]) == {"BV1:1", "BV1:3"}
+    reloaded = new_index(path)
+    assert reloaded.get("BV1", 1) == USER_TRACKS
+    assert reloaded.stats()["entries"] == 2
+
+
+def test_corrupted_file_starts_empty(tmp_path):
+    path = tmp_path / "tracks_index.json"
+    path.write_text("{broken", encoding="utf-8")
+    index = new_index(path)
+    assert index.stats()["entries"] == 0
+    index.put("BV1", 1, [])
+    assert "BV1:1" in json.loads(path.read_text(encoding="utf-8"))["entries"]
+
+
+def test_discard(tmp_path):
+    index = new_index(tmp_path / "tracks_index.json")
+    index.put("BV1", 1, [])
+    index.put("BV1", 2, USER_TRACKS)
+    index.put("BV2", 1, [])
+    assert index.discard({"BV1", "BV9"}) == 2
+    assert index.get("BV2", 1) == []
+    assert index.discard(set()) == 0
+
+
+@pytest.fixture
+def videos(tmp_path, monkeypatch):
+    """临时视频目录：两个文件夹，BV2 同时列在两个 list.txt 中"""
+    root = tmp_path / "videos"
+    for folder, lines in {"动画": ["BV1xx411c7mD", "BV1yy411c7mE"], "合集": ["BV1yy411c7mE"]}.items():
+        (root / folder).mkdir(parents=True)
+        (root / folder / "list.txt").write_text("\n".join(lines) + "\n", encoding="utf-8")
+    list_index = ListFileIndex(root)
+    list_index.scan()
+    folder_index = FolderIndex(root)
+    folder_index.build()
+    index = new_index(tmp_path / "tracks_index.json")
+    for bvid in ("BV1xx411c7mD", "BV1yy411c7mE"):
+        index.put(bvid, 1, [])
+    monkeypatch.setattr(main, "list_index", list_index)
+    monkeypatch.setattr(main, "folder_index", folder_index)
+    monkeypatch.setattr(main, "_subtitle_index", index)
+    return root, index
+
+
+def test_folder_deletion_prunes_unlisted_videos(videos):
+    root, index = videos
+    shutil.rmtree(root / "动画")
+    main._on_videos_changed([root / "动画"])
+    assert index.get("BV1xx411c7mD", 1) is None
+    # 仍被另一个 list.txt 列出的视频保留
+    assert index.get("BV1yy411c7mE", 1) == []
+
+
+def test_unreadable_or_replaced_list_file_keeps_entries(videos):
+    root, index = videos
+    list_file = root / "动画" / "list.txt"
+    list_file.unlink()
+    main._on_videos_changed([list_file])
+    list_file.write_text("", encoding="utf-8")
+    main._on_videos_changed([list_file])
+    assert index.get("BV1xx411c7mD", 1) == []
+
+
+def test_folder_rename_keeps_entries(videos):
+    root, index = videos
+    (root / "动画").rename(root / "番剧")
+    main._on_videos_changed([root / "动画", root / "番剧"])
+    assert index.get("BV1xx411c7mD", 1) == []
+    assert main.list_index.bvids_under(root / "番剧") == {"BV1xx411c7mD", "BV1yy411c7mE"}
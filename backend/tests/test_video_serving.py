@@ -0,0 +1,43 @@
+"""静态视频的 Range 与 HEAD 请求"""
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from video_serving import RangeNotSatisfiable, parse_range_header
+
+CONTENT = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    (tmp_path / "专辑").mkdir()
+    (tmp_path / "专辑" / "第1集.mp4").write_bytes(CONTENT)
+    monkeypatch.setattr(main, "VIDEOS_DIR", tmp_path)
+    return TestClient(main.app)
+
+
+def test_head_returns_headers_without_body(client):
+    response = client.head("/static/专辑/第1集.mp4")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(len(CONTENT))
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.content == b""
+
+
+def test_head_with_range(client):
+    response = client.head("/static/专辑/第1集.mp4", headers={"Range": "bytes=0-99"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 0-99/{len(CONTENT)}"
+    assert response.content == b""
+
+
+def test_get_range(client):
+    response = client.get("/static/专辑/第1集.mp4", headers={"Range": "bytes=-5"})
+    assert response.status_code == 206
+    assert response.content == CONTENT[-5:]
+
+
+def test_suffix_range_of_empty_file_is_not_satisfiable():
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range_header("bytes=-5", 0)
+    assert parse_range_header("bytes=-5", 10) == [(5, 9)]
@@ -0,0 +1,230 @@
+"""
+封面缩略图：在进程池中把原始封面缩放为多个宽度，并在编码器可用时额外生成 WebP/AVIF，
+与原图一起保存在 covers/ 下；提供按宽度与 Accept 头选择变体的函数。
+生成结果（包括原图太小、无需生成的宽度）记录在封面旁的清单文件中，请求时只查清单，不逐个 stat 变体。
+依赖 Pillow（可选），未安装时只提供原图。
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from cache import LRUCache
+
+try:
+    from PIL import Image, features
+    PIL_AVAILABLE = True
+except ImportError:
+    Image = None
+    features = None
+    PIL_AVAILABLE = False
+
+try:
+    # 旧版 Pillow 通过插件提供 AVIF 编码
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+# 生成的宽度（像素）
+DEFAULT_WIDTHS = [int(w) for w in os.getenv("COVER_THUMB_WIDTHS", "160,320,640").split(",") if w.strip().isdigit()]
+# 缩略图进程池大小
+DEFAULT_WORKERS = int(os.getenv("COVER_THUMB_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) // 2)))))
+
+# 格式 -> (扩展名, MIME, Pillow 保存参数)
+FORMATS = {
+    "jpeg": ("jpg", "image/jpeg", {"quality": 80, "optimize": True, "progressive": True}),
+    "webp": ("webp", "image/webp", {"quality": 75, "method": 4}),
+    "avif": ("avif", "image/avif", {"quality": 50}),
+}
+# Accept 中同时出现时的优先顺序（体积从小到大）
+PREFERRED_FORMATS = ("avif", "webp")
+
+MEDIA_TYPES = {ext: mime for ext, mime, _ in FORMATS.values()}
+
+
+def available_formats() -> List[str]:
+    """当前环境可编码的格式（JPEG 总是可用）"""
+    if not PIL_AVAILABLE:
+        return []
+    formats = ["jpeg"]
+    for name in ("webp", "avif"):
+        try:
+            if features.check(name) or name.upper() in Image.registered_extensions().values():
+                formats.append(name)
+        except Exception:
+            continue
+    return formats
+
+
+def variant_path(original: Path, width: int, fmt: str) -> Path:
+    """某宽度与格式的变体路径，如 BV1xx_p1.jpg -> BV1xx_p1_w320.webp"""
+    return original.with_name(f"{original.stem}_w{width}.{FORMATS[fmt][0]}")
+
+
+def manifest_path(original: Path) -> Path:
+    """变体清单路径，如 BV1xx_p1.jpg -> BV1xx_p1.thumbs.json"""
+    return original.with_name(f"{original.stem}.thumbs.json")
+
+
+def read_manifest(original: Path, widths: Sequence[int], formats: Sequence[str]) -> Optional[Dict[str, Any]]:
+    """读取与原图（mtime）及当前宽度、格式配置一致的清单；不存在或已过期时返回 None"""
+    try:
+        mtime_ns = original.stat().st_mtime_ns
+        with open(manifest_path(original), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(manifest, dict) or manifest.get("mtime_ns") != mtime_ns
+            or not set(widths) <= set(manifest.get("widths", [])) or list(formats) != manifest.get("formats")):
+        return None
+    return manifest
+
+
+def generate_variants(original: str, widths: Sequence[int], formats: Sequence[str]) -> Tuple[List[str], Dict[str, Any]]:
+    """在子进程中运行：生成缺失或过期的变体并写入清单，返回 (新生成的文件名, 清单)"""
+    src = Path(original)
+    created = []
+    stat_result = src.stat()
+    src_mtime = stat_result.st_mtime
+    # 宽度 -> 已有的格式；原图太小而不生成的宽度不出现，由原图直接满足
+    variants: Dict[str, List[str]] = {}
+    with Image.open(src) as image:
+        image = image.convert("RGB")
+        for width in sorted(set(widths)):
+            # 不放大：原图已足够小时由原图直接满足
+            if width >= image.width:
+                continue
+            height = max(1, round(image.height * width / image.width))
+            resized = None
+            for fmt in formats:
+                dest = variant_path(src, width, fmt)
+                if not (dest.exists() and dest.stat().st_mtime >= src_mtime):
+                    if resized is None:
+                        resized = image.resize((width, height), Image.LANCZOS)
+                    temp_path = dest.with_name(dest.name + ".part")
+                    _, _, options = FORMATS[fmt]
+                    resized.save(temp_path, format=fmt.upper(), **options)
+                    os.replace(temp_path, dest)
+                    created.append(dest.name)
+                variants.setdefault(str(width), []).append(fmt)
+    manifest = {"mtime_ns": stat_result.st_mtime_ns, "widths": sorted(set(widths)), "formats": list(formats),
+                "variants": variants}
+    path = manifest_path(src)
+    temp_path = path.with_name(path.name + ".part")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, path)
+    return created, manifest
+
+
+def parse_accept(accept: Optional[str]) -> List[str]:
+    """从 Accept 头中取出客户端接受的 image/* 子类型（忽略 q=0）"""
+    accepted = []
+    for item in (accept or "").split(","):
+        mime, _, params = item.strip().partition(";")
+        q = params.replace(" ", "")
+        if q.startswith("q=") and q[2:].replace(".", "", 1).isdigit() and float(q[2:]) == 0:
+            continue
+        if mime.startswith("image/"):
+            accepted.append(mime[len("image/"):])
+    return accepted
+
+
+def choose_variant(original: Path, width: Optional[int], accept: Optional[str],
+                   widths: Sequence[int] = DEFAULT_WIDTHS, manifest: Optional[Dict[str, Any]] = None) -> Path:
+    """按请求宽度选择不小于它的最小变体，再按 Accept 选择最小的可用格式；没有合适变体时返回原图。
+    可用的变体以清单为准（没有清单时视为尚未生成）"""
+    if not width or width <= 0 or manifest is None:
+        return original
+    candidates = sorted(w for w in widths if w >= width)
+    if not candidates:
+        return original
+    target = candidates[0]
+    available = manifest.get("variants", {}).get(str(target), [])
+    accepted = parse_accept(accept)
+    for fmt in PREFERRED_FORMATS:
+        if fmt in accepted and fmt in available:
+            return variant_path(original, target, fmt)
+    return variant_path(original, target, "jpeg") if "jpeg" in available else original
+
+
+class ThumbnailPipeline:
+    """缩略图生成调度：进程池执行、同一封面去重、任务跟踪，关闭时取消"""
+
+    def __init__(self, widths: Sequence[int] = DEFAULT_WIDTHS, max_workers: int = DEFAULT_WORKERS):
+        self.widths = list(widths)
+        self.max_workers = max(1, max_workers)
+        self.formats = available_formats()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: Dict[str, asyncio.Future] = {}
+        # 原图路径 -> 变体清单（内存中没有时读取清单文件一次）
+        self._manifests = LRUCache("thumbnails_manifests", max_entries=8192)
+        self.generated = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.formats and self.widths)
+
+    async def manifest(self, original: Path) -> Optional[Dict[str, Any]]:
+        """封面的变体清单；尚未生成或原图、配置已变化时返回 None"""
+        if not self.enabled:
+            return None
+        key = str(original)
+        manifest = self._manifests.get(key)
+        if manifest is None:
+            manifest = await asyncio.to_thread(read_manifest, original, self.widths, self.formats)
+            if manifest is not None:
+                self._manifests.set(key, manifest)
+        return manifest
+
+    def schedule(self, original: Path) -> Optional[asyncio.Future]:
+        """为封面登记一次变体生成；未启用或已在生成时返回 None 或已有任务"""
+        if not self.enabled:
+            return None
+        key = str(original)
+        task = self._tasks.get(key)
+        if task is not None:
+            return task
+        if self._pool is None:
+            # 首次使用时再创建进程池，避免未用到缩略图时多出子进程
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        loop = asyncio.get_running_loop()
+        # 原图被替换后旧清单作废，新清单在生成完成后写入
+        self._manifests.delete(key)
+        task = loop.run_in_executor(self._pool, generate_variants, key, self.widths, self.formats)
+        self._tasks[key] = task
+        task.add_done_callback(lambda t: self._done(key, t))
+        return task
+
+    def _done(self, key: str, task: asyncio.Future) -> None:
+        self._tasks.pop(key, None)
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            self.failed += 1
+            print(f"生成封面缩略图失败 {Path(key).name}: {error}")
+        else:
+            created, manifest = task.result()
+            self.generated += len(created)
+            self._manifests.set(key, manifest)
+
+    def status(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "formats": self.formats,
+            "widths": self.widths,
+            "in_flight": len(self._tasks),
+            "generated": self.generated,
+            "failed": self.failed,
+        }
+
+    def shutdown(self) -> None:
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
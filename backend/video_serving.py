@@ -0,0 +1,228 @@
+"""
+视频文件服务：完整的 HTTP Range 支持（单段 206、多段 multipart/byteranges、416、If-Range），
+数据在线程中 pread 分块读取，并通过 posix_fadvise 提示内核顺序预读。
+只有服务器在 scope["extensions"] 中声明 http.response.zerocopy 时才改用 sendfile 零拷贝发送；
+uvicorn 不声明该扩展，所以用 uvicorn 运行时实际走的是 pread 路径，数据仍会经过用户态。
+"""
+import asyncio
+import mimetypes
+import os
+import secrets
+from email.utils import formatdate
+from pathlib import Path
+from typing import List, Mapping, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from http_cache import file_etag, is_not_modified
+
+# 每次读取/发送的块大小（字节）
+READ_CHUNK_SIZE = int(os.getenv("VIDEO_READ_CHUNK_SIZE", str(1024 * 1024)))
+# 每个区间的首块大小（字节）
+FIRST_CHUNK_SIZE = 64 * 1024
+# 提前提示内核预读的窗口（字节）
+READAHEAD_BYTES = int(os.getenv("VIDEO_READAHEAD_BYTES", str(8 * 1024 * 1024)))
+# 单个请求允许的最多区间数，防止构造大量小区间的请求
+MAX_RANGES = 16
+
+VIDEO_MEDIA_TYPES = {
+    ".mp4": "video/mp4",
+    ".m4s": "video/iso.segment",
+    ".m4a": "audio/mp4",
+    ".mp3": "audio/mpeg",
+    ".webm": "video/webm",
+    ".mkv": "video/x-matroska",
+    ".ts": "video/mp2t",
+    ".m3u8": "application/vnd.apple.mpegurl",
+}
+
+_FADVISE = hasattr(os, "posix_fadvise")
+_PREAD = hasattr(os, "pread")
+
+
+class RangeNotSatisfiable(Exception):
+    """请求的区间全部超出文件范围"""
+
+
+def guess_media_type(path: Path) -> str:
+    return (VIDEO_MEDIA_TYPES.get(path.suffix.lower())
+            or mimetypes.guess_type(path.name)[0]
+            or "application/octet-stream")
+
+
+def parse_range_header(value: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """解析 Range 头，返回按起点排序并合并后的闭区间列表；
+    语法无法识别时返回 None（按规范忽略 Range），全部不可满足时抛出 RangeNotSatisfiable"""
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_text, sep, end_text = part.partition("-")
+        start_text, end_text = start_text.strip(), end_text.strip()
+        if (not sep or not (start_text or end_text)
+                or (start_text and not start_text.isdigit()) or (end_text and not end_text.isdigit())):
+            return None
+        if not start_text:
+            # 后缀区间：最后 N 个字节；空文件没有可满足的后缀区间
+            length = int(end_text)
+            if length == 0 or size == 0:
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(start_text)
+        end = int(end_text) if end_text else max(start, size - 1)
+        if end < start:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+    if not ranges:
+        raise RangeNotSatisfiable()
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _advise(fd: int, offset: int, length: int) -> None:
+    if _FADVISE:
+        try:
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_SEQUENTIAL)
+            os.posix_fadvise(fd, offset, min(length, READAHEAD_BYTES), os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+
+
+def _read_chunk(f, offset: int, length: int) -> bytes:
+    if not _PREAD:
+        # Windows 没有 pread；每个响应独占一个文件对象，seek + read 即可
+        f.seek(offset)
+        return f.read(length)
+    fd = f.fileno()
+    data = os.pread(fd, length, offset)
+    # 读到预读窗口末尾时提示内核预读下一段
+    if _FADVISE and (offset + len(data)) % READAHEAD_BYTES < len(data):
+        try:
+            os.posix_fadvise(fd, offset + len(data), READAHEAD_BYTES, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+    return data
+
+
+class RangeFileResponse(Response):
+    """按区间发送文件内容的响应；ranges 为 None 时发送整个文件"""
+
+    def __init__(self, path: Path, size: int, media_type: str,
+                 ranges: Optional[List[Tuple[int, int]]] = None,
+                 headers: Optional[Mapping[str, str]] = None, method: str = "GET"):
+        self.path = path
+        self.size = size
+        self.ranges = ranges
+        self.send_body = method != "HEAD"
+        self.boundary = secrets.token_hex(13) if ranges and len(ranges) > 1 else None
+        super().__init__(status_code=206 if ranges else 200, headers=dict(headers or {}))
+        self.headers["accept-ranges"] = "bytes"
+
+        if not ranges:
+            self.headers["content-type"] = media_type
+            self.headers["content-length"] = str(size)
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.headers["content-type"] = media_type
+            self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+            self.headers["content-length"] = str(end - start + 1)
+        else:
+            self.headers["content-type"] = f"multipart/byteranges; boundary={self.boundary}"
+            self._part_headers = [self._multipart_header(media_type, start, end) for start, end in ranges]
+            length = sum(len(h) + (end - start + 1) + 2 for h, (start, end) in zip(self._part_headers, ranges))
+            self.headers["content-length"] = str(length + len(self._multipart_trailer()))
+
+    def _multipart_header(self, media_type: str, start: int, end: int) -> bytes:
+        return (f"--{self.boundary}\r\n"
+                f"Content-Type: {media_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{self.size}\r\n\r\n").encode("latin-1")
+
+    def _multipart_trailer(self) -> bytes:
+        return f"--{self.boundary}--\r\n".encode("latin-1")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        zerocopy = "http.response.zerocopy" in scope.get("extensions", {})
+        with open(self.path, 'rb', buffering=0) as f:
+            if not self.ranges:
+                await self._send_span(send, f, 0, self.size, zerocopy, more_body=False)
+            elif len(self.ranges) == 1:
+                start, end = self.ranges[0]
+                await self._send_span(send, f, start, end - start + 1, zerocopy, more_body=False)
+            else:
+                for header, (start, end) in zip(self._part_headers, self.ranges):
+                    await send({"type": "http.response.body", "body": header, "more_body": True})
+                    await self._send_span(send, f, start, end - start + 1, zerocopy, more_body=True)
+                    await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+                await send({"type": "http.response.body", "body": self._multipart_trailer(), "more_body": False})
+
+    async def _send_span(self, send: Send, f, offset: int, length: int, zerocopy: bool, more_body: bool) -> None:
+        if length <= 0:
+            if not more_body:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        if zerocopy:
+            # 服务器通过 sendfile 从文件描述符直接发送，数据不经过用户态
+            await send({"type": "http.response.zerocopy", "file": f, "offset": offset,
+                        "count": length, "more_body": more_body})
+            return
+        _advise(f.fileno(), offset, length)
+        end = offset + length
+        # 首块较小以尽快送出首字节（跳转后的起播延迟），之后逐步增大到 READ_CHUNK_SIZE
+        chunk_size = min(FIRST_CHUNK_SIZE, READ_CHUNK_SIZE)
+        while offset < end:
+            chunk = await asyncio.to_thread(_read_chunk, f, offset, min(chunk_size, end - offset))
+            if not chunk:
+                raise OSError(f"文件在发送过程中被截断: {self.path.name}")
+            offset += len(chunk)
+            chunk_size = min(chunk_size * 2, READ_CHUNK_SIZE)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body or offset < end})
+
+
+async def serve_file_with_ranges(request: Request, path: Path, cache_control: str,
+                                 media_type: Optional[str] = None) -> Response:
+    """带校验器、条件请求与 Range 支持的文件响应"""
+    stat_result = await asyncio.to_thread(os.stat, path)
+    size = stat_result.st_size
+    etag = await file_etag(path, stat_result)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    headers = {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": cache_control}
+
+    if is_not_modified(request.headers, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    media_type = media_type or guess_media_type(path)
+    ranges = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range 与当前版本不一致时忽略 Range，返回完整内容
+    if range_header and (not if_range or if_range.strip() in (etag, last_modified)):
+        try:
+            ranges = parse_range_header(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}",
+                                                      "Accept-Ranges": "bytes"})
+    return RangeFileResponse(path, size, media_type, ranges=ranges, headers=headers, method=request.method)
@@ -9,6 +9,11 @@ class VideoPlayerApp {
         this.currentPath = [];  // 当前路径栈 ['folder1', 'subfolder1']
         this.folderHistory = []; // 导航历史
         this.player = null; // Plyr播放器实例
+        this.jobWatcher = null; // 当前下载任务的事件流/轮询句柄
+        this.hls = null; // hls.js 实例（播放已打包的 HLS 时）
+        this.coverObserver = null; // 封面加载的可视区域监听
+        this.loadedCovers = new Set(); // 当前文件夹已显示封面的剧集 ID
+        this.folderTree = new Map(); // 已获取的子文件夹列表（路径 -> 子文件夹），进入下一层时先用它即时渲染
         // 加载页状态：打字是否完成、数据是否就绪
         this.typingDone = false;
         this.foldersLoaded = false;
@@ -70,13 +75,29 @@ class VideoPlayerApp {
             // 标准化路径：将反斜杠转换为正斜杠
             const normalizedPath = path ? path.replace(/\\/g, '/') : '';
             
-            const url = normalizedPath && normalizedPath.trim() ? `${this.apiBase}/api/folders?path=${encodeURIComponent(normalizedPath)}` : `${this.apiBase}/api/folders`;
-            const response = await fetch(url);
-            const folders = await response.json();
-            
             // 更新当前路径
             this.currentPath = (normalizedPath && normalizedPath.trim()) ? normalizedPath.split('/') : [];
-            
+
+            // 上一层已带回本层的子文件夹时先即时渲染，再用最新结果刷新
+            const cached = this.folderTree.get(normalizedPath);
+            if (cached) {
+                this.renderFolders(cached);
+                this.updateBreadcrumb();
+                this.updateBackButton();
+            }
+
+            // depth=1：每个子文件夹附带它的下一层，进入时无需等待请求
+            const query = normalizedPath && normalizedPath.trim() ? `path=${encodeURIComponent(normalizedPath)}&depth=1` : 'depth=1';
+            const response = await fetch(`${this.apiBase}/api/folders?${query}`);
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            const folders = await response.json();
+            this.folderTree.set(normalizedPath, folders);
+            folders.forEach(folder => this.folderTree.set(folder.path, folder.children || []));
+
+            // 请求期间已导航到其他文件夹时不再覆盖
+            if (this.currentPath.join('/') !== normalizedPath) return;
             this.renderFolders(folders);
             this.updateBreadcrumb();
             this.updateBackButton();
@@ -113,9 +134,15 @@ class VideoPlayerApp {
             const hasVideos = typeof folder === 'object' && folder.has_list_file;
             const folderIcon = '📁'; // 统一使用文件夹图标
 
+            // 已解析过的专辑显示已下载集数
+            const progress = typeof folder === 'object' && folder.video_count
+                ? `<div class="folder-meta">已下载 ${folder.downloaded_count}/${folder.video_count} 集</div>`
+                : '';
+
             folderElement.innerHTML = `
                 <span class="folder-icon">${folderIcon}</span>
                 <div class="folder-name">${folderName}</div>
+                ${progress}
             `;
 
             // 点击和键盘事件
@@ -194,8 +221,9 @@ class VideoPlayerApp {
             this.renderVideos(videos);
             this.showScreen('videos');
 
-            // 异步加载封面
-            this.loadCoversAsync(videos);
+            // 异步加载封面与字幕标记
+            this.loadCoversAsync(folderPath, videos);
+            this.loadDetailsAsync(folderPath);
         } catch (error) {
             this.showError('加载视频列表失败');
             console.error('Error loading videos:', error);
@@ -221,7 +249,7 @@ class VideoPlayerApp {
             videoElement.className = 'video-item';
             // 移除动画延迟，让所有视频项一次性显示
             // videoElement.style.animationDelay = `${index * 0.12}s`;
-            videoElement.dataset.videoPage = video.page;
+            videoElement.dataset.episodeId = video.id;
             videoElement.setAttribute('tabindex', '0'); // 键盘可访问性
 
             // 初始显示占位符，添加加载状态
@@ -233,7 +261,7 @@ class VideoPlayerApp {
                 </div>
                 <div class="video-info">
                     <div class="video-title">${video.title}</div>
-                    <div class="video-page">第 ${video.page} 集</div>
+                    <div class="video-page">第 ${video.index} 集</div>
                     ${video.duration ? `<div class="video-duration">${this.formatDuration(video.duration)}</div>` : ''}
                 </div>
             `;
@@ -255,38 +283,168 @@ class VideoPlayerApp {
         });
     }
 
-    async loadCoversAsync(videos) {
-        // 异步加载每个视频的封面
-        for (const video of videos) {
-            if (video.bvid) {
-                try {
-                    // 延迟一点时间，避免同时发起太多请求
-                    await new Promise(resolve => setTimeout(resolve, 100));
+    async loadCoversAsync(folderPath, videos) {
+        // 通过封面清单一次拿到已缓存的封面，其余由后端下载后以 NDJSON 逐个推送；
+        // 可视区域内的剧集优先下载（专辑可包含多个 BV 来源，按剧集 ID 标识）
+        if (!videos.length) return;
+        this.loadedCovers = new Set();
+        const visibleIds = await this.observeVisibleVideos();
+
+        try {
+            const priority = visibleIds.map(encodeURIComponent).join(',');
+            const response = await fetch(`${this.apiBase}/api/folders/${encodeURIComponent(folderPath)}/covers?stream=true&priority=${priority}`);
+            if (!response.ok || !response.body) return;
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                // 已切换到其他文件夹时停止读取
+                if (this.currentFolder !== folderPath) {
+                    reader.cancel();
+                    return;
+                }
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const message = JSON.parse(line);
+                    if (message.type === 'manifest') {
+                        for (const [episodeId, coverUrl] of Object.entries(message.covers)) {
+                            this.updateVideoCover(episodeId, coverUrl);
+                        }
+                    } else if (message.type === 'cover') {
+                        this.updateVideoCover(message.id, message.cover_url);
+                    }
+                }
+            }
+        } catch (error) {
+            console.error('加载封面失败:', error);
+        } finally {
+            if (this.currentFolder === folderPath) {
+                this.stopCoverObserver();
+            }
+        }
+    }
+
+    observeVisibleVideos() {
+        // 监听剧集是否进入可视区域：首次回调返回当前可见的剧集 ID，
+        // 之后滚动进入视口且封面未就绪的剧集会请求后端提前下载
+        this.stopCoverObserver();
+        if (!('IntersectionObserver' in window)) {
+            return Promise.resolve([]);
+        }
+
+        return new Promise(resolve => {
+            let initial = true;
+            let pendingIds = new Set();
+            let timer = null;
+
+            this.coverObserver = new IntersectionObserver(entries => {
+                const ids = entries
+                    .filter(entry => entry.isIntersecting)
+                    .map(entry => entry.target.dataset.episodeId)
+                    .filter(id => !this.loadedCovers.has(id));
+                if (initial) {
+                    initial = false;
+                    resolve(ids);
+                    return;
+                }
+                ids.forEach(id => pendingIds.add(id));
+                if (!pendingIds.size || timer) return;
+                // 合并快速滚动产生的多次回调
+                timer = setTimeout(() => {
+                    const batch = [...pendingIds].filter(id => !this.loadedCovers.has(id));
+                    pendingIds = new Set();
+                    timer = null;
+                    if (!batch.length) return;
+                    fetch(`${this.apiBase}/api/covers/preload`, {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({ episodes: batch, priority: true })
+                    }).catch(error => console.error('提升封面优先级失败:', error));
+                }, 150);
+            });
+
+            const items = document.querySelectorAll('#videos-list .video-item');
+            if (!items.length) {
+                resolve([]);
+                return;
+            }
+            items.forEach(item => this.coverObserver.observe(item));
+        });
+    }
+
+    stopCoverObserver() {
+        if (this.coverObserver) {
+            this.coverObserver.disconnect();
+            this.coverObserver = null;
+        }
+    }
 
-                    const response = await fetch(`${this.apiBase}/api/cover/${video.bvid}/${video.page}`);
-                    if (response.ok) {
-                        const result = await response.json();
-                        if (result.cover_url) {
-                            this.updateVideoCover(video.page, result.cover_url);
+    async loadDetailsAsync(folderPath) {
+        // 以 NDJSON 流式读取详情，每完成一个分P就更新字幕标记
+        try {
+            const response = await fetch(`${this.apiBase}/api/folders/${encodeURIComponent(folderPath)}/details?stream=true`);
+            if (!response.ok || !response.body) return;
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                // 已切换到其他文件夹时停止读取
+                if (this.currentFolder !== folderPath) {
+                    reader.cancel();
+                    return;
+                }
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines) {
+                    if (line.trim()) {
+                        const detail = JSON.parse(line);
+                        if (detail.has_subtitle) {
+                            this.markVideoSubtitle(detail.id);
                         }
                     }
-                } catch (error) {
-                    console.error(`加载封面失败 (${video.title}):`, error);
                 }
             }
+        } catch (error) {
+            console.error('加载视频详情失败:', error);
+        }
+    }
+
+    markVideoSubtitle(episodeId) {
+        const videoElement = document.querySelector(`[data-episode-id="${episodeId}"]`);
+        const info = videoElement && videoElement.querySelector('.video-info');
+        if (info && !info.querySelector('.subtitle-badge')) {
+            const badge = document.createElement('div');
+            badge.className = 'subtitle-badge';
+            badge.textContent = '字幕';
+            info.appendChild(badge);
         }
     }
 
-    updateVideoCover(page, coverUrl) {
+    updateVideoCover(episodeId, coverUrl) {
         // 找到对应的视频元素并更新封面
-        const videoElement = document.querySelector(`[data-video-page="${page}"]`);
+        if (this.loadedCovers) {
+            this.loadedCovers.add(episodeId);
+        }
+        const videoElement = document.querySelector(`[data-episode-id="${episodeId}"]`);
         if (videoElement) {
             const thumbnail = videoElement.querySelector('.video-thumbnail');
             if (thumbnail) {
                 // 移除加载状态
                 thumbnail.classList.remove('loading');
+                // 按格子实际显示宽度请求缩略图，服务端据 Accept 返回 AVIF/WebP
+                const width = Math.ceil((thumbnail.clientWidth || 320) * (window.devicePixelRatio || 1));
                 thumbnail.innerHTML = `
-                    <img src="${this.apiBase}${coverUrl}" alt="视频封面"
+                    <img src="${this.apiBase}${coverUrl}?w=${width}" alt="视频封面" decoding="async"
                          onerror="this.style.display='none'; this.nextElementSibling.style.display='flex';">
                     <div class="placeholder-icon" style="display: none;">🎬</div>
                 `;
@@ -353,9 +511,9 @@ class VideoPlayerApp {
             this.showScreen('player');
             this.showDownloadProgress();
             
-            // 请求播放视频
+            // 请求播放视频（附带本设备的清晰度偏好）
             const response = await fetch(
-                `${this.apiBase}/api/play/${encodeURIComponent(this.currentFolder)}/${video.page}`
+                `${this.apiBase}/api/play/${encodeURIComponent(this.currentFolder)}/${video.id}?${this.qualityParams()}`
             );
             
             if (!response.ok) {
@@ -365,15 +523,39 @@ class VideoPlayerApp {
             const result = await response.json();
             
             if (result.status === 'ready') {
-                this.loadVideoPlayer(result.video_url);
-                // 设置字幕按钮状态，使用API返回的字幕信息
-                this.setupSubtitleButton({
-                    ...video,
-                    has_subtitle: result.has_subtitle,
-                    subtitle_url: result.subtitle_url
+                this.startPlayback(video, result);
+            } else if (result.status === 'pending' && result.job_id) {
+                // 视频在后台下载，跟踪任务进度；支持边下边播时先播放正在下载的流，
+                // 下载完成后无缝切换到完整文件（恢复播放位置，并可自由拖动）
+                let streaming = false;
+                let streamFailed = false;
+                const videoPlayer = document.getElementById('video-player');
+                // 无法播放增长中文件的浏览器：回到等待下载完成后播放完整文件
+                // （<source> 的 error 事件不冒泡，在捕获阶段监听）
+                const onStreamError = () => {
+                    videoPlayer.removeEventListener('error', onStreamError, true);
+                    if (!streaming || this.currentVideo !== video) return;
+                    streaming = false;
+                    streamFailed = true;
+                    this.showDownloadProgress();
+                };
+                this.watchDownloadJob(result.job_id, (job) => {
+                    videoPlayer.removeEventListener('error', onStreamError, true);
+                    const videoUrl = job.video_url || result.video_url;
+                    if (streaming) {
+                        this.switchVideoSource(videoUrl);
+                    } else {
+                        this.startPlayback(video, { ...result, video_url: videoUrl });
+                    }
+                }, (job) => {
+                    if (!streaming && !streamFailed && job.stream_url) {
+                        streaming = true;
+                        this.startPlayback(video, { ...result, video_url: job.stream_url });
+                        videoPlayer.addEventListener('error', onStreamError, true);
+                    }
                 });
             } else {
-                // 如果视频还在下载，可以实现轮询检查状态
+                this.hideDownloadProgress();
                 this.showError('视频正在准备中，请稍后重试');
             }
             
@@ -384,7 +566,104 @@ class VideoPlayerApp {
         }
     }
 
+    qualityParams() {
+        // 按屏幕物理像素选择不低于它的最小档位，避免下载设备用不上的清晰度
+        const dpr = window.devicePixelRatio || 1;
+        const shortSide = Math.min(window.screen.width, window.screen.height) * dpr;
+        const tiers = [360, 480, 720, 1080];
+        const maxHeight = tiers.find(height => height >= shortSide) || tiers[tiers.length - 1];
+
+        // 可解码的编码，体积小的优先（AV1 > HEVC > AVC）
+        // canPlayType 只认 'probably'：Firefox 对 AV1 返回 'maybe'，但 MediaSource.isTypeSupported 会给出 true，不会漏掉
+        const probe = document.createElement('video');
+        const supports = (type) => (window.MediaSource && MediaSource.isTypeSupported(type))
+            || probe.canPlayType(type) === 'probably';
+        const codecs = [
+            ['av1', 'video/mp4; codecs="av01.0.08M.08"'],
+            ['hevc', 'video/mp4; codecs="hvc1.1.6.L120.90"'],
+        ].filter(([, type]) => supports(type)).map(([name]) => name);
+        codecs.push('avc');
+
+        return new URLSearchParams({ max_height: maxHeight, codecs: codecs.join(',') }).toString();
+    }
+
+    startPlayback(video, result) {
+        this.loadVideoPlayer(result.video_url, result.hls_url);
+        // 设置字幕按钮状态，使用API返回的字幕信息
+        this.setupSubtitleButton({
+            ...video,
+            has_subtitle: result.has_subtitle,
+            subtitle_url: result.subtitle_url
+        });
+    }
+
+    watchDownloadJob(jobId, onCompleted, onUpdate = null) {
+        this.stopWatchingJob();
+
+        const handleUpdate = (job) => {
+            this.updateDownloadProgress(job);
+            if (onUpdate) onUpdate(job);
+            if (job.status === 'completed') {
+                this.stopWatchingJob();
+                onCompleted(job);
+            } else if (job.status === 'failed') {
+                this.stopWatchingJob();
+                this.hideDownloadProgress();
+                this.showError('视频下载失败，请稍后重试');
+                console.error('Download job failed:', job.message);
+            }
+        };
+
+        if ('EventSource' in window) {
+            // 优先使用服务端推送
+            const source = new EventSource(`${this.apiBase}/api/jobs/${jobId}/events`);
+            source.onmessage = (event) => handleUpdate(JSON.parse(event.data));
+            source.onerror = () => {
+                // 事件流中断时退回轮询
+                source.close();
+                if (this.jobWatcher && this.jobWatcher.source === source) {
+                    this.pollDownloadJob(jobId, handleUpdate);
+                }
+            };
+            this.jobWatcher = { source };
+        } else {
+            this.pollDownloadJob(jobId, handleUpdate);
+        }
+    }
+
+    pollDownloadJob(jobId, handleUpdate) {
+        const timer = setInterval(async () => {
+            try {
+                const response = await fetch(`${this.apiBase}/api/jobs/${jobId}`);
+                if (response.ok) {
+                    handleUpdate(await response.json());
+                }
+            } catch (error) {
+                console.error('查询下载进度失败:', error);
+            }
+        }, 1000);
+        this.jobWatcher = { timer };
+    }
+
+    stopWatchingJob() {
+        if (!this.jobWatcher) return;
+        if (this.jobWatcher.source) this.jobWatcher.source.close();
+        if (this.jobWatcher.timer) clearInterval(this.jobWatcher.timer);
+        this.jobWatcher = null;
+    }
+
+    destroyHls() {
+        if (this.hls) {
+            this.hls.destroy();
+            this.hls = null;
+        }
+    }
+
     clearVideoPlayer() {
+        // 停止跟踪未完成的下载任务
+        this.stopWatchingJob();
+        this.destroyHls();
+
         // 销毁现有的Plyr实例
         if (this.player) {
             this.player.destroy();
@@ -415,6 +694,7 @@ class VideoPlayerApp {
             try { this.player.currentTime = 0; } catch(_) {}
         }
         // 同时直接操作原生video，确保彻底停止
+        this.destroyHls();
         const videoPlayer = document.getElementById('video-player');
         const videoSource = document.getElementById('video-source');
         const subtitleTrack = document.getElementById('subtitle-track');
@@ -430,15 +710,27 @@ class VideoPlayerApp {
         }
     }
 
-    loadVideoPlayer(videoUrl) {
+    loadVideoPlayer(videoUrl, hlsUrl = '') {
         const videoPlayer = document.getElementById('video-player');
         const videoSource = document.getElementById('video-source');
 
-        // 设置新的视频源
-        videoSource.src = `${this.apiBase}${videoUrl}`;
         // 确保允许自动播放
         videoPlayer.autoplay = true;
-        videoPlayer.load();
+        this.destroyHls();
+        if (hlsUrl && window.Hls && Hls.isSupported()) {
+            // 已打包 HLS：由 hls.js 按网络状况在各档位间切换，逐个拉取小分片
+            this.hls = new Hls();
+            this.hls.loadSource(`${this.apiBase}${hlsUrl}`);
+            this.hls.attachMedia(videoPlayer);
+        } else if (hlsUrl && videoPlayer.canPlayType('application/vnd.apple.mpegurl')) {
+            // Safari / iPadOS 原生支持 HLS
+            videoSource.src = `${this.apiBase}${hlsUrl}`;
+            videoPlayer.load();
+        } else {
+            // 设置新的视频源
+            videoSource.src = `${this.apiBase}${videoUrl}`;
+            videoPlayer.load();
+        }
 
         // 如果浏览器允许，尽早开始播放（与用户点击更贴近）
         try {
@@ -456,21 +748,43 @@ class VideoPlayerApp {
         this.hideDownloadProgress();
     }
 
+    switchVideoSource(videoUrl) {
+        // 从边下边播的流切换到完整文件，保持播放位置与播放状态
+        const videoPlayer = document.getElementById('video-player');
+        const videoSource = document.getElementById('video-source');
+        const resumeAt = videoPlayer.currentTime;
+        const wasPlaying = !videoPlayer.paused;
+
+        videoSource.src = `${this.apiBase}${videoUrl}`;
+        videoPlayer.addEventListener('loadedmetadata', () => {
+            videoPlayer.currentTime = resumeAt;
+            if (wasPlaying) {
+                const playPromise = videoPlayer.play();
+                if (playPromise && typeof playPromise.catch === 'function') {
+                    playPromise.catch(() => {});
+                }
+            }
+        }, { once: true });
+        videoPlayer.load();
+    }
+
     showDownloadProgress() {
         document.getElementById('download-progress').classList.remove('hidden');
-        
-        // 模拟下载进度
-        let progress = 0;
-        const interval = setInterval(() => {
-            progress += Math.random() * 10;
-            if (progress >= 100) {
-                progress = 100;
-                clearInterval(interval);
-            }
-            
-            document.getElementById('progress-fill').style.width = `${progress}%`;
-            document.getElementById('progress-text').textContent = `${Math.round(progress)}%`;
-        }, 200);
+        this.updateDownloadProgress({ status: 'pending', progress: 0 });
+    }
+
+    updateDownloadProgress(job) {
+        const labels = {
+            pending: '⏳ 正在排队...',
+            downloading: '📥 正在下载视频...',
+            merging: '🔧 正在处理视频...',
+            completed: '✅ 准备完成'
+        };
+        const progress = job.status === 'completed' ? 100
+            : job.status === 'merging' ? (job.merge_progress || 0) : (job.progress || 0);
+        document.getElementById('progress-label').textContent = labels[job.status] || labels.downloading;
+        document.getElementById('progress-fill').style.width = `${progress}%`;
+        document.getElementById('progress-text').textContent = `${Math.round(progress)}%`;
     }
 
     hideDownloadProgress() {
@@ -1,10 +1,9 @@
 // Service Worker for PWA functionality
-const CACHE_NAME = 'kids-video-player-v1';
+// 版本号变化时 activate 会删除旧缓存（v4：清除此前被误缓存的边下边播流与 HLS 播放列表、分片）
+const CACHE_NAME = 'kids-video-player-v4';
+// app.js / styles.css 以带内容哈希的 URL 引用，首次访问时再缓存
 const urlsToCache = [
   '/',
-  '/index.html',
-  '/styles.css',
-  '/app.js',
   '/manifest.json'
 ];
 
@@ -21,6 +20,30 @@ self.addEventListener('install', (event) => {
 
 // 拦截网络请求
 self.addEventListener('fetch', (event) => {
+  const url = new URL(event.request.url);
+
+  // 接口数据与视频不走 Service Worker 缓存（视频使用 Range 请求，由浏览器 HTTP 缓存处理）；
+  // 边下边播的流仍在增长，缓存后会一直重放截断的文件；
+  // HLS 播放列表需按服务器的缓存头重新验证（重新打包后才能生效），分片交给浏览器 HTTP 缓存，不占设备存储
+  const bypassPrefixes = ['/api/', '/static/', '/progressive/', '/hls/'];
+  if (event.request.method !== 'GET' || bypassPrefixes.some((prefix) => url.pathname.startsWith(prefix))) {
+    return;
+  }
+
+  // 页面导航优先走网络，确保拿到引用最新资源哈希的 index.html；离线时回退缓存
+  if (event.request.mode === 'navigate') {
+    event.respondWith(
+      fetch(event.request)
+        .then((response) => {
+          const responseToCache = response.clone();
+          caches.open(CACHE_NAME).then((cache) => cache.put('/', responseToCache));
+          return response;
+        })
+        .catch(() => caches.match('/'))
+    );
+    return;
+  }
+
   event.respondWith(
     caches.match(event.request)
       .then((response) => {